@@ -6,6 +6,7 @@ from typing import List, Optional, Tuple
 import click
 
 from . import errors
+from .conversion.common import parse_page_ranges
 from .document import Document
 
 
@@ -43,6 +44,19 @@ def _validate_output_filename(
     return filename
 
 
+def validate_page_ranges(
+    ctx: click.Context, param: str, value: Optional[str]
+) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        parse_page_ranges(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    # Pass the page ranges to the conversion process without any whitespace.
+    return "".join(value.split())
+
+
 # XXX: Click versions 7.x and below inspect the number of arguments that the
 # callback handler supports. Unfortunately, common Python decorators (such as
 # `handle_document_errors()`) mask this number, so we need to reinstate it
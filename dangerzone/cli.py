@@ -1,3 +1,4 @@
+import json
 import logging
 import platform
 import sys
@@ -7,6 +8,7 @@ import click
 from colorama import Back, Fore, Style
 
 from . import args, errors, shutdown, startup
+from .conversion.errors import OCRTierException
 from .document import ARCHIVE_SUBDIR, SAFE_EXTENSION
 from .isolation_provider.container import Container
 from .isolation_provider.dummy import Dummy
@@ -15,7 +17,7 @@ from .logic import DangerzoneCore
 from .podman.machine import PodmanMachineManager
 from .settings import Settings
 from .updater import install
-from .util import get_version, replace_control_chars
+from .util import OCR_TIERS, get_version, replace_control_chars
 
 
 def print_header(s: str) -> None:
@@ -73,6 +75,49 @@ def print_header(s: str) -> None:
         " Windows/macOS platforms."
     ),
 )
+@click.option(
+    "--page-workers",
+    type=click.IntRange(min=1),
+    help=(
+        "The number of threads that compress the pages that are not OCRed. Defaults"
+        " to the 'page_workers' setting (1)."
+    ),
+)
+@click.option(
+    "--ocr-slots",
+    type=click.IntRange(min=1),
+    help=(
+        "The number of pages to OCR at the same time, each in its own process."
+        " Defaults to the 'ocr_slots' setting (1)."
+    ),
+)
+@click.option(
+    "--ocr-tier",
+    type=click.Choice(OCR_TIERS),
+    help=(
+        "The language models to OCR with. The 'fast' ones trade a bit of accuracy for"
+        " speed, and the 'best' ones do the opposite. They must be installed"
+        " separately, unless they are the ones that Dangerzone bundles. Defaults to"
+        " the 'ocr_tier' setting (default)."
+    ),
+)
+@click.option(
+    "--pages",
+    callback=args.validate_page_ranges,
+    help=(
+        "Convert only these pages of the document(s), e.g., '1-5,8,10-'. Pages start"
+        " from 1, and a range without an end extends to the last page."
+    ),
+)
+@click.option(
+    "--estimate",
+    "estimate",
+    flag_value=True,
+    help=(
+        "Do not convert the document(s). Instead, print as JSON how each document"
+        " would be converted, along with the number and size (in points) of its pages."
+    ),
+)
 @click.version_option(version=get_version(), message="%(version)s")
 @errors.handle_document_errors
 def cli_main(
@@ -84,9 +129,16 @@ def cli_main(
     debug: bool,
     set_container_runtime: Optional[str] = None,
     linger: bool = False,
+    page_workers: Optional[int] = None,
+    ocr_slots: Optional[int] = None,
+    ocr_tier: Optional[str] = None,
+    pages: Optional[str] = None,
+    estimate: bool = False,
 ) -> None:
     setup_logging()
-    display_banner()
+    # Keep the standard output clean, if we print the estimates as JSON.
+    if not estimate:
+        display_banner()
     settings = Settings(debug=debug)
     if set_container_runtime:
         if set_container_runtime == "default":
@@ -104,11 +156,22 @@ def cli_main(
         raise click.UsageError("Missing argument 'FILENAMES...'")
 
     if getattr(sys, "dangerzone_dev", False) and dummy_conversion:
-        dangerzone = DangerzoneCore(Dummy())
+        dangerzone = DangerzoneCore(
+            Dummy(page_workers=page_workers, ocr_tier=ocr_tier, ocr_slots=ocr_slots)
+        )
     elif is_qubes_native_conversion():
-        dangerzone = DangerzoneCore(Qubes())
+        dangerzone = DangerzoneCore(
+            Qubes(page_workers=page_workers, ocr_tier=ocr_tier, ocr_slots=ocr_slots)
+        )
     else:
-        dangerzone = DangerzoneCore(Container(debug=debug))
+        dangerzone = DangerzoneCore(
+            Container(
+                debug=debug,
+                page_workers=page_workers,
+                ocr_tier=ocr_tier,
+                ocr_slots=ocr_slots,
+            )
+        )
 
     if len(filenames) == 1 and output_filename:
         dangerzone.add_document_from_filename(filenames[0], output_filename, archive)
@@ -132,6 +195,18 @@ def cli_main(
                 click.echo(f"{dangerzone.ocr_languages[lang]}: {lang}")
             sys.exit(1)
 
+        # Validate that the OCR tier has the language data for this language, before
+        # we start any conversion.
+        try:
+            dangerzone.isolation_provider.check_ocr_tier(ocr_lang)
+        except OCRTierException as e:
+            tier = dangerzone.isolation_provider.get_ocr_tier()
+            tier_languages = dangerzone.get_ocr_tier_languages(tier)
+            click.echo(f"{e}. Valid language codes for this tier:")
+            for lang in tier_languages:
+                click.echo(f"{tier_languages[lang]}: {lang}")
+            sys.exit(1)
+
     tasks = []
     if dangerzone.isolation_provider.requires_install():
         tasks = [
@@ -142,10 +217,14 @@ def cli_main(
             startup.ContainerInstallTask(),
         ]
 
+    estimates = []
     try:
         startup.StartupLogic(tasks=tasks).run()
-        print_header("Converting document(s) to safe PDF")
-        dangerzone.convert_documents(ocr_lang)
+        if estimate:
+            estimates = dangerzone.estimate_documents()
+        else:
+            print_header("Converting document(s) to safe PDF")
+            dangerzone.convert_documents(ocr_lang, pages=pages)
     finally:
         if dangerzone.isolation_provider.requires_install() and not linger:
             task_container_stop = shutdown.ContainerStopTask()
@@ -153,6 +232,10 @@ def cli_main(
             tasks = [task_container_stop, task_machine_stop]
             shutdown.ShutdownLogic(tasks=tasks).run()
 
+    if estimate:
+        click.echo(json.dumps(estimates, indent=2))
+        sys.exit(1 if any("error" in e for e in estimates) else 0)
+
     documents_safe = dangerzone.get_safe_documents()
     documents_failed = dangerzone.get_failed_documents()
 
@@ -6,15 +6,30 @@ import platform
 import shutil
 import subprocess
 import sys
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path, PurePosixPath
-from typing import IO, Callable, Iterable, List, Optional, Tuple, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from dangerzone.podman.errors.exceptions import PodmanNotInstalled
 
 from . import errors
 from .capture_output import original_subprocess_popen as Popen
+from .podman import api
 from .podman.command import PodmanCommand
-from .podman.errors import CommandError
+from .podman.errors import APIError, CommandError
 from .settings import Settings
 from .util import (
     get_cache_dir,
@@ -31,9 +46,24 @@ SECCOMP_PATH = get_cache_dir() / "shared" / "seccomp.gvisor.json"
 PODMAN_MACHINE_PREFIX = "dz-internal-"
 PODMAN_MACHINE_NAME = f"{PODMAN_MACHINE_PREFIX}{get_version()}"
 TIMEOUT_KILL = 5  # Timeout in seconds until the kill command returns.
+# Time in seconds that a container has to be removed, after its conversion has ended.
+TIMEOUT_REMOVE = 5
+# Time in seconds that the Podman REST API service has to start.
+TIMEOUT_SERVICE = 10
 
 log = logging.getLogger(__name__)
 
+_launch_profile: Optional["LaunchProfile"] = None
+_launch_profile_lock = threading.Lock()
+_container_monitor: Optional["ContainerMonitor"] = None
+_container_monitor_failed = False
+_container_monitor_lock = threading.Lock()
+_podman_api: Optional[api.APIClient] = None
+_podman_api_failed = False
+_podman_api_lock = threading.Lock()
+
+T = TypeVar("T")
+
 
 # subprocess.run with the correct startupinfo for Windows.
 # We use a partial here to better profit from type checking
@@ -51,16 +81,19 @@ def get_runtime_version() -> Tuple[int, int]:
     just knowing the major and minor version, since writing/installing a full-blown
     semver parser is an overkill.
     """
-    # Get the Docker/Podman version, using a Go template.
-    podman = init_podman_command()
-    query = "{{.Client.Version}}"
-
-    try:
-        version = podman.run(["version", "-f", query])
-        assert isinstance(version, str)
-    except Exception as e:
-        msg = f"Could not get the version of Podman: {e}"
-        raise RuntimeError(msg) from e
+    version = run_podman_api(lambda api: api.version())
+    if version is None:
+        # Get the Docker/Podman version, using a Go template.
+        podman = init_podman_command()
+        query = "{{.Client.Version}}"
+
+        try:
+            res = podman.run(["version", "-f", query])
+            assert isinstance(res, str)
+            version = res
+        except Exception as e:
+            msg = f"Could not get the version of Podman: {e}"
+            raise RuntimeError(msg) from e
 
     # Parse this version and return the major/minor parts, since we don't need the
     # rest.
@@ -84,7 +117,9 @@ def get_podman_path() -> Optional[Path]:
     return get_resource_path("vendor") / "podman" / podman_bin
 
 
-def make_seccomp_json_accessible() -> Union[Path, PurePosixPath]:
+def make_seccomp_json_accessible(
+    runtime_version: Optional[Tuple[int, int]] = None,
+) -> Union[Path, PurePosixPath]:
     """Ensure that the bundled seccomp profile is accessible by the runtime.
 
     On Linux platforms, this method is basically a no-op since there's no VM
@@ -105,7 +140,9 @@ def make_seccomp_json_accessible() -> Union[Path, PurePosixPath]:
     [2] Read about the 'volumes=' config in
         https://github.com/containers/common/blob/main/docs/containers.conf.5.md#machine-table
     """
-    if get_runtime_version() < (4, 0):
+    if runtime_version is None:
+        runtime_version = get_runtime_version()
+    if runtime_version < (4, 0):
         # On OSes that use:
         #
         # * crun < 0.19
@@ -238,6 +275,85 @@ def init_podman_command() -> PodmanCommand:
             )
 
 
+def get_podman_api_uri() -> str:
+    return f"unix://{get_cache_dir() / f'podman-{os.getpid()}.sock'}"
+
+
+def get_podman_api() -> Optional[api.APIClient]:
+    """Get a client for the Podman REST API service of this session, if enabled.
+
+    Every Podman CLI call spawns a process, which initializes the Podman storage from
+    scratch. If the user has enabled the `podman_api` setting, we instead start a
+    Podman REST API service once per session, and send our queries to it, over
+    persistent connections. The service is available only on Linux.
+
+    If the service cannot start, we log it and use the Podman CLI for the rest of the
+    session.
+    """
+    global _podman_api, _podman_api_failed
+    if not Settings().get("podman_api") or platform.system() != "Linux":
+        return None
+
+    with _podman_api_lock:
+        if _podman_api is not None or _podman_api_failed:
+            return _podman_api
+
+        podman = init_podman_command()
+        uri = get_podman_api_uri()
+        try:
+            get_cache_dir().mkdir(parents=True, exist_ok=True)
+            podman.start_service(
+                uri=uri,
+                time=0,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            podman.wait_for_service(uri, timeout=TIMEOUT_SERVICE)
+        except Exception as e:
+            log.warning(
+                f"Could not start the Podman REST API service, using the Podman CLI"
+                f" instead: {e}"
+            )
+            _podman_api_failed = True
+            if podman.proc_service is not None:
+                podman.stop_service(timeout=TIMEOUT_KILL)
+            return None
+
+        log.debug(f"Started the Podman REST API service at {uri}")
+        _podman_api = api.APIClient(uri)
+        return _podman_api
+
+
+def run_podman_api(op: Callable[[api.APIClient], T]) -> Optional[T]:
+    """Run an operation via the Podman REST API, if available.
+
+    Return None if the REST API is not available, or if the operation fails, so that
+    the caller falls back to the Podman CLI. The operation itself must not return
+    None.
+    """
+    client = get_podman_api()
+    if client is None:
+        return None
+    try:
+        return op(client)
+    except Exception as e:
+        log.warning(f"Podman REST API call failed, falling back to the Podman CLI: {e}")
+        return None
+
+
+def close_podman_api() -> None:
+    """Stop the Podman REST API service of this session, if any."""
+    global _podman_api, _podman_api_failed
+    with _podman_api_lock:
+        if _podman_api is not None:
+            _podman_api.close()
+            _podman_api = None
+            podman = init_podman_command()
+            if podman.proc_service is not None:
+                podman.stop_service(timeout=TIMEOUT_KILL)
+        _podman_api_failed = False
+
+
 def list_image_digests() -> List[str]:
     """Get the digests of all loaded Dangerzone images."""
     podman = init_podman_command()
@@ -258,24 +374,225 @@ def list_image_digests() -> List[str]:
 
 def list_containers() -> List[str]:
     """Get all the Dangerzone containers."""
-    podman = init_podman_command()
-    containers = (
-        podman.run(
+    containers = run_podman_api(
+        lambda api: [name for c in api.list_containers() for name in c["Names"]]
+    )
+    if containers is None:
+        podman = init_podman_command()
+        containers = (
+            podman.run(
+                [
+                    "ps",
+                    "-a",
+                    "--format",
+                    "{{ .Names }}",
+                ],
+            )
+            .strip()  # type: ignore [union-attr]
+            .split()
+        )
+    return [cont for cont in containers if cont.startswith(CONTAINER_PREFIX)]
+
+
+def get_removed_container(event: Dict[str, Any]) -> Optional[str]:
+    """Get the name of the container that an event is about, if it was removed.
+
+    Podman reports the removal of a container as a "remove" status, whereas Docker
+    reports it as a "destroy" action, with the name in the attributes of the actor.
+    """
+    if event.get("Status") == "remove":
+        return event.get("Name")
+    if event.get("Action", event.get("status")) == "destroy":
+        return event.get("Actor", {}).get("Attributes", {}).get("name")
+    return None
+
+
+class ContainerMonitor:
+    """Track the removal of the Dangerzone containers, via `podman events`.
+
+    Checking if a container is still around with `podman ps -a` lists every
+    container, and takes the lock of the Podman database, for every conversion.
+    Instead, we subscribe once per session to the container events, and keep track of
+    the Dangerzone containers that have been removed.
+
+    After a conversion, we expect its container to be removed shortly. The containers
+    that have not been removed within a grace period are stragglers, and we report
+    them in one go.
+
+    Both Podman and Docker have an `events` command, but their events differ, so we
+    parse either kind.
+    """
+
+    def __init__(self) -> None:
+        # The containers that have been removed before we expected them, and when.
+        self.removed: Dict[str, float] = {}
+        # The containers that should be removed, and since when.
+        self.expected: Dict[str, float] = {}
+        self.cond = threading.Condition()
+
+        podman = init_podman_command()
+        # Replay the events since the monitor was created, in case Podman takes a
+        # while to subscribe us.
+        proc = podman.run(
             [
-                "ps",
-                "-a",
+                "events",
+                "--since",
+                str(int(time.time())),
+                "--filter",
+                "type=container",
                 "--format",
-                "{{ .Names }}",
+                "json",
             ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            wait=False,
         )
-        .strip()  # type: ignore [union-attr]
-        .split()
-    )
-    return [cont for cont in containers if cont.startswith(CONTAINER_PREFIX)]
+        assert isinstance(proc, subprocess.Popen)
+        self.proc = proc
+        self.reader = threading.Thread(target=self._read_events, daemon=True)
+        self.reader.start()
+
+    def _read_events(self) -> None:
+        assert self.proc.stdout is not None
+        for line in self.proc.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                log.debug(f"Ignoring unexpected container event: {line!r}")
+                continue
+            name = get_removed_container(event)
+            if name is None or not name.startswith(CONTAINER_PREFIX):
+                continue
+            with self.cond:
+                if self.expected.pop(name, None) is None:
+                    self._forget_removed()
+                    self.removed[name] = time.monotonic()
+                self.cond.notify_all()
+        # Wake up anyone waiting for removals, since no more events will come.
+        with self.cond:
+            self.cond.notify_all()
+
+    def _forget_removed(self, grace: float = TIMEOUT_REMOVE) -> None:
+        """Forget the removals that we have not expected within the grace period.
+
+        We may learn about a removal a bit before we expect it, but the rest are
+        containers that we will never expect (e.g., of other Dangerzone instances).
+        """
+        now = time.monotonic()
+        self.removed = {
+            name: since for name, since in self.removed.items() if now - since < grace
+        }
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def expect_removed(self, name: str) -> None:
+        """Mark a container as one that should be removed soon."""
+        with self.cond:
+            if self.removed.pop(name, None) is None:
+                self.expected[name] = time.monotonic()
+
+    def get_stragglers(self, grace: float = TIMEOUT_REMOVE) -> List[str]:
+        """Get the containers that have not been removed within the grace period.
+
+        Each straggler is returned only once.
+        """
+        now = time.monotonic()
+        with self.cond:
+            self._forget_removed()
+            stragglers = [
+                name for name, since in self.expected.items() if now - since >= grace
+            ]
+            for name in stragglers:
+                del self.expected[name]
+        return sorted(stragglers)
+
+    def wait_removed(self, timeout: float = TIMEOUT_REMOVE) -> None:
+        """Wait until every container that we expect has been removed.
+
+        Stop waiting once the timeout expires, or if no more events can come.
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: not self.expected or not self.is_alive(), timeout
+            )
+
+    def report_stragglers(self, grace: float = TIMEOUT_REMOVE) -> List[str]:
+        stragglers = self.get_stragglers(grace)
+        if not self.is_alive() and stragglers:
+            # We may have missed their removal, so check which ones are still around.
+            try:
+                containers = set(list_containers())
+            except Exception as e:
+                log.warning(f"Could not list containers: {e}")
+            else:
+                stragglers = [name for name in stragglers if name in containers]
+        if stragglers:
+            names = ", ".join(f"'{name}'" for name in stragglers)
+            log.warning(f"Containers {names} did not stop gracefully")
+        return stragglers
+
+    def close(self) -> None:
+        self.proc.terminate()
+
+
+def get_container_monitor() -> Optional[ContainerMonitor]:
+    """Get the container monitor of this session, if we can subscribe to events.
+
+    If we can't subscribe, or the `podman events` process has exited (e.g., because
+    Podman does not log events, or the Podman machine was stopped), return None for
+    the rest of the session, so that the callers check each container themselves.
+    We keep the monitor around though, so that we report the containers that it was
+    still waiting for, once the session ends.
+    """
+    global _container_monitor, _container_monitor_failed
+    with _container_monitor_lock:
+        if _container_monitor_failed:
+            return None
+        if _container_monitor is None:
+            try:
+                _container_monitor = ContainerMonitor()
+            except Exception as e:
+                log.warning(f"Could not subscribe to container events: {e}")
+                _container_monitor_failed = True
+                return None
+        if not _container_monitor.is_alive():
+            log.debug("Container events are no longer available, listing containers")
+            _container_monitor_failed = True
+            return None
+        return _container_monitor
+
+
+def close_container_monitor() -> None:
+    """Stop monitoring, and report the containers that have not been removed.
+
+    We give the containers of the last conversions some time to be removed first.
+    """
+    global _container_monitor, _container_monitor_failed
+    with _container_monitor_lock:
+        monitor = _container_monitor
+        _container_monitor = None
+        _container_monitor_failed = False
+    if monitor is not None:
+        monitor.wait_removed()
+        monitor.report_stragglers(grace=0)
+        monitor.close()
 
 
 def kill_container(name: str) -> None:
     """Terminate a spawned container."""
+
+    def api_kill(client: api.APIClient) -> bool:
+        try:
+            client.kill_container(name, timeout=TIMEOUT_KILL)
+        except APIError as e:
+            # The container may have stopped right before we tried to kill it.
+            log.debug(f"Could not kill container '{name}': {e}")
+        return True
+
+    if run_podman_api(api_kill):
+        return
+
     podman = init_podman_command()
     try:
         # We do not check the exit code of the process here, since the container may
@@ -386,6 +703,51 @@ def expected_image_name() -> str:
     return image_name_path.read_text().strip("\n")
 
 
+@dataclass(frozen=True)
+class LaunchProfile:
+    """The parts of a container launch that stay the same across conversions."""
+
+    runtime_version: Tuple[int, int]
+    seccomp_path: Union[Path, PurePosixPath]
+    image_name: str
+    image_digest: str
+
+    @property
+    def image_reference(self) -> str:
+        """Reference to the exact image that we have verified, by its digest."""
+        return f"{self.image_name}@sha256:{self.image_digest}"
+
+
+def get_launch_profile() -> LaunchProfile:
+    """Get the launch profile of this session.
+
+    Finding the runtime version and the digest of the local image requires a Podman
+    call each, so we do it once per session, on the first conversion. Call
+    `clear_launch_profile()` whenever the local image changes.
+    """
+    global _launch_profile
+    with _launch_profile_lock:
+        if _launch_profile is None:
+            runtime_version = get_runtime_version()
+            image_name = expected_image_name()
+            _launch_profile = LaunchProfile(
+                runtime_version=runtime_version,
+                seccomp_path=make_seccomp_json_accessible(runtime_version),
+                image_name=image_name,
+                image_digest=get_local_image_digest(image_name),
+            )
+            log.debug(
+                f"Launching containers with image {_launch_profile.image_reference}"
+            )
+        return _launch_profile
+
+
+def clear_launch_profile() -> None:
+    global _launch_profile
+    with _launch_profile_lock:
+        _launch_profile = None
+
+
 def container_pull(image: str, manifest_digest: str) -> None:
     """Pull a container image from a registry."""
     podman = init_podman_command()
@@ -405,12 +767,16 @@ def get_local_image_digest(image: Optional[str] = None) -> str:
     # update scenario.
     # `podman inspect` is avoided here as it returns the digest of the
     # architecture-bound image.
-    podman = init_podman_command()
-    res = podman.run(["images", expected_image, "--format", "{{.Digest}}"])
-    assert isinstance(res, str)
-    # In some cases, the output can be multiple lines with the same digest
-    # sets are used to reduce them.
-    lines = set(res.split("\n"))
+    lines = run_podman_api(
+        lambda api: {image["Digest"] for image in api.list_images(expected_image)}
+    )
+    if lines is None:
+        podman = init_podman_command()
+        res = podman.run(["images", expected_image, "--format", "{{.Digest}}"])
+        assert isinstance(res, str)
+        # In some cases, the output can be multiple lines with the same digest
+        # sets are used to reduce them.
+        lines = set(res.split("\n"))
     if len(lines) < 1:
         raise errors.ImageNotPresentException(
             f"The image {expected_image} does not exist locally"
@@ -1,11 +1,118 @@
 import asyncio
+import io
 import os
 import sys
 from abc import abstractmethod
-from typing import Callable, List, Optional, TextIO, Tuple
+from typing import Callable, List, Optional, Sequence, Set, TextIO, Tuple, Union
 
 DEFAULT_DPI = 150  # Pixels per inch
+DEFAULT_MAX_PAGE_PIXELS = 10_000_000  # Pixel budget for a single page
 INT_BYTES = 2
+LENGTH_BYTES = 4
+CHUNK_SIZE = 1024 * 1024  # Size of the chunks for copying the input document
+PIPE_SIZE = 1024 * 1024  # Size of the pipes that carry the pixels, if we can set it
+# Linux fcntl(2) command for setting the size of a pipe, in case Python does not
+# expose it.
+F_SETPIPE_SZ = 1031
+# Max number of buffers that we pass to a single writev(2) call.
+IOV_MAX = 1024
+# Render pages in parallel worker processes, but not in more than this many.
+MAX_RENDER_WORKERS = 8
+
+# The host may ask the conversion process for a version of the pixels protocol and a
+# set of optional features. The conversion process replies with the magic number, the
+# version it speaks, and the features it supports out of the requested ones. If it does
+# not reply (e.g., because it's an older container image), the host falls back to the
+# original stream: the page count, and the dimensions and RGB pixels of each page.
+PROTOCOL_MAGIC = 0x445A  # "DZ", which is larger than any valid page count
+PROTOCOL_VERSION = 1
+FEATURE_ZLIB = 1 << 0  # The pixels of each page are compressed with zlib
+FEATURE_GRAYSCALE = 1 << 1  # Pages with no chroma are sent as grayscale
+FEATURE_PAGE_DPI = 1 << 2  # The DPI of each page is chosen within a pixel budget
+FEATURE_PAGE_RANGE = 1 << 3  # Only the requested pages are sent
+FEATURE_ESTIMATE = 1 << 4  # Only the conversion route and the page sizes are sent
+SUPPORTED_FEATURES = (
+    FEATURE_ZLIB
+    | FEATURE_GRAYSCALE
+    | FEATURE_PAGE_DPI
+    | FEATURE_PAGE_RANGE
+    | FEATURE_ESTIMATE
+)
+
+# The ways that the conversion process may turn a document into a PDF, as it reports
+# them when estimating the cost of a conversion.
+ROUTE_PYMUPDF = 1
+ROUTE_LIBREOFFICE = 2
+ROUTE_NAMES = {ROUTE_PYMUPDF: "PyMuPDF", ROUTE_LIBREOFFICE: "libreoffice"}
+
+
+def parse_page_ranges(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """Parse a comma-separated list of pages and page ranges, such as "1-5,8,10-".
+
+    Pages start from 1, and a range without an end extends to the last page. Raise a
+    ValueError if the list is not valid.
+    """
+    ranges: List[Tuple[int, Optional[int]]] = []
+    for item in spec.split(","):
+        start, sep, end = item.partition("-")
+        try:
+            first = int(start)
+            if not sep:
+                last: Optional[int] = first
+            elif end.strip():
+                last = int(end)
+            else:
+                last = None
+        except ValueError:
+            raise ValueError(f"Invalid page range: '{item.strip()}'")
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range: '{item.strip()}'")
+        ranges.append((first, last))
+    return ranges
+
+
+def select_pages(spec: Optional[str], page_count: int) -> List[int]:
+    """Get the indices of the pages that a list of page ranges selects, in order.
+
+    If there is no list of page ranges, select all the pages. Pages that are past the
+    end of the document are ignored.
+    """
+    if spec is None:
+        return list(range(page_count))
+    selected: Set[int] = set()
+    for first, last in parse_page_ranges(spec):
+        last = page_count if last is None else min(last, page_count)
+        selected.update(range(first - 1, last))
+    return sorted(selected)
+
+
+def int_to_bytes(num: int, size: int = INT_BYTES) -> bytes:
+    return num.to_bytes(size, "big", signed=False)
+
+
+def enlarge_pipe(fd: int, size: int = PIPE_SIZE) -> bool:
+    """Enlarge the kernel buffer of a pipe, so that each read/write moves more data.
+
+    This is possible only on Linux, and only if the file descriptor is a pipe. Also,
+    unprivileged processes cannot go beyond /proc/sys/fs/pipe-max-size (1 MiB by
+    default). In any other case, the pipe keeps its default size (64 KiB).
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        fcntl.fcntl(fd, getattr(fcntl, "F_SETPIPE_SZ", F_SETPIPE_SZ), size)
+    except OSError:
+        return False
+    return True
+
+
+def get_cpu_count() -> int:
+    """Number of CPUs that this process can run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
 
 def running_on_qubes() -> bool:
@@ -20,24 +127,60 @@ class DangerzoneConverter:
         self.captured_output: bytes = b""
 
     @classmethod
-    def _read_bytes(cls) -> bytes:
-        """Read bytes from the stdin."""
-        data = sys.stdin.buffer.read()
-        if data is None:
-            raise EOFError
-        return data
+    def _read_file(cls, path: str) -> None:
+        """Read bytes from the stdin, and store them to a file in chunks."""
+        with open(path, "wb") as f:
+            while True:
+                data = sys.stdin.buffer.read(CHUNK_SIZE)
+                if data is None:
+                    raise EOFError
+                if not data:
+                    break
+                f.write(data)
 
     @classmethod
-    def _write_bytes(cls, data: bytes, file: TextIO = sys.stdout) -> None:
+    def _write_bytes(
+        cls, data: Union[bytes, memoryview], file: TextIO = sys.stdout
+    ) -> None:
         file.buffer.write(data)
 
+    @classmethod
+    def _write_chunks(
+        cls, chunks: Sequence[Union[bytes, memoryview]], file: TextIO = sys.stdout
+    ) -> None:
+        """Write several chunks of data, with as few system calls as possible.
+
+        We flush any data that are buffered, and then pass the chunks to writev(2), so
+        that we don't have to join them in a new buffer, or write them one by one.
+        """
+        file.buffer.flush()
+        try:
+            fd = file.buffer.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            fd = None
+        if fd is None or not hasattr(os, "writev"):
+            for chunk in chunks:
+                cls._write_bytes(chunk, file=file)
+            return
+
+        views = [memoryview(chunk).cast("B") for chunk in chunks if len(chunk)]
+        while views:
+            written = os.writev(fd, views[:IOV_MAX])
+            # Skip the chunks that have been written, in case of a partial write.
+            while views and written >= views[0].nbytes:
+                written -= views.pop(0).nbytes
+            if written:
+                views[0] = views[0][written:]
+
     @classmethod
     def _write_text(cls, text: str, file: TextIO = sys.stdout) -> None:
         cls._write_bytes(text.encode(), file=file)
 
     @classmethod
-    def _write_int(cls, num: int, file: TextIO = sys.stdout) -> None:
-        cls._write_bytes(num.to_bytes(INT_BYTES, "big", signed=False), file=file)
+    def _write_int(
+        cls, num: int, file: TextIO = sys.stdout, size: int = INT_BYTES
+    ) -> None:
+        cls._write_bytes(int_to_bytes(num, size), file=file)
 
     # ==== ASYNC METHODS ====
     # We run sync methods in async wrappers, because pure async methods are more difficult:
@@ -47,20 +190,30 @@ class DangerzoneConverter:
     # they shouldn't cause a problem.
 
     @classmethod
-    async def read_bytes(cls) -> bytes:
-        return await asyncio.to_thread(cls._read_bytes)
+    async def read_file(cls, path: str) -> None:
+        return await asyncio.to_thread(cls._read_file, path)
 
     @classmethod
-    async def write_bytes(cls, data: bytes, file: TextIO = sys.stdout) -> None:
+    async def write_bytes(
+        cls, data: Union[bytes, memoryview], file: TextIO = sys.stdout
+    ) -> None:
         return await asyncio.to_thread(cls._write_bytes, data, file=file)
 
+    @classmethod
+    async def write_chunks(
+        cls, chunks: Sequence[Union[bytes, memoryview]], file: TextIO = sys.stdout
+    ) -> None:
+        return await asyncio.to_thread(cls._write_chunks, chunks, file=file)
+
     @classmethod
     async def write_text(cls, text: str, file: TextIO = sys.stdout) -> None:
         return await asyncio.to_thread(cls._write_text, text, file=file)
 
     @classmethod
-    async def write_int(cls, num: int, file: TextIO = sys.stdout) -> None:
-        return await asyncio.to_thread(cls._write_int, num, file=file)
+    async def write_int(
+        cls, num: int, file: TextIO = sys.stdout, size: int = INT_BYTES
+    ) -> None:
+        return await asyncio.to_thread(cls._write_int, num, file=file, size=size)
 
     async def read_stream(
         self, sr: asyncio.StreamReader, callback: Optional[Callable] = None
@@ -1,7 +1,15 @@
+import argparse
 import asyncio
+import collections
+import concurrent.futures
+import math
+import multiprocessing
 import os
 import sys
-from typing import Dict, Optional
+import zlib
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Union
 
 # XXX: PyMUPDF logs to stdout by default [1]. The PyMuPDF devs provide a way [2] to log to
 # stderr, but it's based on environment variables. These envvars are consulted at import
@@ -18,26 +26,301 @@ import fitz
 import magic
 
 from . import errors
-from .common import DEFAULT_DPI, DangerzoneConverter, running_on_qubes
+from .common import (
+    DEFAULT_DPI,
+    DEFAULT_MAX_PAGE_PIXELS,
+    FEATURE_ESTIMATE,
+    FEATURE_GRAYSCALE,
+    FEATURE_PAGE_DPI,
+    FEATURE_PAGE_RANGE,
+    FEATURE_ZLIB,
+    INT_BYTES,
+    LENGTH_BYTES,
+    MAX_RENDER_WORKERS,
+    PROTOCOL_MAGIC,
+    PROTOCOL_VERSION,
+    ROUTE_LIBREOFFICE,
+    ROUTE_PYMUPDF,
+    SUPPORTED_FEATURES,
+    DangerzoneConverter,
+    enlarge_pipe,
+    int_to_bytes,
+    running_on_qubes,
+    select_pages,
+)
+
+# Favor speed over compression ratio, since rendered pages compress very well anyway.
+ZLIB_LEVEL = 1
+PDF_DPI = 72  # Points per inch
+# Documents with fewer pages are rendered serially, since starting the worker
+# processes would cost more than the time they save.
+MIN_PARALLEL_PAGES = 8
+
+# The document that a render worker process has opened.
+_worker_doc: Optional[fitz.Document] = None
+
+
+@dataclass
+class RenderedPage:
+    """The pixels of a page, as we will send them to the host."""
+
+    width: int
+    height: int
+    dpi: int
+    channels: int
+    data: bytes
+
+
+def page_pixels(rect: fitz.Rect, dpi: int) -> int:
+    """Get the number of pixels of a page, when it's rendered at the given DPI."""
+    return math.ceil(rect.width * dpi / PDF_DPI) * math.ceil(
+        rect.height * dpi / PDF_DPI
+    )
+
+
+def native_dpi(page: fitz.Page) -> Optional[float]:
+    """Get the resolution of a page that consists of just a single image.
+
+    This is the case for image documents, and for PDFs with scanned pages. Rendering
+    these pages at a higher resolution than the one of their image does not add any
+    detail.
+    """
+    # Check the image resources of PDF pages first, since it's cheaper.
+    if page.parent.is_pdf and len(page.get_images()) != 1:
+        return None
+    infos = page.get_image_info()
+    if len(infos) != 1:
+        return None
+    bbox = fitz.Rect(infos[0]["bbox"])
+    if bbox.is_empty or not bbox.contains(page.rect) or page.get_text().strip():
+        return None
+    image_size = max(infos[0]["width"], infos[0]["height"])
+    return image_size * PDF_DPI / max(bbox.width, bbox.height)
+
+
+def choose_dpi(page: fitz.Page, max_pixels: int) -> int:
+    """Choose the resolution at which we will render a page.
+
+    We render pages at the default DPI, unless:
+    * The page consists of a single image, with a lower resolution. In this case, we
+      render it at the resolution of the image, instead of upscaling it.
+    * The page would not fit in the pixel budget. In this case, we lower the
+      resolution until it does, so that oversized pages have a predictable cost.
+    """
+    dpi = DEFAULT_DPI
+    image_dpi = native_dpi(page)
+    if image_dpi is not None:
+        dpi = min(dpi, math.ceil(image_dpi))
+
+    area = page.rect.width * page.rect.height
+    if area > 0:
+        budget_dpi = math.floor(PDF_DPI * math.sqrt(max_pixels / area))
+        dpi = max(min(dpi, budget_dpi), 1)
+    while dpi > 1 and page_pixels(page.rect, dpi) > max_pixels:
+        dpi -= 1
+    return dpi
+
+
+def to_grayscale(samples: memoryview) -> Optional[bytes]:
+    """Get the grayscale version of RGB pixels, if they have no chroma."""
+    red = samples[0::3]
+    if red == samples[1::3] and red == samples[2::3]:
+        return red.tobytes()
+    return None
+
+
+def render_page(page: fitz.Page, features: int, max_page_pixels: int) -> RenderedPage:
+    """Render a page to pixels, and encode them according to the protocol features."""
+    if features & FEATURE_PAGE_DPI:
+        dpi = choose_dpi(page, max_page_pixels)
+    else:
+        dpi = DEFAULT_DPI
+    pix = page.get_pixmap(dpi=dpi)
+    buf: Union[bytes, memoryview] = pix.samples_mv
+    channels = 3
+    if features & FEATURE_GRAYSCALE:
+        gray_buf = to_grayscale(pix.samples_mv)
+        if gray_buf is not None:
+            buf, channels = gray_buf, 1
+    if features & FEATURE_ZLIB:
+        data = zlib.compress(buf, ZLIB_LEVEL)
+    else:
+        data = bytes(buf)
+    return RenderedPage(pix.width, pix.height, dpi, channels, data)
+
+
+def open_worker_document(path: str, filetype: Optional[str]) -> None:
+    """Open the document in a render worker process, once for all of its pages."""
+    global _worker_doc
+    _worker_doc = fitz.open(path, filetype=filetype)
+
+
+def render_worker_page(
+    page_number: int, features: int, max_page_pixels: int
+) -> RenderedPage:
+    assert _worker_doc is not None
+    return render_page(_worker_doc[page_number], features, max_page_pixels)
 
 
 class DocumentToPixels(DangerzoneConverter):
+    def __init__(
+        self,
+        protocol: Optional[int] = None,
+        features: int = 0,
+        max_page_pixels: int = DEFAULT_MAX_PAGE_PIXELS,
+        pages: Optional[str] = None,
+        render_workers: int = 1,
+    ) -> None:
+        super().__init__()
+        # If the host has not asked for a protocol version, then it does not expect a
+        # handshake, and we must stick to the original stream.
+        if protocol:
+            self.protocol: Optional[int] = min(protocol, PROTOCOL_VERSION)
+            self.features = features & SUPPORTED_FEATURES
+        else:
+            self.protocol = None
+            self.features = 0
+        self.max_page_pixels = max_page_pixels
+        # The pages that the host has requested, if it can handle a subset of them.
+        self.pages = pages if self.features & FEATURE_PAGE_RANGE else None
+        # The sandbox can't tell how many CPUs the host lets it use (e.g., there is
+        # no /sys in it), so the host tells us how many workers to start.
+        self.render_workers = max(1, min(render_workers, MAX_RENDER_WORKERS))
+
+    async def write_handshake(self) -> None:
+        assert self.protocol is not None
+        await self.write_bytes(
+            int_to_bytes(PROTOCOL_MAGIC)
+            + int_to_bytes(self.protocol)
+            + int_to_bytes(self.features)
+        )
+
     async def write_page_count(self, count: int) -> None:
         return await self.write_int(count)
 
-    async def write_page_width(self, width: int) -> None:
-        return await self.write_int(width)
+    async def write_estimate(self, doc: fitz.Document, route: int) -> None:
+        """Write the page count, the conversion route, and the size of each page.
+
+        The page sizes are in points, rounded up, and capped to the largest value that
+        fits in the protocol's integers. This is just an estimate, so a capped size is
+        good enough. A page count that does not fit though would corrupt the stream, so
+        we reject such documents instead.
+        """
+        max_int = (1 << (8 * INT_BYTES)) - 1
+        if doc.page_count > max_int:
+            raise errors.MaxPagesException()
+        estimate = [int_to_bytes(doc.page_count), int_to_bytes(route)]
+        for page in doc.pages():
+            width = min(math.ceil(page.rect.width), max_int)
+            height = min(math.ceil(page.rect.height), max_int)
+            estimate.append(int_to_bytes(width))
+            estimate.append(int_to_bytes(height))
+        await self.write_bytes(b"".join(estimate))
+
+    def page_header(self, page: RenderedPage) -> bytes:
+        """The fields that precede the pixels of a page, for the negotiated features."""
+        header = int_to_bytes(page.width) + int_to_bytes(page.height)
+        if self.features & FEATURE_PAGE_DPI:
+            header += int_to_bytes(page.dpi)
+        if self.features & FEATURE_GRAYSCALE:
+            header += int_to_bytes(page.channels)
+        if self.features & FEATURE_ZLIB:
+            header += int_to_bytes(len(page.data), size=LENGTH_BYTES)
+        return header
+
+    async def write_page(self, page: RenderedPage) -> None:
+        # Write the header and the pixels of the page with a single system call.
+        await self.write_chunks([self.page_header(page), page.data])
+
+    async def convert_page(
+        self, doc: fitz.Document, page_number: int, page_count: int
+    ) -> None:
+        self.update_progress(
+            f"Converting page {page_number + 1}/{page_count} to pixels"
+        )
+        await self.write_page(
+            render_page(doc[page_number], self.features, self.max_page_pixels)
+        )
+
+    async def convert_pages_in_parallel(
+        self,
+        doc: fitz.Document,
+        page_numbers: List[int],
+        pool: concurrent.futures.ProcessPoolExecutor,
+        workers: int,
+    ) -> None:
+        """Render the pages in worker processes, and write them in order.
 
-    async def write_page_height(self, height: int) -> None:
-        return await self.write_int(height)
+        Each worker opens its own copy of the document. We submit a bounded number of
+        pages to the workers, so that we don't keep too many rendered pages in memory.
 
-    async def write_page_data(self, data: bytes) -> None:
-        return await self.write_bytes(data)
+        The pool spawns its workers lazily, so it may break in the middle of the
+        conversion (e.g., if the sandbox does not let us start more processes). In
+        this case, we render the rest of the pages serially.
+        """
+        loop = asyncio.get_running_loop()
+        pending: Deque[asyncio.Future] = collections.deque()
+        submitted = 0
+        written = 0
+        try:
+            for page_number in page_numbers:
+                while submitted < len(page_numbers) and len(pending) < 2 * workers:
+                    future = loop.run_in_executor(
+                        pool,
+                        render_worker_page,
+                        page_numbers[submitted],
+                        self.features,
+                        self.max_page_pixels,
+                    )
+                    pending.append(future)
+                    submitted += 1
+
+                self.update_progress(
+                    f"Converting page {page_number + 1}/{doc.page_count} to pixels"
+                )
+                await self.write_page(await pending.popleft())
+                written += 1
+        except BrokenProcessPool as e:
+            self.update_progress(f"Rendering the rest of the pages serially, since {e}")
+            # Retrieve the errors of the pages that the broken pool has failed, so
+            # that asyncio does not complain about them.
+            for future in pending:
+                if not future.cancel():
+                    future.exception()
+            for page_number in page_numbers[written:]:
+                await self.convert_page(doc, page_number, doc.page_count)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def start_render_pool(
+        self, path: str, filetype: Optional[str], workers: int
+    ) -> Optional[concurrent.futures.ProcessPoolExecutor]:
+        """Start the render worker processes, or return None if we can't.
+
+        The worker processes share semaphores, which need a shared memory mount
+        (/dev/shm) that the sandbox may not have. In this case, we render the pages
+        serially.
+        """
+        try:
+            # Spawn fresh worker processes, instead of forking the current one, which
+            # has started an event loop.
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=open_worker_document,
+                initargs=(path, filetype),
+            )
+        except (OSError, ImportError) as e:
+            self.update_progress(f"Rendering pages serially, since {e}")
+            return None
 
     def update_progress(self, text: str, *, error: bool = False) -> None:
         print(text, file=sys.stderr)
 
     async def convert(self) -> None:
+        if self.protocol:
+            await self.write_handshake()
+
         conversions: Dict[str, Dict[str, Optional[str]]] = {
             # .pdf
             "application/pdf": {"type": "PyMuPDF"},
@@ -171,11 +454,15 @@ class DocumentToPixels(DangerzoneConverter):
         # Convert input document to PDF
         conversion = conversions[mime_type]
         if conversion["type"] == "PyMuPDF":
+            route = ROUTE_PYMUPDF
+            path = "/tmp/input_file"
+            filetype: Optional[str] = mime_type
             try:
-                doc = fitz.open("/tmp/input_file", filetype=mime_type)
+                doc = fitz.open(path, filetype=filetype)
             except (ValueError, fitz.FileDataError):
                 raise errors.DocCorruptedException()
         elif conversion["type"] == "libreoffice":
+            route = ROUTE_LIBREOFFICE
             libreoffice_ext = conversion.get("libreoffice_ext", None)
             # Disable conversion for HWP/HWPX on specific platforms. See:
             #
@@ -207,31 +494,40 @@ class DocumentToPixels(DangerzoneConverter):
             #     https://github.com/freedomofpress/dangerzone/issues/494
             if not os.path.exists(pdf_filename):
                 raise errors.LibreofficeFailure()
+            path, filetype = pdf_filename, None
             try:
-                doc = fitz.open(pdf_filename)
+                doc = fitz.open(path)
             except (ValueError, fitz.FileDataError):
                 raise errors.DocCorruptedException()
         else:
             # NOTE: This should never be reached
             raise errors.DocFormatUnsupported()
 
+        # If the host wants just an estimate of the conversion cost, we are done. Note
+        # that we don't enforce the max number of pages here, since the host should
+        # learn how many pages the document has.
+        if self.features & FEATURE_ESTIMATE:
+            await self.write_estimate(doc, route)
+            self.update_progress("Estimated the conversion cost of the document")
+            return
+
         # Obtain number of pages
-        if doc.page_count > errors.MAX_PAGES:
+        page_numbers = select_pages(self.pages, doc.page_count)
+        if not page_numbers:
+            raise errors.PageRangeException()
+        if len(page_numbers) > errors.MAX_PAGES:
             raise errors.MaxPagesException()
-        await self.write_page_count(doc.page_count)
-
-        for page in doc.pages():
-            # TODO check if page.number is doc-controlled
-            page_num = page.number + 1  # pages start in 1
+        await self.write_page_count(len(page_numbers))
 
-            self.update_progress(
-                f"Converting page {page_num}/{doc.page_count} to pixels"
-            )
-            pix = page.get_pixmap(dpi=DEFAULT_DPI)
-            rgb_buf = pix.samples_mv
-            await self.write_page_width(pix.width)
-            await self.write_page_height(pix.height)
-            await self.write_page_data(rgb_buf)
+        workers = min(self.render_workers, len(page_numbers))
+        pool = None
+        if workers > 1 and len(page_numbers) >= MIN_PARALLEL_PAGES:
+            pool = self.start_render_pool(path, filetype, workers)
+        if pool is not None:
+            await self.convert_pages_in_parallel(doc, page_numbers, pool, workers)
+        else:
+            for page_number in page_numbers:
+                await self.convert_page(doc, page_number, doc.page_count)
 
         self.update_progress("Converted document to pixels")
 
@@ -262,17 +558,59 @@ class DocumentToPixels(DangerzoneConverter):
         return mime_type
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Convert a document from stdin to pixels on stdout"
+    )
+    parser.add_argument(
+        "--protocol",
+        type=int,
+        help="The latest version of the pixels protocol that the host speaks",
+    )
+    parser.add_argument(
+        "--features",
+        type=int,
+        default=0,
+        help="Bitmap of the optional protocol features that the host requests",
+    )
+    parser.add_argument(
+        "--max-page-pixels",
+        type=int,
+        default=DEFAULT_MAX_PAGE_PIXELS,
+        help="Pixel budget for a single page, if the DPI of each page is requested",
+    )
+    parser.add_argument(
+        "--pages",
+        help="The pages to convert (e.g., 1-5,8,10-), if a page range is requested",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=1,
+        help="The number of processes that render pages in parallel",
+    )
+    # Ignore any arguments that newer hosts may pass, so that they can still talk to
+    # us using the protocol version and features that we support.
+    args, _ = parser.parse_known_args()
+    return args
+
+
 async def main() -> None:
+    args = parse_args()
+    enlarge_pipe(sys.stdout.fileno())
     try:
-        data = await DocumentToPixels.read_bytes()
+        await DocumentToPixels.read_file("/tmp/input_file")
     except EOFError:
         sys.exit(1)
 
-    with open("/tmp/input_file", "wb") as f:
-        f.write(data)
-
     try:
-        converter = DocumentToPixels()
+        converter = DocumentToPixels(
+            protocol=args.protocol,
+            features=args.features,
+            max_page_pixels=args.max_page_pixels,
+            pages=args.pages,
+            render_workers=args.render_workers,
+        )
         await converter.convert()
     except errors.ConversionException as e:
         await DocumentToPixels.write_bytes(str(e).encode(), file=sys.stderr)
@@ -76,6 +76,11 @@ class MaxPagesException(PagesException):
     error_message = f"Number of pages exceeds maximum ({MAX_PAGES})"
 
 
+class PageRangeException(PagesException):
+    error_code = ERROR_SHIFT + 43
+    error_message = "None of the requested pages are in the document."
+
+
 class MaxPageWidthException(PagesException):
     error_code = ERROR_SHIFT + 44
     error_message = "A page exceeded the maximum width."
@@ -93,6 +98,26 @@ class PageCountMismatch(PagesException):
     )
 
 
+class PageDataException(PagesException):
+    error_code = ERROR_SHIFT + 47
+    error_message = "A page contained invalid pixel data."
+
+
+class PageDpiException(PagesException):
+    error_code = ERROR_SHIFT + 48
+    error_message = "A page had an invalid resolution."
+
+
+class ProtocolException(ConversionException):
+    error_code = ERROR_SHIFT + 50
+    error_message = "The conversion process replied with an unsupported protocol."
+
+
+class OCRTierException(ConversionException):
+    error_code = ERROR_SHIFT + 60
+    error_message = "The OCR tier does not have the language data for the OCR language"
+
+
 class UnexpectedConversionError(ConversionException):
     error_code = ERROR_SHIFT + 100
     error_message = "Some unexpected error occurred while converting the document"
@@ -1,22 +1,78 @@
+import collections
+import concurrent.futures
 import contextlib
+import errno
 import logging
 import os
 import platform
+import queue
+import shutil
 import signal
 import subprocess
 import sys
 import threading
+import zlib
 from abc import ABC, abstractmethod
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from io import BytesIO
-from typing import IO, Callable, Iterator, Optional
+from typing import (
+    IO,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import fitz
 from colorama import Fore, Style
 
 from ..conversion import errors
-from ..conversion.common import DEFAULT_DPI, INT_BYTES
+from ..conversion.common import (
+    CHUNK_SIZE,
+    DEFAULT_DPI,
+    FEATURE_ESTIMATE,
+    FEATURE_GRAYSCALE,
+    FEATURE_PAGE_DPI,
+    FEATURE_PAGE_RANGE,
+    FEATURE_ZLIB,
+    INT_BYTES,
+    LENGTH_BYTES,
+    MAX_RENDER_WORKERS,
+    PROTOCOL_MAGIC,
+    PROTOCOL_VERSION,
+    ROUTE_NAMES,
+    enlarge_pipe,
+    get_cpu_count,
+    select_pages,
+)
 from ..document import Document
-from ..util import get_tessdata_dir, replace_control_chars
+from ..settings import Settings
+from ..util import (
+    OCR_ENGINE_DEFAULT,
+    OCR_TIER_DEFAULT,
+    get_ocr_engine_mode,
+    get_tessdata_dir,
+    replace_control_chars,
+)
+from .ocr_cache import OCRCache, get_ocr_cache_dir
+from .ocr_scheduler import get_ocr_scheduler, shutdown_ocr_scheduler
+from .pixels_to_pdf import (
+    OCR_IMAGE_FULL,
+    PAGE_TEXT,
+    SafePDFWriter,
+    UntrustedPage,
+    classify_page,
+    compress_pixels,
+    get_page_pool,
+    page_digest,
+    pixels_to_pdf_batch,
+)
 
 log = logging.getLogger(__name__)
 
@@ -24,6 +80,10 @@ TIMEOUT_EXCEPTION = 15
 TIMEOUT_GRACE = 15
 TIMEOUT_FORCE = 5
 
+# Number of pages that we read from the conversion process, ahead of the page that
+# is currently converted to PDF.
+PAGE_QUEUE_SIZE = 4
+
 
 def _signal_process_group(p: subprocess.Popen, signo: int) -> None:
     """Send a signal to a process group."""
@@ -57,6 +117,32 @@ def kill_process_group(p: subprocess.Popen) -> None:
         _signal_process_group(p, signal.SIGKILL)
 
 
+def write_file(f: IO[bytes], pipe: IO[bytes]) -> None:
+    """Write the contents of a file to a pipe, without reading it whole in memory.
+
+    On Linux, we use sendfile(2), so that the kernel copies the file to the pipe
+    directly. On other platforms, or if sendfile(2) is not supported for this file, we
+    copy the file in chunks.
+    """
+    offset = 0
+    if platform.system() == "Linux":
+        # Send any data that are already buffered in the pipe first.
+        pipe.flush()
+        try:
+            while True:
+                sent = os.sendfile(pipe.fileno(), f.fileno(), offset, CHUNK_SIZE)
+                if sent == 0:
+                    return
+                offset += sent
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+            log.debug(f"Could not use sendfile(2), falling back to copying: {e}")
+
+    f.seek(offset)
+    shutil.copyfileobj(f, pipe, CHUNK_SIZE)
+
+
 def read_bytes(f: IO[bytes], size: int, exact: bool = True) -> bytes:
     """Read bytes from a file-like object."""
     buf = f.read(size)
@@ -65,14 +151,278 @@ def read_bytes(f: IO[bytes], size: int, exact: bool = True) -> bytes:
     return buf
 
 
-def read_int(f: IO[bytes]) -> int:
-    """Read 2 bytes from a file-like object, and decode them as int."""
-    untrusted_int = f.read(INT_BYTES)
-    if len(untrusted_int) != INT_BYTES:
+def read_into(f: IO[bytes], buf: bytearray, size: int) -> memoryview:
+    """Read exactly this many bytes from a file-like object into a reusable buffer.
+
+    The buffer grows if it's smaller than the requested size. We return a view of the
+    bytes that we have read, which the caller must release before the next read.
+    """
+    if len(buf) < size:
+        buf.extend(bytes(size - len(buf)))
+    view = memoryview(buf)[:size]
+    offset = 0
+    while offset < size:
+        n = f.readinto(view[offset:])  # type: ignore [attr-defined]
+        if not n:
+            view.release()
+            raise errors.ConverterProcException()
+        offset += n
+    return view
+
+
+def read_int(f: IO[bytes], size: int = INT_BYTES) -> int:
+    """Read 2 (or more) bytes from a file-like object, and decode them as int."""
+    untrusted_int = f.read(size)
+    if len(untrusted_int) != size:
         raise errors.ConverterProcException()
     return int.from_bytes(untrusted_int, "big", signed=False)
 
 
+def max_compressed_size(size: int) -> int:
+    """The maximum size that zlib needs to compress some data of the given size.
+
+    This is a generous version of zlib's compressBound().
+    """
+    return size + (size >> 10) + 64
+
+
+def decompress_pixels(untrusted_data: Union[bytes, memoryview], size: int) -> bytes:
+    """Decompress zlib-compressed pixels, that should have exactly the given size.
+
+    The compressed data come from the sandbox, so we never decompress more than the
+    expected size, and we reject the data if there are any leftovers.
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        untrusted_pixels = decompressor.decompress(untrusted_data, size)
+    except zlib.error:
+        raise errors.PageDataException()
+    if (
+        len(untrusted_pixels) != size
+        or not decompressor.eof
+        or decompressor.unconsumed_tail
+        or decompressor.unused_data
+    ):
+        raise errors.PageDataException()
+    return untrusted_pixels
+
+
+def read_handshake(f: IO[bytes], requested_features: int) -> Tuple[int, int]:
+    """Read the features that the conversion process supports, and the page count.
+
+    If the conversion process replies to our handshake, then it sends the protocol
+    version it speaks and the features it supports out of the requested ones, followed
+    by the page count. Else, the first integer that it sends is the page count, and we
+    fall back to the original protocol, without any optional features.
+    """
+    value = read_int(f)
+    if value != PROTOCOL_MAGIC:
+        return 0, value
+
+    version = read_int(f)
+    features = read_int(f)
+    if not (1 <= version <= PROTOCOL_VERSION):
+        raise errors.ProtocolException()
+    if features & ~requested_features:
+        raise errors.ProtocolException()
+    log.debug(f"Conversion process speaks protocol v{version}, features {features:#x}")
+    return features, read_int(f)
+
+
+@dataclass
+class DocumentEstimate:
+    """What the conversion process reports about a document, before converting it.
+
+    The route is the way that the conversion process turns the document into a PDF
+    ("PyMuPDF" or "libreoffice"), and the page sizes are in points. Conversion
+    processes that cannot estimate the cost of a conversion report only the page
+    count, so the rest of the fields are empty.
+    """
+
+    page_count: int
+    route: Optional[str] = None
+    page_sizes: Optional[List[Tuple[int, int]]] = None
+
+
+@dataclass
+class PendingPage:
+    """A page that we are converting, and the way we convert it.
+
+    The future holds the result of the conversion, i.e., the compressed pixels of the
+    page, or its PDF if we OCR it. It's empty for pages that we have already converted.
+    If we OCR the page along with others, the future holds the PDFs of all of them, and
+    the index points to the one of this page.
+    """
+
+    page: UntrustedPage
+    digest: bytes
+    ocr: bool = False
+    cache_key: Optional[str] = None
+    future: concurrent.futures.Future = field(default_factory=concurrent.futures.Future)
+    batch_index: Optional[int] = None
+
+
+def read_estimate(f: IO[bytes], n_pages: int) -> DocumentEstimate:
+    """Read the conversion route and the page sizes of a document."""
+    route = ROUTE_NAMES.get(read_int(f))
+    if route is None:
+        raise errors.ProtocolException()
+    page_sizes = []
+    for _ in range(n_pages):
+        width = read_int(f)
+        height = read_int(f)
+        page_sizes.append((width, height))
+    return DocumentEstimate(page_count=n_pages, route=route, page_sizes=page_sizes)
+
+
+def read_page(
+    f: IO[bytes], features: int = 0, buf: Optional[bytearray] = None
+) -> UntrustedPage:
+    """Read the dimensions and the pixels of a page from a file-like object.
+
+    Depending on the features that the conversion process supports, each page may also
+    include its DPI, the number of its color channels, and the length of its compressed
+    pixels.
+
+    If the caller passes a buffer, we read the compressed pixels in it, instead of
+    allocating a new buffer for every page.
+    """
+    width = read_int(f)
+    height = read_int(f)
+    if not (1 <= width <= errors.MAX_PAGE_WIDTH):
+        raise errors.MaxPageWidthException()
+    if not (1 <= height <= errors.MAX_PAGE_HEIGHT):
+        raise errors.MaxPageHeightException()
+
+    dpi = read_int(f) if features & FEATURE_PAGE_DPI else DEFAULT_DPI
+    # The conversion process may lower the DPI of a page, but never raise it.
+    if not (1 <= dpi <= DEFAULT_DPI):
+        raise errors.PageDpiException()
+
+    channels = read_int(f) if features & FEATURE_GRAYSCALE else 3
+    if channels not in (1, 3):
+        raise errors.PageDataException()
+
+    num_pixels = width * height * channels
+    if features & FEATURE_ZLIB:
+        length = read_int(f, size=LENGTH_BYTES)
+        if not (1 <= length <= max_compressed_size(num_pixels)):
+            raise errors.PageDataException()
+        if buf is None:
+            untrusted_pixels = decompress_pixels(read_bytes(f, length), num_pixels)
+        else:
+            with read_into(f, buf, length) as untrusted_data:
+                untrusted_pixels = decompress_pixels(untrusted_data, num_pixels)
+    else:
+        untrusted_pixels = read_bytes(f, num_pixels)
+    return UntrustedPage(width, height, untrusted_pixels, channels, dpi)
+
+
+class PageReader:
+    """Read pages of pixels from the conversion process, in a separate thread.
+
+    The conversion process can only write a limited amount of data to its stdout pipe,
+    before it blocks. If we read the next page only once we have converted the previous
+    one to PDF, then the conversion process sits idle while we do so. Instead, we read
+    pages in a separate thread, and pass them to the caller through a bounded queue, so
+    that the conversion process and the host work at the same time, without keeping an
+    arbitrary number of pages in memory.
+
+    Any error that occurs while reading a page is raised to the caller, when they try
+    to get that page.
+
+    If the caller wants only some of the pages, we read the rest and drop them, and we
+    stop reading once we have read the last page that the caller wants.
+
+    Once the caller is done, we wait for the thread to finish, so that nobody closes
+    the file while we read it. If the caller stops early (e.g., due to an error), the
+    thread may be waiting for pixels that will never come. In this case, we call
+    `abort()`, which should make the file reach EOF, e.g., by killing the conversion
+    process.
+    """
+
+    def __init__(
+        self,
+        f: IO[bytes],
+        n_pages: int,
+        features: int = 0,
+        pages: Optional[List[int]] = None,
+        queue_size: int = PAGE_QUEUE_SIZE,
+        abort: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.f = f
+        self.abort = abort
+        self.n_pages = n_pages
+        self.features = features
+        self.pages = list(range(n_pages)) if pages is None else pages
+        # The buffer where we read the compressed pixels of each page. We keep only
+        # the decompressed pixels, so we can reuse it for every page.
+        self.buffer = bytearray()
+        self.queue: queue.Queue[Union[UntrustedPage, Exception]] = queue.Queue(
+            maxsize=queue_size
+        )
+        self.stopped = threading.Event()
+        # Set once we won't read anything else from the file.
+        self.done_reading = threading.Event()
+        self.thread = threading.Thread(target=self._read_pages, daemon=True)
+
+    def _put(self, item: Union[UntrustedPage, Exception]) -> bool:
+        # Do not block indefinitely if the caller has stopped consuming pages.
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_pages(self) -> None:
+        wanted = set(self.pages)
+        last = max(wanted) if wanted else -1
+        if last < 0:
+            self.done_reading.set()
+        for i in range(last + 1):
+            try:
+                page: Union[UntrustedPage, Exception] = read_page(
+                    self.f, self.features, self.buffer
+                )
+            except Exception as e:
+                # The exception will be raised in the caller's thread.
+                page = e
+            if i == last or isinstance(page, Exception):
+                self.done_reading.set()
+            if i not in wanted and not isinstance(page, Exception):
+                continue
+            if not self._put(page) or isinstance(page, Exception):
+                return
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop reading pages, once the pending read completes."""
+        self.stopped.set()
+
+    def get_page(self) -> UntrustedPage:
+        """Get the next page, in the order that the conversion process sent it."""
+        page = self.queue.get()
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+    def __enter__(self) -> "PageReader":
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+        if not self.done_reading.is_set() and self.abort is not None:
+            self.abort()
+        self.thread.join(timeout=TIMEOUT_FORCE)
+        if self.thread.is_alive():
+            log.warning("The thread that reads the pages has not finished")
+
+
 def sanitize_debug_text(text: bytes) -> str:
     """Read all the buffer and return a sanitized version"""
     untrusted_text = text.decode("ascii", errors="replace")
@@ -84,8 +434,23 @@ class IsolationProvider(ABC):
     Abstracts an isolation provider
     """
 
-    def __init__(self, debug: bool = False) -> None:
+    # The optional features of the pixels protocol that we request from the
+    # conversion process. Isolation providers that can pass arguments to the
+    # conversion process may request some, and use the ones that it supports.
+    protocol_features = 0
+
+    def __init__(
+        self,
+        debug: bool = False,
+        page_workers: Optional[int] = None,
+        ocr_tier: Optional[str] = None,
+        ocr_slots: Optional[int] = None,
+    ) -> None:
         self.debug = debug
+        self.page_workers = page_workers
+        self.ocr_tier = ocr_tier
+        self.ocr_slots = ocr_slots
+        self.ocr_cache: Optional[OCRCache] = None
         if self.should_capture_stderr():
             self.proc_stderr = subprocess.PIPE
         else:
@@ -94,17 +459,141 @@ class IsolationProvider(ABC):
     def should_capture_stderr(self) -> bool:
         return self.debug or getattr(sys, "dangerzone_dev", False)
 
+    def get_page_workers(self) -> int:
+        """Number of threads that compress the pixels of the pages that we don't OCR.
+
+        If the user has not specified this number for this session, use the one in
+        the settings. A single worker means that pages are compressed in the conversion
+        thread instead.
+        """
+        if self.page_workers is not None:
+            return self.page_workers
+        return Settings().get("page_workers")
+
+    def get_max_page_pixels(self) -> int:
+        """Pixel budget for a single page, if the conversion process chooses its DPI."""
+        return Settings().get("max_page_pixels")
+
+    def get_render_workers(self) -> int:
+        """Number of processes that render the pages of a document in the sandbox.
+
+        The sandbox can't tell how many CPUs it may use, so we count them on the host.
+        """
+        workers = Settings().get("render_workers")
+        if workers <= 0:
+            workers = get_cpu_count()
+        return min(workers, MAX_RENDER_WORKERS)
+
+    def get_ocr_tier(self) -> str:
+        """The language models that we OCR pages with.
+
+        If the user has not specified them for this session, use the ones in the
+        settings.
+        """
+        if self.ocr_tier is not None:
+            return self.ocr_tier
+        return Settings().get("ocr_tier")
+
+    def check_ocr_tier(self, ocr_lang: Optional[str]) -> None:
+        """Check that the OCR tier has the language data for the OCR language.
+
+        We ship the language data of the default tier for every language, but the rest
+        of the tiers are installed separately. So, we check them before we start a
+        conversion, instead of failing once we reach the first page to OCR.
+        """
+        tier = self.get_ocr_tier()
+        if not ocr_lang or tier == OCR_TIER_DEFAULT:
+            return
+        try:
+            tessdata = get_tessdata_dir(tier)
+        except ValueError as e:
+            raise errors.OCRTierException(str(e))
+        except RuntimeError:
+            tessdata = None
+        for lang in ocr_lang.split("+"):
+            if tessdata is None or not (tessdata / f"{lang}.traineddata").exists():
+                raise errors.OCRTierException(
+                    f"The '{tier}' OCR tier does not have the language data for"
+                    f" '{ocr_lang}'"
+                )
+
+    def get_ocr_image_mode(self) -> str:
+        """The image that we OCR, i.e., the page as is, or a cheaper copy of it."""
+        return Settings().get("ocr_image_mode")
+
+    def get_ocr_batch_size(self) -> int:
+        """Number of pages of a document that we OCR in a single job."""
+        return Settings().get("ocr_batch_size")
+
+    def get_ocr_slots(self) -> int:
+        """Number of pages that we OCR at the same time, across all conversions.
+
+        If the user has not specified this number for this session, use the one in
+        the settings.
+        """
+        if self.ocr_slots is not None:
+            return self.ocr_slots
+        return Settings().get("ocr_slots")
+
+    def get_ocr_threads(self) -> int:
+        """Number of Tesseract threads per OCR slot, or 0 to split the CPUs evenly."""
+        return Settings().get("ocr_threads")
+
+    def get_requested_features(self, estimate: bool = False) -> int:
+        """Optional features that we request for a conversion, or for an estimate."""
+        if estimate:
+            return self.protocol_features & FEATURE_ESTIMATE
+        return self.protocol_features & ~FEATURE_ESTIMATE
+
+    def get_ocr_cache(self) -> Optional[OCRCache]:
+        """The cache of OCR results, unless the user has disabled it."""
+        max_size = Settings().get("ocr_cache_size")
+        if not max_size:
+            return None
+        if self.ocr_cache is None or self.ocr_cache.max_size != max_size:
+            self.ocr_cache = OCRCache(get_ocr_cache_dir(), max_size)
+        return self.ocr_cache
+
+    def get_protocol_args(
+        self, pages: Optional[str] = None, estimate: bool = False
+    ) -> List[str]:
+        """Arguments for the conversion process, that start the protocol handshake."""
+        if not self.protocol_features:
+            return []
+        features = self.get_requested_features(estimate)
+        args = [
+            "--protocol",
+            str(PROTOCOL_VERSION),
+            "--features",
+            str(features),
+            "--max-page-pixels",
+            str(self.get_max_page_pixels()),
+        ]
+        if pages and features & FEATURE_PAGE_RANGE:
+            args += ["--pages", pages]
+        render_workers = self.get_render_workers()
+        if render_workers > 1:
+            args += ["--render-workers", str(render_workers)]
+        return args
+
     def convert(
         self,
         document: Document,
         ocr_lang: Optional[str],
         progress_callback: Optional[Callable] = None,
+        pages: Optional[str] = None,
     ) -> None:
+        """Convert a document to a safe PDF.
+
+        If a list of page ranges is passed (e.g., "1-5,8,10-"), convert only these
+        pages.
+        """
         self.progress_callback = progress_callback
         document.mark_as_converting()
         try:
-            with self.doc_to_pixels_proc(document) as conversion_proc:
-                self.convert_with_proc(document, ocr_lang, conversion_proc)
+            self.check_ocr_tier(ocr_lang)
+            with self.doc_to_pixels_proc(document, pages=pages) as conversion_proc:
+                self.convert_with_proc(document, ocr_lang, conversion_proc, pages)
             document.mark_as_safe()
             if document.archive_after_conversion:
                 document.archive()
@@ -118,100 +607,297 @@ class IsolationProvider(ABC):
             self.print_progress(document, True, str(e), 0)
             document.mark_as_failed()
 
-    def ocr_page(self, pixmap: fitz.Pixmap, ocr_lang: str) -> bytes:
-        """Get a single page as pixels, OCR it, and return a PDF as bytes."""
-        return pixmap.pdfocr_tobytes(
-            compress=True,
-            language=ocr_lang,
-            tessdata=str(get_tessdata_dir()),
-        )
+    def estimate(self, document: Document) -> DocumentEstimate:
+        """Estimate the cost of converting a document, without converting it.
 
-    def pixels_to_pdf_page(
-        self,
-        untrusted_data: bytes,
-        untrusted_width: int,
-        untrusted_height: int,
-        ocr_lang: Optional[str],
-    ) -> fitz.Document:
-        """Convert a byte array of RGB pixels into a PDF page, optionally with OCR."""
-        pixmap = fitz.Pixmap(
-            fitz.Colorspace(fitz.CS_RGB),
-            untrusted_width,
-            untrusted_height,
-            untrusted_data,
-            False,
-        )
-        pixmap.set_dpi(DEFAULT_DPI, DEFAULT_DPI)
+        The conversion process reports how it would convert the document, and the
+        number and size of its pages. If it does not support estimates, we learn just
+        the page count, and stop the conversion process right after that.
+        """
+        with self.doc_to_pixels_proc(document, estimate=True) as p:
+            self.write_input(document, p)
+            assert p.stdout
+            requested_features = self.get_requested_features(estimate=True)
+            features, n_pages = read_handshake(p.stdout, requested_features)
+            if not features & FEATURE_ESTIMATE:
+                return DocumentEstimate(page_count=n_pages)
+            return read_estimate(p.stdout, n_pages)
 
-        if ocr_lang:  # OCR the document
-            page_pdf_bytes = self.ocr_page(pixmap, ocr_lang)
-        else:  # Don't OCR
-            page_doc = fitz.Document()
-            page_doc.insert_file(pixmap)
-            page_pdf_bytes = page_doc.tobytes(deflate_images=True)
+    def ocr_pages(
+        self,
+        document: Document,
+        pages: List[UntrustedPage],
+        ocr_lang: str,
+        tessdata: str,
+        image_mode: str = OCR_IMAGE_FULL,
+        oem: int = OCR_ENGINE_DEFAULT,
+    ) -> concurrent.futures.Future:
+        """Queue pages for OCR, and get their future searchable PDFs as bytes.
 
-        return fitz.open("pdf", page_pdf_bytes)
+        The pages of all the conversions share the slots of the OCR scheduler, so that
+        we don't run more OCR jobs than the machine can take. The pages of each job
+        share the same Tesseract setup.
+        """
+        scheduler = get_ocr_scheduler(self.get_ocr_slots(), self.get_ocr_threads())
+        return scheduler.submit(
+            document.id,
+            pixels_to_pdf_batch,
+            pages,
+            ocr_lang,
+            tessdata,
+            image_mode,
+            oem,
+        )
 
-    def convert_with_proc(
+    def convert_pages(
         self,
         document: Document,
         ocr_lang: Optional[str],
-        p: subprocess.Popen,
+        reader: PageReader,
+        writer: SafePDFWriter,
     ) -> None:
+        """Convert the pages that the reader receives to a safe PDF document.
+
+        If we have more than one page worker, we compress the pages that we don't OCR
+        in a thread pool. We OCR pages in batches, in the slots of the OCR scheduler, which this
+        conversion shares with the rest. We submit a bounded number of pages to them,
+        and insert the resulting PDF pages to the safe document in order.
+
+        If we don't OCR a page, it's just an image. In this case, we only need to
+        compress its pixels, and the writer places them directly on a new page. We
+        don't OCR pages that look blank or like photos, since they yield no text. For
+        the rest of the pages, we look up their OCR result in the cache first, and we
+        store there the pages that we OCR. If we OCR a cheaper copy of each page, the
+        result is just a text layer, which the writer places over the page image.
+
+        If a page is identical to a previous page of the document (e.g., a blank page),
+        we don't convert it again. Instead, we insert a copy of the previous page, which
+        shares its image and text with it.
+        """
+        n_pages = len(reader.pages)
         percentage = 0.0
-        with open(document.input_filename, "rb") as f:
+        step = 100 / n_pages
+        searchable = "searchable " if ocr_lang else ""
+
+        workers = self.get_page_workers()
+        page_pool = get_page_pool(workers) if workers > 1 else None
+        ocr_batch_size = self.get_ocr_batch_size()
+        max_pending = 2 * max(
+            workers, self.get_ocr_slots() * ocr_batch_size if ocr_lang else 1
+        )
+        ocr_tier = self.get_ocr_tier()
+        tessdata = str(get_tessdata_dir(ocr_tier)) if ocr_lang else None
+        oem = get_ocr_engine_mode(ocr_tier)
+        ocr_cache = self.get_ocr_cache() if ocr_lang else None
+        image_mode = self.get_ocr_image_mode()
+        pending: Deque[PendingPage] = collections.deque()
+        # The pages that we will OCR in the next job.
+        ocr_batch: List[PendingPage] = []
+        # The digests of the pages that we have converted, or are converting, and the
+        # number of the safe PDF page that each one has become.
+        converted: Set[bytes] = set()
+        inserted: Dict[bytes, int] = {}
+        duplicates = 0
+        # The pages that we did not OCR, by kind.
+        skipped_ocr: Dict[str, int] = collections.Counter()
+
+        def insert_page(pending_page: PendingPage, result: Optional[bytes]) -> None:
+            original = inserted.get(pending_page.digest)
+            if original is not None:
+                writer.duplicate_page(original)
+                return
+            assert result is not None
+            if pending_page.ocr:
+                if ocr_cache and pending_page.cache_key:
+                    ocr_cache.put(pending_page.cache_key, result)
+                if image_mode == OCR_IMAGE_FULL:
+                    writer.insert_pdf(fitz.open("pdf", result))
+                else:
+                    writer.insert_image(
+                        pending_page.page,
+                        compress_pixels(pending_page.page),
+                        text_layer=fitz.open("pdf", result),
+                    )
+            else:
+                writer.insert_image(pending_page.page, result)
+            inserted[pending_page.digest] = writer.page_count - 1
+
+        def submit_ocr_batch() -> None:
+            if not ocr_batch:
+                return
+            assert ocr_lang is not None and tessdata is not None
+            future = self.ocr_pages(
+                document,
+                [p.page for p in ocr_batch],
+                ocr_lang,
+                tessdata,
+                image_mode,
+                oem,
+            )
+            for index, pending_page in enumerate(ocr_batch):
+                pending_page.future = future
+                pending_page.batch_index = index
+            ocr_batch.clear()
+
+        def insert_pending_page() -> None:
+            # Do not wait for pages that we have not submitted yet.
+            submit_ocr_batch()
+            pending_page = pending.popleft()
             try:
-                assert p.stdin is not None
-                p.stdin.write(f.read())
-                p.stdin.close()
-            except BrokenPipeError:
-                raise errors.ConverterProcException()
+                result = pending_page.future.result()
+            except BrokenProcessPool:
+                # An OCR worker has crashed, so start afresh for the next conversion.
+                shutdown_ocr_scheduler()
+                raise
+            if pending_page.batch_index is not None:
+                result = result[pending_page.batch_index]
+            insert_page(pending_page, result)
 
-            assert p.stdout
-            n_pages = read_int(p.stdout)
-            if n_pages == 0 or n_pages > errors.MAX_PAGES:
-                raise errors.MaxPagesException()
-            step = 100 / n_pages
+        def insert_ready_page(
+            pending_page: PendingPage, result: Optional[bytes]
+        ) -> None:
+            """Insert a page that we don't have to convert, after any pending ones."""
+            if pending:
+                pending_page.future.set_result(result)
+                pending.append(pending_page)
+            else:
+                insert_page(pending_page, result)
+
+        def convert_page(page: int, pending_page: PendingPage) -> None:
+            untrusted_page = pending_page.page
+            if ocr_lang:
+                kind = classify_page(untrusted_page)
+                if kind == PAGE_TEXT:
+                    pending_page.ocr = True
+                else:
+                    log.info(
+                        f"[doc {document.id}] Page {page} looks {kind}, skipping OCR"
+                    )
+                    skipped_ocr[kind] += 1
 
-            safe_doc = fitz.Document()
+            cached = None
+            if pending_page.ocr and ocr_cache:
+                assert ocr_lang is not None and tessdata is not None
+                pending_page.cache_key = ocr_cache.key(
+                    pending_page.digest, ocr_lang, tessdata, image_mode
+                )
+                cached = ocr_cache.get(pending_page.cache_key)
 
+            if cached is not None:
+                insert_ready_page(pending_page, cached)
+            elif pending_page.ocr:
+                ocr_batch.append(pending_page)
+                pending.append(pending_page)
+                if len(ocr_batch) >= ocr_batch_size:
+                    submit_ocr_batch()
+            elif page_pool:
+                pending_page.future = page_pool.submit(compress_pixels, untrusted_page)
+                pending.append(pending_page)
+            else:
+                insert_ready_page(pending_page, compress_pixels(untrusted_page))
+
+        try:
             for page in range(1, n_pages + 1):
-                searchable = "searchable " if ocr_lang else ""
                 text = (
                     f"Converting page {page}/{n_pages} from pixels to {searchable}PDF"
                 )
                 self.print_progress(document, False, text, percentage)
 
-                width = read_int(p.stdout)
-                height = read_int(p.stdout)
-                if not (1 <= width <= errors.MAX_PAGE_WIDTH):
-                    raise errors.MaxPageWidthException()
-                if not (1 <= height <= errors.MAX_PAGE_HEIGHT):
-                    raise errors.MaxPageHeightException()
-
-                num_pixels = width * height * 3  # three color channels
-                untrusted_pixels = read_bytes(
-                    p.stdout,
-                    num_pixels,
-                )
-
-                page_pdf = self.pixels_to_pdf_page(
-                    untrusted_pixels,
-                    width,
-                    height,
-                    ocr_lang,
-                )
-                safe_doc.insert_pdf(page_pdf)
+                untrusted_page = reader.get_page()
+                pending_page = PendingPage(untrusted_page, page_digest(untrusted_page))
+                if pending_page.digest in converted:
+                    duplicates += 1
+                    insert_ready_page(pending_page, None)
+                else:
+                    converted.add(pending_page.digest)
+                    convert_page(page, pending_page)
 
+                if len(pending) >= max_pending:
+                    insert_pending_page()
                 percentage += step
 
-        # Ensure nothing else is read after all bitmaps are obtained
-        p.stdout.close()
+            while pending:
+                insert_pending_page()
+        finally:
+            # Do not waste time on pages that we will not use.
+            for pending_page in pending:
+                pending_page.future.cancel()
+
+        if duplicates:
+            text = (
+                f"Reused {duplicates} duplicate page(s) out of {n_pages}, instead of"
+                " converting them again"
+            )
+            self.print_progress(document, False, text, percentage)
+        if skipped_ocr:
+            kinds = " and ".join(
+                f"{count} {kind}" for kind, count in sorted(skipped_ocr.items())
+            )
+            text = f"Skipped OCR for {kinds} page(s), which yield no text"
+            self.print_progress(document, False, text, percentage)
+        if ocr_lang:
+            # Record how we OCR'd the document, since it affects the quality of its text.
+            writer.set_info(
+                {"DangerzoneOCRLanguage": ocr_lang, "DangerzoneOCRTier": ocr_tier}
+            )
+
+    def write_input(self, document: Document, p: subprocess.Popen) -> None:
+        """Send the document to the conversion process."""
+        with open(document.input_filename, "rb") as f:
+            try:
+                assert p.stdin is not None
+                write_file(f, p.stdin)
+                p.stdin.close()
+            except BrokenPipeError:
+                raise errors.ConverterProcException()
+
+    def convert_with_proc(
+        self,
+        document: Document,
+        ocr_lang: Optional[str],
+        p: subprocess.Popen,
+        pages: Optional[str] = None,
+    ) -> None:
+        self.write_input(document, p)
+
+        assert p.stdout
+        features, n_pages = read_handshake(p.stdout, self.get_requested_features())
+        if n_pages == 0 or n_pages > errors.MAX_PAGES:
+            raise errors.MaxPagesException()
+
+        # If the conversion process does not support page ranges, it sends all the
+        # pages, and we have to pick the requested ones ourselves.
+        selected_pages = None
+        if pages and not features & FEATURE_PAGE_RANGE:
+            selected_pages = select_pages(pages, n_pages)
+            if not selected_pages:
+                raise errors.PageRangeException()
 
         # Saving it with a different name first, because PyMuPDF cannot handle
-        # non-Unicode chars.
-        safe_doc.save(document.sanitized_output_filename)
-        os.replace(document.sanitized_output_filename, document.output_filename)
+        # non-Unicode chars. Also, we write the pages to disk as we convert them, so
+        # we use a temporary name until the conversion completes.
+        writer = SafePDFWriter(f"{document.sanitized_output_filename}.part")
+        try:
+            # If we stop converting pages early, kill the conversion process, so that
+            # the reader doesn't wait for more pixels.
+            with PageReader(
+                p.stdout,
+                n_pages,
+                features,
+                selected_pages,
+                abort=lambda: self.terminate_doc_to_pixels_proc(document, p),
+            ) as reader:
+                self.convert_pages(document, ocr_lang, reader, writer)
+
+            # Ensure nothing else is read after all bitmaps are obtained
+            p.stdout.close()
+
+            writer.flush()
+        except Exception:
+            writer.discard()
+            raise
+
+        os.replace(writer.path, document.output_filename)
 
         # TODO handle leftover code input
         text = "Successfully converted document"
@@ -261,7 +947,9 @@ class IsolationProvider(ABC):
         pass
 
     @abstractmethod
-    def start_doc_to_pixels_proc(self, document: Document) -> subprocess.Popen:
+    def start_doc_to_pixels_proc(
+        self, document: Document, pages: Optional[str] = None, estimate: bool = False
+    ) -> subprocess.Popen:
         pass
 
     @abstractmethod
@@ -318,11 +1006,18 @@ class IsolationProvider(ABC):
         timeout_exception: int = TIMEOUT_EXCEPTION,
         timeout_grace: int = TIMEOUT_GRACE,
         timeout_force: int = TIMEOUT_FORCE,
+        pages: Optional[str] = None,
+        estimate: bool = False,
     ) -> Iterator[subprocess.Popen]:
         """Start a conversion process, pass it to the caller, and then clean it up."""
         # Store the proc stderr in memory
         stderr = BytesIO()
-        p = self.start_doc_to_pixels_proc(document)
+        p = self.start_doc_to_pixels_proc(document, pages, estimate)
+        # Move the document and the pixels in fewer and larger reads/writes, if the
+        # platform allows it.
+        for pipe in (p.stdin, p.stdout):
+            if pipe is not None:
+                enlarge_pipe(pipe.fileno())
         stderr_thread = self.start_stderr_thread(p, stderr)
 
         if platform.system() != "Windows":
@@ -1,13 +1,25 @@
+import collections
 import logging
 import os
 import platform
+import secrets
 import shlex
 import subprocess
 import sys
-from typing import Callable, List, Optional, Tuple
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+from typing import IO, Any, Callable, Deque, Dict, List, Optional
 
 from .. import container_utils, errors
-from ..container_utils import make_seccomp_json_accessible, subprocess_run
+from ..container_utils import subprocess_run
+from ..conversion.common import (
+    FEATURE_ESTIMATE,
+    FEATURE_GRAYSCALE,
+    FEATURE_PAGE_DPI,
+    FEATURE_PAGE_RANGE,
+    FEATURE_ZLIB,
+)
 from ..document import Document
 from ..podman.errors import CommandError
 from ..settings import Settings
@@ -21,7 +33,7 @@ from ..util import (
     get_resource_path,
     get_subprocess_startupinfo,
 )
-from .base import IsolationProvider, terminate_process_group
+from .base import IsolationProvider, sanitize_debug_text, terminate_process_group
 
 MINIMUM_DOCKER_DESKTOP = {
     "Darwin": "4.43.1",
@@ -38,10 +50,215 @@ else:
 
 log = logging.getLogger(__name__)
 
+_container_pool: Optional["ContainerPool"] = None
+# The provider that started the containers of the pool, so that we can stop them.
+_container_pool_provider: Optional["Container"] = None
+_container_pool_lock = threading.Lock()
+
+
+class StderrReader:
+    """Read the standard error of a container, while it waits in the pool.
+
+    In debug mode, we capture the standard error of the containers, and gVisor logs a
+    lot in it. If we don't read it while the container waits, the pipe fills up and
+    blocks the container. Once a conversion takes the container, it gets what we have
+    read so far, and the rest as it comes.
+    """
+
+    def __init__(self, pipe: IO[bytes]) -> None:
+        self.buffer = BytesIO()
+        self.output: IO[bytes] = self.buffer
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._read, args=(pipe,), daemon=True)
+        self.thread.start()
+
+    def _read(self, pipe: IO[bytes]) -> None:
+        try:
+            for line in pipe:
+                with self.lock:
+                    self.output.write(line)
+        except (ValueError, IOError) as e:
+            log.debug(f"Stderr stream closed: {e}")
+
+    def redirect(self, output: IO[bytes]) -> None:
+        """Write what we have read so far to another stream, and the rest as well."""
+        with self.lock:
+            output.write(self.buffer.getvalue())
+            self.output = output
+
+
+@dataclass
+class PooledContainer:
+    name: str
+    proc: subprocess.Popen
+    stderr: Optional[StderrReader] = None
+
+
+class ContainerPool:
+    """A pool of fresh conversion containers, which we start ahead of demand.
+
+    Starting a container takes a while, since we have to verify its image, create it,
+    and boot gVisor in it. The containers of the pool have gone through all that, and
+    their conversion process waits for a document in its standard input. A conversion
+    takes one of them, and the pool starts another one in the background.
+
+    The containers are still single-use. A conversion that takes a container is the
+    only one that ever uses it, and stops it afterwards, as usual. Also, all the
+    containers run the same command on the same image, so the pool serves only the
+    conversions that would start such a container anyway. If either changes, e.g.,
+    because the settings have changed or a new image has been installed, we stop the
+    containers of the pool.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.command: Optional[List[str]] = None
+        self.image: Optional[str] = None
+        self.containers: Deque[PooledContainer] = collections.deque()
+        self.starting = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def take(
+        self, provider: "Container", command: List[str]
+    ) -> Optional[PooledContainer]:
+        """Take a running container for this command and the current image, if any.
+
+        The caller should refill the pool afterwards, once it has started its own
+        container, if it had to.
+        """
+        image = container_utils.get_launch_profile().image_reference
+        stale = []
+        exited = []
+        taken = None
+        with self.lock:
+            if command != self.command or image != self.image:
+                # The containers that we have started are of no use.
+                stale = list(self.containers)
+                self.containers.clear()
+                self.command = command
+                self.image = image
+            while self.containers and taken is None:
+                container = self.containers.popleft()
+                if container.proc.poll() is None:
+                    taken = container
+                else:
+                    log.debug(
+                        f"Container '{container.name}' of the pool has exited unused"
+                    )
+                    exited.append(container)
+
+        for container in stale:
+            self._stop(provider, container)
+        for container in exited:
+            self._log_output(container)
+        return taken
+
+    def fill(self, provider: "Container") -> None:
+        """Start containers in the background, until the pool is full."""
+        with self.lock:
+            if self.closed or self.command is None:
+                return
+            missing = self.size - len(self.containers) - self.starting
+            self.starting += max(missing, 0)
+            command = self.command
+            image = self.image
+
+        for _ in range(missing):
+            threading.Thread(
+                target=self._start, args=(provider, command, image), daemon=True
+            ).start()
+
+    def _start(
+        self, provider: "Container", command: List[str], image: Optional[str]
+    ) -> None:
+        name = provider.pool_container_name()
+        container = None
+        try:
+            p = provider.exec_container(command, name=name)
+            stderr = StderrReader(p.stderr) if p.stderr else None
+            container = PooledContainer(name, p, stderr)
+        except Exception as e:
+            log.warning(f"Could not start container '{name}' for the pool: {e}")
+
+        with self.lock:
+            self.starting -= 1
+            if container is None:
+                return
+            if not self.closed and command == self.command and image == self.image:
+                self.containers.append(container)
+                return
+        self._stop(provider, container)
+
+    def _stop(self, provider: "Container", container: PooledContainer) -> None:
+        """Stop a container that no document has used."""
+        provider.stop_container(container.name, container.proc)
+        self._log_output(container)
+
+    def _log_output(self, container: PooledContainer) -> None:
+        """Log what an unused container has written to its standard error, if any."""
+        if container.stderr:
+            container.stderr.thread.join(timeout=1)
+            output = sanitize_debug_text(container.stderr.buffer.getvalue())
+            log.debug(f"Output of unused container '{container.name}':\n{output}")
+
+    def close(self, provider: "Container") -> None:
+        """Stop the containers of the pool, and don't start new ones."""
+        with self.lock:
+            self.closed = True
+            containers = list(self.containers)
+            self.containers.clear()
+        for container in containers:
+            self._stop(provider, container)
+
+
+def get_container_pool(provider: "Container", size: int) -> Optional[ContainerPool]:
+    """Get the pool of conversion containers, unless the user has disabled it.
+
+    The pool is shared by all the conversions of this session. If its size changes,
+    the pool is recreated.
+    """
+    global _container_pool, _container_pool_provider
+    with _container_pool_lock:
+        if _container_pool is not None and _container_pool.size != size:
+            _container_pool.close(provider)
+            _container_pool = None
+        if _container_pool is None and size > 0:
+            _container_pool = ContainerPool(size)
+        _container_pool_provider = provider if _container_pool else None
+        return _container_pool
+
+
+def close_container_pool() -> None:
+    """Stop the containers of the pool, if any, when Dangerzone shuts down."""
+    global _container_pool, _container_pool_provider
+    with _container_pool_lock:
+        pool, provider = _container_pool, _container_pool_provider
+        _container_pool = None
+        _container_pool_provider = None
+    if pool is not None and provider is not None:
+        pool.close(provider)
+
 
 class Container(IsolationProvider):
+    # Compress the page pixels in the sandbox, and send pages with no chroma as
+    # grayscale, to reduce the data that go through the pipe. Also, let the sandbox
+    # choose the DPI of each page, so that we don't get oversized or upscaled pages,
+    # and render only the requested pages. We can also ask for just an estimate of the
+    # conversion cost. Older container images ignore this request, and send the
+    # original stream.
+    protocol_features = (
+        FEATURE_ZLIB
+        | FEATURE_GRAYSCALE
+        | FEATURE_PAGE_DPI
+        | FEATURE_PAGE_RANGE
+        | FEATURE_ESTIMATE
+    )
+
     @staticmethod
-    def get_runtime_security_args() -> List[str]:
+    def get_runtime_security_args(
+        profile: Optional[container_utils.LaunchProfile] = None,
+    ) -> List[str]:
         """Security options applicable to the outer Dangerzone container.
 
         Our security precautions for the outer Dangerzone container are the following:
@@ -61,9 +278,11 @@ class Container(IsolationProvider):
         * Do not map the host user to the container, with `--userns nomap` (available
           from Podman 4.1 onwards)
         """
+        if profile is None:
+            profile = container_utils.get_launch_profile()
         security_args = ["--log-driver", "none"]
         security_args += ["--security-opt", "no-new-privileges"]
-        if container_utils.get_runtime_version() >= (4, 1):
+        if profile.runtime_version >= (4, 1):
             security_args += ["--userns", "nomap"]
 
         # We specify a custom seccomp policy uniformly, because on certain container
@@ -72,8 +291,7 @@ class Container(IsolationProvider):
         #
         # [1] https://github.com/freedomofpress/dangerzone/issues/846
         # [2] https://github.com/containers/common/blob/d3283f8401eeeb21f3c59a425b5461f069e199a7/pkg/seccomp/seccomp.json
-        seccomp_json_path = make_seccomp_json_accessible()
-        security_args += ["--security-opt", f"seccomp={seccomp_json_path}"]
+        security_args += ["--security-opt", f"seccomp={profile.seccomp_path}"]
 
         security_args += ["--cap-drop", "all"]
         security_args += ["--cap-add", "SYS_CHROOT"]
@@ -88,10 +306,29 @@ class Container(IsolationProvider):
     def requires_install() -> bool:
         return True
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # The names of the containers that documents have taken from the pool, and
+        # the readers of their standard error, by process ID, if any.
+        self.pool_container_names: Dict[str, str] = {}
+        self.pool_stderr_readers: Dict[int, StderrReader] = {}
+
     def doc_to_pixels_container_name(self, document: Document) -> str:
         """Unique container name for the doc-to-pixels phase."""
+        name = self.pool_container_names.get(document.id)
+        if name:
+            return name
         return f"{container_utils.CONTAINER_PREFIX}doc-to-pixels-{document.id}"
 
+    def pool_container_name(self) -> str:
+        """Unique container name for a container of the pool.
+
+        We don't know which document the container will convert, so we use a random
+        name, in the same format as the document IDs.
+        """
+        pool_id = secrets.token_urlsafe(6)[0:6]
+        return f"{container_utils.CONTAINER_PREFIX}doc-to-pixels-pool-{pool_id}"
+
     def pixels_to_pdf_container_name(self, document: Document) -> str:
         """Unique container name for the pixels-to-pdf phase."""
         return f"{container_utils.CONTAINER_PREFIX}pixels-to-pdf-{document.id}"
@@ -101,11 +338,14 @@ class Container(IsolationProvider):
         command: List[str],
         name: str,
     ) -> subprocess.Popen:
-        container_name = container_utils.expected_image_name()
-        image_digest = container_utils.get_local_image_digest()
+        # The launch profile pins the image by its digest, and we verify the
+        # signatures of that digest, which is quick once they have been verified.
+        profile = container_utils.get_launch_profile()
+        # Subscribe to the container events before we start our first container.
+        container_utils.get_container_monitor()
         if not bypass_signature_checks():
-            verify_local_image(image_digest=image_digest)
-        security_args = self.get_runtime_security_args()
+            verify_local_image(image_digest=profile.image_digest)
+        security_args = self.get_runtime_security_args(profile)
         debug_args = []
         if self.debug:
             debug_args += ["-e", "RUNSC_DEBUG=1"]
@@ -113,7 +353,7 @@ class Container(IsolationProvider):
         enable_stdin = ["-i"]
         set_name = ["--name", name]
         prevent_leakage_args = ["--rm"]
-        image_name = [container_name + "@sha256:" + image_digest]
+        image_name = [profile.image_reference]
         args = (
             ["run"]
             + security_args
@@ -138,15 +378,61 @@ class Container(IsolationProvider):
         assert isinstance(proc, subprocess.Popen)
         return proc
 
-    def start_doc_to_pixels_proc(self, document: Document) -> subprocess.Popen:
-        # Convert document to pixels
-        command = [
+    def doc_to_pixels_command(
+        self, pages: Optional[str] = None, estimate: bool = False
+    ) -> List[str]:
+        return [
             "/usr/bin/python3",
             "-m",
             "dangerzone.conversion.doc_to_pixels",
+            *self.get_protocol_args(pages, estimate),
         ]
-        name = self.doc_to_pixels_container_name(document)
-        return self.exec_container(command, name=name)
+
+    def start_doc_to_pixels_proc(
+        self, document: Document, pages: Optional[str] = None, estimate: bool = False
+    ) -> subprocess.Popen:
+        # Convert document to pixels
+        command = self.doc_to_pixels_command(pages, estimate)
+
+        # Take a container that we have started ahead of time, if it runs the same
+        # command. The containers of the pool convert whole documents.
+        pool = get_container_pool(self, Settings().get("container_pool_size"))
+        if not pool or command != self.doc_to_pixels_command():
+            name = self.doc_to_pixels_container_name(document)
+            return self.exec_container(command, name=name)
+
+        container = pool.take(self, command)
+        try:
+            if container:
+                log.debug(
+                    f"Converting document '{document.id}' in container"
+                    f" '{container.name}'"
+                )
+                self.pool_container_names[document.id] = container.name
+                if container.stderr:
+                    self.pool_stderr_readers[container.proc.pid] = container.stderr
+                return container.proc
+            name = self.doc_to_pixels_container_name(document)
+            return self.exec_container(command, name=name)
+        finally:
+            # Start the containers of the next conversions, after the one of this
+            # conversion, so that they don't compete with it.
+            pool.fill(self)
+
+    def start_stderr_thread(
+        self, process: subprocess.Popen, stderr: IO[bytes]
+    ) -> Optional[threading.Thread]:
+        # A container of the pool has its own reader already, so use that one.
+        reader = self.pool_stderr_readers.pop(process.pid, None)
+        if reader is None:
+            return super().start_stderr_thread(process, stderr)
+        reader.redirect(stderr)
+        return reader.thread
+
+    def stop_container(self, name: str, p: subprocess.Popen) -> None:
+        """Stop a container that no document has used."""
+        container_utils.kill_container(name)
+        terminate_process_group(p)
 
     def terminate_doc_to_pixels_proc(
         self, document: Document, p: subprocess.Popen
@@ -176,8 +462,18 @@ class Container(IsolationProvider):
         # after a podman kill / docker kill invocation, this will likely be the case,
         # else the container runtime (Docker/Podman) has experienced a problem, and we
         # should report it.
-        podman = container_utils.init_podman_command()
         name = self.doc_to_pixels_container_name(document)
+        self.pool_container_names.pop(document.id, None)
+        monitor = container_utils.get_container_monitor()
+        if monitor is not None:
+            # The container events tell us if the container has been removed, so we
+            # don't have to list all the containers. We report the containers that
+            # linger once they have had some time to be removed, all together.
+            monitor.expect_removed(name)
+            monitor.report_stragglers()
+            return
+
+        podman = container_utils.init_podman_command()
         try:
             all_containers = podman.run(["ps", "-a"])
         except CommandError as e:
@@ -3,7 +3,9 @@ import subprocess
 import sys
 from typing import Callable, Optional
 
-from ..conversion.common import DangerzoneConverter
+import fitz
+
+from ..conversion.common import DEFAULT_DPI, DangerzoneConverter
 from ..document import Document
 from .base import IsolationProvider, terminate_process_group
 
@@ -13,12 +15,18 @@ log = logging.getLogger(__name__)
 def dummy_script() -> None:
     sys.stdin.buffer.read()
     pages = 2
-    width = height = 9
     DangerzoneConverter._write_int(pages)
     for page in range(pages):
-        DangerzoneConverter._write_int(width)
-        DangerzoneConverter._write_int(height)
-        DangerzoneConverter._write_bytes(width * height * 3 * b"A")
+        # Render a small page with some text, so that the host OCRs it, instead of
+        # skipping it as blank.
+        doc = fitz.open()
+        doc.new_page(width=200, height=50).insert_text(
+            (10, 30), f"Dummy page {page + 1}", fontsize=12
+        )
+        pixmap = doc[0].get_pixmap(dpi=DEFAULT_DPI)
+        DangerzoneConverter._write_int(pixmap.width)
+        DangerzoneConverter._write_int(pixmap.height)
+        DangerzoneConverter._write_bytes(pixmap.samples)
 
 
 class Dummy(IsolationProvider):
@@ -28,20 +36,29 @@ class Dummy(IsolationProvider):
     Useful for testing without the need to use docker.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        page_workers: Optional[int] = None,
+        ocr_tier: Optional[str] = None,
+        ocr_slots: Optional[int] = None,
+    ) -> None:
         # Sanity check
         if not getattr(sys, "dangerzone_dev", False):
             raise Exception(
                 "Dummy isolation provider is UNSAFE and should never be "
                 + "called in a non-testing system."
             )
-        super().__init__()
+        super().__init__(
+            page_workers=page_workers, ocr_tier=ocr_tier, ocr_slots=ocr_slots
+        )
 
     @staticmethod
     def requires_install() -> bool:
         return False
 
-    def start_doc_to_pixels_proc(self, document: Document) -> subprocess.Popen:
+    def start_doc_to_pixels_proc(
+        self, document: Document, pages: Optional[str] = None, estimate: bool = False
+    ) -> subprocess.Popen:
         cmd = [
             sys.executable,
             "-c",
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import fitz
+
+from ..util import get_cache_dir
+from .pixels_to_pdf import OCR_IMAGE_FULL
+
+log = logging.getLogger(__name__)
+
+# Bump this number if the format of the cached results changes, so that we don't use
+# the results of previous versions.
+OCR_CACHE_VERSION = 1
+OCR_CACHE_SUFFIX = ".pdf"
+
+
+def get_ocr_cache_dir() -> Path:
+    return get_cache_dir() / "ocr"
+
+
+def get_tessdata_version(ocr_lang: str, tessdata: str) -> str:
+    """Identify the OCR engine and the language data that OCR a page.
+
+    Tesseract is part of PyMuPDF, so the PyMuPDF version covers the OCR engine. For
+    the language data, we use the size and modification time of each file, instead of
+    hashing them, since they can be large. Both change whenever the data are upgraded.
+    """
+    parts = [f"pymupdf:{fitz.VersionBind}"]
+    for lang in sorted(ocr_lang.split("+")):
+        try:
+            st = (Path(tessdata) / f"{lang}.traineddata").stat()
+            parts.append(f"{lang}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{lang}:missing")
+    return ",".join(parts)
+
+
+class OCRCache:
+    """An on-disk cache of OCR results, keyed by the contents of each page.
+
+    Each entry is the searchable PDF of a page, as Tesseract creates it, and its key is
+    a hash of the page pixels and dimensions, the OCR language, the version of the
+    language data and the image that we OCR. This way, if we convert the same page
+    again, we can skip OCR entirely.
+
+    The total size of the cache is capped. Once we exceed it, we evict the least
+    recently used entries, based on the modification time of each entry, which we
+    update whenever we use it.
+    """
+
+    def __init__(self, path: Path, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        # The total size of the entries. We compute it once we first need it, and then
+        # keep track of it, so that we don't scan the cache for every new entry.
+        # Several conversions may store their results at the same time, so we guard
+        # it with a lock.
+        self.size: Optional[int] = None
+        self.size_lock = threading.Lock()
+        self.tessdata_versions: Dict[Tuple[str, str], str] = {}
+
+    def key(
+        self,
+        digest: bytes,
+        ocr_lang: str,
+        tessdata: str,
+        image_mode: str = OCR_IMAGE_FULL,
+    ) -> str:
+        """Get the key of a page, out of the digest of its dimensions and pixels."""
+        version = self.tessdata_versions.get((ocr_lang, tessdata))
+        if version is None:
+            version = get_tessdata_version(ocr_lang, tessdata)
+            self.tessdata_versions[(ocr_lang, tessdata)] = version
+
+        h = hashlib.blake2b(digest_size=32)
+        h.update(f"v{OCR_CACHE_VERSION};{version};{ocr_lang};{image_mode}\n".encode())
+        h.update(digest)
+        return h.hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}{OCR_CACHE_SUFFIX}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Get the OCR result of a page, if it's in the cache."""
+        path = self.entry_path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        # Mark the entry as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store the OCR result of a page, and evict old entries if needed."""
+        if len(data) > self.max_size:
+            return
+
+        path = self.entry_path(key)
+        with self.size_lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            # If we replace an entry, e.g., because another conversion stored the
+            # same page in the meantime, we must not count it twice.
+            try:
+                old_size = path.stat().st_size
+            except OSError:
+                old_size = 0
+
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Write the entry atomically, so that we never read a partial one.
+                fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp, path)
+                except OSError:
+                    os.remove(tmp)
+                    raise
+            except OSError as e:
+                log.warning(
+                    f"Could not store the OCR result of a page in the cache: {e}"
+                )
+                return
+
+            self.size += len(data) - old_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def entries(self) -> List[Tuple[float, int, Path]]:
+        """Get the modification time, size and path of every entry."""
+        entries = []
+        for path in self.path.glob(f"*/*{OCR_CACHE_SUFFIX}"):
+            try:
+                st = path.stat()
+            except OSError:
+                # Another conversion may have evicted this entry.
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """Remove the least recently used entries, until we are within the size cap.
+
+        The caller must hold the size lock.
+        """
+        entries = sorted(self.entries())
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning(f"Could not evict an OCR result from the cache: {e}")
+                continue
+            size -= entry_size
+        log.debug(f"Evicted old OCR results, the cache now takes {size} bytes")
+        self.size = size
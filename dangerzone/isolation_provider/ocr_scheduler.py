@@ -0,0 +1,189 @@
+import collections
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from ..conversion.common import get_cpu_count
+
+log = logging.getLogger(__name__)
+
+_ocr_scheduler: Optional["OCRScheduler"] = None
+_ocr_scheduler_lock = threading.Lock()
+
+
+def get_ocr_threads(slots: int, threads: int = 0) -> int:
+    """Number of Tesseract threads per OCR slot.
+
+    If the user has not specified it, split the CPUs evenly between the slots, so that
+    the OCR jobs that run at the same time don't oversubscribe them.
+    """
+    if threads > 0:
+        return threads
+    return max(1, get_cpu_count() // slots)
+
+
+def init_ocr_worker(threads: int) -> None:
+    """Limit the number of Tesseract threads in an OCR worker process.
+
+    Tesseract reads this number from the environment, when it starts. We set it only in
+    the worker processes, since OCR runs only in them.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = str(threads)
+
+
+@dataclass
+class OCRJob:
+    future: concurrent.futures.Future
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+
+
+class OCRScheduler:
+    """Run the OCR jobs of all the conversions of this process, in a fixed number of slots.
+
+    Each slot is a worker process that OCRs one page at a time, using a fixed number of
+    Tesseract threads. Conversions submit their pages to the scheduler, which queues
+    them per document, and hands them to the free slots in a round-robin fashion. This
+    way, a large document does not starve the rest, and concurrent conversions never
+    run more OCR jobs than there are slots.
+    """
+
+    def __init__(self, slots: int, threads: int) -> None:
+        self.slots = slots
+        self.threads = threads
+        self.queues: "collections.OrderedDict[str, Deque[OCRJob]]" = (
+            collections.OrderedDict()
+        )
+        self.running = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+        # Spawn fresh worker processes, instead of forking the current one, which may
+        # have started threads of its own (e.g., Qt).
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=slots,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_ocr_worker,
+            initargs=(threads,),
+        )
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(
+        self, owner: str, fn: Callable[..., Any], *args: Any
+    ) -> concurrent.futures.Future:
+        """Queue an OCR job on behalf of a document, and return its future result."""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("The OCR scheduler has been shut down")
+            self.queues.setdefault(owner, collections.deque()).append(
+                OCRJob(future, fn, args)
+            )
+            self.cond.notify()
+        return future
+
+    def _next_job(self) -> Optional[OCRJob]:
+        """Get the next job of the next document in turn, and rotate the documents."""
+        while self.queues:
+            owner, queue = self.queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self.queues[owner] = queue
+            # Skip the jobs that the conversion has cancelled in the meantime.
+            if job.future.set_running_or_notify_cancel():
+                return job
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            with self.cond:
+                while not self.closed and (
+                    self.running >= self.slots or not self.queues
+                ):
+                    self.cond.wait()
+                if self.closed:
+                    return
+                job = self._next_job()
+                if job is None:
+                    continue
+                self.running += 1
+
+            try:
+                inner = self.executor.submit(job.fn, *job.args)
+            except Exception as e:
+                self._job_done(job, e, None)
+                continue
+            inner.add_done_callback(functools.partial(self._job_done, job, None))
+
+    def _job_done(
+        self,
+        job: OCRJob,
+        error: Optional[BaseException],
+        inner: Optional[concurrent.futures.Future],
+    ) -> None:
+        with self.cond:
+            self.running -= 1
+            self.cond.notify()
+        if inner is not None:
+            if inner.cancelled():
+                # The executor has dropped the job, because we have shut it down.
+                error = concurrent.futures.CancelledError(
+                    "The OCR scheduler has been shut down"
+                )
+            else:
+                error = inner.exception()
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            assert inner is not None
+            job.future.set_result(inner.result())
+
+    def shutdown(self) -> None:
+        with self.cond:
+            self.closed = True
+            for queue in self.queues.values():
+                for job in queue:
+                    job.future.cancel()
+            self.queues.clear()
+            self.cond.notify()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_ocr_scheduler(slots: int, threads: int = 0) -> OCRScheduler:
+    """Get the OCR scheduler of this process.
+
+    The scheduler is shared by all the conversions of this session. If the number of
+    slots or threads changes, the scheduler is recreated.
+    """
+    global _ocr_scheduler
+    threads = get_ocr_threads(slots, threads)
+    with _ocr_scheduler_lock:
+        if (
+            _ocr_scheduler is None
+            or _ocr_scheduler.slots != slots
+            or _ocr_scheduler.threads != threads
+        ):
+            if _ocr_scheduler is not None:
+                _ocr_scheduler.shutdown()
+            log.debug(
+                f"Starting an OCR scheduler with {slots} slot(s), and {threads}"
+                " Tesseract thread(s) per slot"
+            )
+            _ocr_scheduler = OCRScheduler(slots, threads)
+        return _ocr_scheduler
+
+
+def shutdown_ocr_scheduler() -> None:
+    """Shut down the OCR scheduler, e.g., because one of its workers has crashed."""
+    global _ocr_scheduler
+    with _ocr_scheduler_lock:
+        if _ocr_scheduler is not None:
+            _ocr_scheduler.shutdown()
+            _ocr_scheduler = None
@@ -0,0 +1,433 @@
+import concurrent.futures
+import hashlib
+import itertools
+import logging
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import fitz
+
+from ..conversion.common import DEFAULT_DPI
+from ..util import OCR_ENGINE_DEFAULT, OCR_ENGINE_LSTM_ONLY
+
+log = logging.getLogger(__name__)
+
+# Number of pages that we keep in memory, before we save them to disk.
+PAGES_PER_FLUSH = 250
+# Compression level for the page images of the safe PDF. This is the same level that
+# PyMuPDF uses when it deflates images.
+PDF_ZLIB_LEVEL = 6
+
+# The kinds of pages, as far as OCR is concerned.
+PAGE_BLANK = "blank"
+PAGE_TEXT = "text"
+PAGE_PHOTO = "photo"
+# We classify pages by the histogram of their grayscale pixels, in 16 bins of 16
+# levels each. The background of the page is the fullest bin, along with its
+# neighbors. A page is blank if all of its pixels are background, since even a lone
+# page number is just a few dozen pixels of ink. A page is a photo if it has no
+# dominant background, and its pixels are spread across many bins.
+PHOTO_MAX_BACKGROUND = 0.35
+PHOTO_MIN_LEVELS = 8
+PHOTO_MIN_BIN = 0.01
+# We get the histogram out of every Nth pixel. This is a prime number, so that we
+# don't sample the same columns of each row.
+HISTOGRAM_STRIDE = 17
+_HISTOGRAM_BINS = bytes(v >> 4 for v in range(256))
+
+# The image that we OCR. We either OCR the page as is, and use the searchable PDF that
+# Tesseract creates, or we OCR a cheaper grayscale copy of it, which may also be
+# downsampled to half the resolution. In the latter case, we keep only the invisible
+# text layer of the searchable PDF, and place it over the page image that we create.
+OCR_IMAGE_FULL = "full"
+OCR_IMAGE_GRAYSCALE = "grayscale"
+OCR_IMAGE_DOWNSAMPLED = "downsampled"
+OCR_IMAGE_MODES = (OCR_IMAGE_FULL, OCR_IMAGE_GRAYSCALE, OCR_IMAGE_DOWNSAMPLED)
+
+# The table of contents of a Tesseract language data file has the number of its
+# entries, and then the offset of each component, or -1 if it's missing. The legacy
+# engine and the LSTM one need different components.
+TESSDATA_MAX_ENTRIES = 1000
+TESSDATA_LEGACY = 3
+TESSDATA_LSTM = 17
+
+_page_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_page_pool_workers = 0
+_page_pool_lock = threading.Lock()
+
+
+@dataclass
+class UntrustedPage:
+    """The pixels of a page, as received from the conversion process.
+
+    The pixels are either RGB (3 channels) or grayscale (1 channel), and they have
+    been rendered at the given DPI.
+    """
+
+    width: int
+    height: int
+    pixels: bytes
+    channels: int = 3
+    dpi: int = DEFAULT_DPI
+
+
+def page_digest(page: UntrustedPage) -> bytes:
+    """Hash the dimensions and the pixels of a page, to find identical pages."""
+    h = hashlib.blake2b(digest_size=32)
+    h.update(f"{page.width}x{page.height};{page.channels};{page.dpi}\n".encode())
+    h.update(page.pixels)
+    return h.digest()
+
+
+def classify_page(page: UntrustedPage) -> str:
+    """Classify a page as blank, text-like, or photo-like, out of its pixels.
+
+    This is a cheap check, that lets us skip OCR for pages that yield no text. We err
+    on the side of text, since we'd rather OCR a page for nothing than miss its text.
+    """
+    # Use the green channel of RGB pixels as their gray level. It's the main part of
+    # their luminance, and we don't need to convert the whole page to grayscale.
+    levels = page.pixels[1 :: page.channels] if page.channels == 3 else page.pixels
+
+    # Get the histogram out of a sample of the pixels, which is enough to find the
+    # background and the spread of the gray levels. We map each pixel to its bin, and
+    # count the pixels of each bin, all in C.
+    binned = levels[::HISTOGRAM_STRIDE].translate(_HISTOGRAM_BINS)
+    histogram = [binned.count(i) for i in range(16)]
+    fullest = histogram.index(max(histogram))
+    background_bins = range(max(fullest - 1, 0), min(fullest + 2, 16))
+    background = sum(histogram[i] for i in background_bins) / len(binned)
+
+    # Look for the rest of the pixels (ink) in the whole page though, so that we don't
+    # miss a single word.
+    background_levels = bytes(v for v in range(256) if v >> 4 in background_bins)
+    if not levels.translate(None, background_levels):
+        return PAGE_BLANK
+
+    spread = sum(1 for count in histogram if count / len(binned) >= PHOTO_MIN_BIN)
+    if background < PHOTO_MAX_BACKGROUND and spread >= PHOTO_MIN_LEVELS:
+        return PAGE_PHOTO
+    return PAGE_TEXT
+
+
+def read_language_components(path: Path) -> Set[int]:
+    """Get the components that a Tesseract language data file has.
+
+    Tesseract aborts the process if the file is empty or corrupted, so we check that
+    the table of contents is whole, and that the components are within the file.
+    """
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        header = f.read(4)
+        for order in ("<", ">"):
+            if len(header) < 4:
+                break
+            (entries,) = struct.unpack(f"{order}I", header)
+            if entries > TESSDATA_MAX_ENTRIES:
+                continue
+            offsets = f.read(8 * entries)
+            if len(offsets) < 8 * entries:
+                break
+            components = {
+                i: offset
+                for i, offset in enumerate(struct.unpack(f"{order}{entries}q", offsets))
+                if offset >= 0
+            }
+            if all(offset < size for offset in components.values()):
+                return set(components)
+            break
+    raise RuntimeError(f"The language data in '{path}' are not valid")
+
+
+def check_language_data(tessdata: str, ocr_lang: str, oem: int) -> None:
+    """Check that Tesseract can OCR with the language data, in the given engine mode.
+
+    MuPDF crashes if Tesseract can't load the language data, so we check that they
+    exist, and that they have the models of an engine. Also, MuPDF sets up Tesseract
+    in the default engine mode, in which it runs every engine that the language data
+    have models for. So, for the LSTM-only mode, we check that the language data have
+    just the LSTM models.
+    """
+    for lang in ocr_lang.split("+"):
+        path = Path(tessdata) / f"{lang}.traineddata"
+        if not path.exists():
+            raise RuntimeError(f"The language data for '{lang}' are not installed")
+        components = read_language_components(path)
+        if oem == OCR_ENGINE_LSTM_ONLY:
+            if TESSDATA_LSTM not in components or TESSDATA_LEGACY in components:
+                raise RuntimeError(
+                    f"The language data for '{lang}' are not for the LSTM engine only"
+                )
+        elif TESSDATA_LSTM not in components and TESSDATA_LEGACY not in components:
+            raise RuntimeError(f"The language data for '{lang}' have no OCR models")
+
+
+def ocr_pixmap(
+    pixmap: fitz.Pixmap, ocr_lang: str, tessdata: str, oem: int = OCR_ENGINE_DEFAULT
+) -> bytes:
+    """OCR a page pixmap, and return it as a searchable PDF in bytes."""
+    check_language_data(tessdata, ocr_lang, oem)
+    return pixmap.pdfocr_tobytes(
+        compress=True,
+        language=ocr_lang,
+        tessdata=tessdata,
+    )
+
+
+def ocr_pixmaps(
+    pixmaps: List[fitz.Pixmap],
+    ocr_lang: str,
+    tessdata: str,
+    oem: int = OCR_ENGINE_DEFAULT,
+) -> bytes:
+    """OCR several page pixmaps, and return them as a multi-page searchable PDF.
+
+    Each call of `ocr_pixmap()` sets up Tesseract from scratch, and loads its language
+    data again. Here, we write all the pixmaps to a single OCR document writer of
+    MuPDF, which sets up Tesseract once, and reuses it for every page. The writer
+    renders each page at a single resolution and colorspace, so the pixmaps must
+    have the same ones.
+    """
+    check_language_data(tessdata, ocr_lang, oem)
+
+    mupdf = fitz.mupdf
+    colorspace = "gray" if pixmaps[0].n == 1 else "rgb"
+    options = (
+        f"compression=flate,resolution={pixmaps[0].xres},colorspace={colorspace},"
+        f"ocr-language={ocr_lang},ocr-datadir={tessdata}"
+    )
+    buf = mupdf.FzBuffer(0)
+    writer = mupdf.FzDocumentWriter(buf, "ocr", options)
+    for pixmap in pixmaps:
+        # Draw the pixmap over the whole page, at the resolution of the writer.
+        width = pixmap.width * 72 / pixmap.xres
+        height = pixmap.height * 72 / pixmap.yres
+        dev = mupdf.fz_begin_page(writer, mupdf.FzRect(0, 0, width, height))
+        image = mupdf.fz_new_image_from_pixmap(pixmap.this, mupdf.FzImage())
+        ctm = mupdf.FzMatrix(width, 0, 0, height, 0, 0)
+        mupdf.fz_fill_image(dev, image, ctm, 1.0, mupdf.FzColorParams())
+        mupdf.fz_end_page(writer)
+    mupdf.fz_close_document_writer(writer)
+    return mupdf.fz_buffer_extract(buf)
+
+
+def pixels_to_pixmap(page: UntrustedPage) -> fitz.Pixmap:
+    """Create a pixmap out of a byte array of RGB or grayscale pixels."""
+    colorspace = fitz.CS_GRAY if page.channels == 1 else fitz.CS_RGB
+    pixmap = fitz.Pixmap(
+        fitz.Colorspace(colorspace),
+        page.width,
+        page.height,
+        page.pixels,
+        False,
+    )
+    pixmap.set_dpi(page.dpi, page.dpi)
+    return pixmap
+
+
+def reduce_pixmap(pixmap: fitz.Pixmap, image_mode: str) -> fitz.Pixmap:
+    """Get a cheaper copy of a page pixmap to OCR, i.e., a grayscale or smaller one."""
+    if pixmap.n != 1:
+        pixmap = fitz.Pixmap(fitz.csGRAY, pixmap)
+    if image_mode == OCR_IMAGE_DOWNSAMPLED:
+        dpi = pixmap.xres
+        pixmap.shrink(1)
+        pixmap.set_dpi(max(dpi // 2, 1), max(dpi // 2, 1))
+    return pixmap
+
+
+def pdf_text_layer(pdf: bytes) -> bytes:
+    """Remove the image of a searchable PDF page, and keep only its text layer."""
+    doc = fitz.open("pdf", pdf)
+    page = doc[0]
+    page.add_redact_annot(page.rect)
+    page.apply_redactions(
+        images=fitz.PDF_REDACT_IMAGE_REMOVE,
+        graphics=fitz.PDF_REDACT_LINE_ART_NONE,
+        text=fitz.PDF_REDACT_TEXT_NONE,
+    )
+    return doc.tobytes(garbage=1, deflate=True)
+
+
+def pixels_to_pdf_batch(
+    pages: List[UntrustedPage],
+    ocr_lang: str,
+    tessdata: str,
+    image_mode: str = OCR_IMAGE_FULL,
+    oem: int = OCR_ENGINE_DEFAULT,
+) -> List[bytes]:
+    """OCR the pixels of several pages, and return each one as a searchable PDF.
+
+    We set up Tesseract once for each run of pages with the same resolution and
+    colorspace, instead of once per page. This matters most when we OCR many
+    languages, since we load the language data of each one during setup.
+
+    If we OCR reduced images of the pages, return just the text layer of each PDF.
+
+    This function runs in the OCR worker processes, so it must not rely on any state
+    of the parent process. This is why the caller has to pass the Tesseract data dir,
+    and the engine mode of the OCR tier.
+    """
+    pixmaps = [pixels_to_pixmap(page) for page in pages]
+    if image_mode != OCR_IMAGE_FULL:
+        pixmaps = [reduce_pixmap(pixmap, image_mode) for pixmap in pixmaps]
+
+    results = []
+    for _, group in itertools.groupby(pixmaps, key=lambda p: (p.xres, p.n)):
+        run = list(group)
+        if len(run) == 1:
+            results.append(ocr_pixmap(run[0], ocr_lang, tessdata, oem))
+            continue
+        doc = fitz.open("pdf", ocr_pixmaps(run, ocr_lang, tessdata, oem))
+        for pno in range(doc.page_count):
+            page_doc = fitz.open()
+            page_doc.insert_pdf(doc, from_page=pno, to_page=pno)
+            results.append(page_doc.tobytes(garbage=1, deflate=True))
+
+    if image_mode != OCR_IMAGE_FULL:
+        results = [pdf_text_layer(pdf) for pdf in results]
+    return results
+
+
+def compress_pixels(page: UntrustedPage) -> bytes:
+    """Compress the pixels of a page, so that we can embed them as a PDF image.
+
+    This function may run in the page worker threads as well.
+    """
+    return zlib.compress(page.pixels, PDF_ZLIB_LEVEL)
+
+
+class SafePDFWriter:
+    """Write the pages of the safe PDF to disk, as they are converted.
+
+    Instead of keeping all the pages of the safe PDF in memory and saving them at the
+    end, we save them to disk every few pages, with an incremental save. We then
+    re-open the document from disk, so that the saved pages no longer take up memory.
+    This way, the memory we need is bounded, regardless of the number of pages.
+
+    Documents with fewer pages than the flush threshold are saved in one go, exactly
+    as they would be without this writer.
+    """
+
+    def __init__(self, path: str, pages_per_flush: int = PAGES_PER_FLUSH) -> None:
+        self.path = path
+        self.pages_per_flush = pages_per_flush
+        self.doc = fitz.Document()
+        self.unsaved_pages = 0
+        self.saved = False
+
+    def insert_pdf(self, page_pdf: fitz.Document) -> None:
+        self.doc.insert_pdf(page_pdf)
+        self._page_inserted()
+
+    def insert_image(
+        self,
+        page: UntrustedPage,
+        compressed_pixels: bytes,
+        text_layer: Optional[fitz.Document] = None,
+    ) -> None:
+        """Add a page that consists of an image, out of its compressed pixels.
+
+        We create the image object directly from the compressed pixels, and place it
+        on a new page of the safe PDF. This way, we skip the creation, serialization
+        and parsing of an intermediate PDF document for each page.
+
+        If we have OCR'd a reduced image of the page, we place its text layer over the
+        image, scaled to the size of the page.
+        """
+        colorspace = "DeviceGray" if page.channels == 1 else "DeviceRGB"
+        xref = self.doc.get_new_xref()
+        self.doc.update_object(
+            xref,
+            f"<</Type/XObject/Subtype/Image/Width {page.width}/Height {page.height}"
+            f"/ColorSpace/{colorspace}/BitsPerComponent 8>>",
+        )
+        self.doc.update_stream(xref, compressed_pixels, compress=False)
+        # Updating the stream resets its filter, so we have to set it afterwards.
+        self.doc.xref_set_key(xref, "Filter", "/FlateDecode")
+
+        pdf_page = self.doc.new_page(
+            width=page.width * 72 / page.dpi,
+            height=page.height * 72 / page.dpi,
+        )
+        pdf_page.insert_image(pdf_page.rect, xref=xref)
+        if text_layer is not None:
+            pdf_page.show_pdf_page(pdf_page.rect, text_layer, 0)
+        self._page_inserted()
+
+    def duplicate_page(self, pno: int) -> None:
+        """Add a copy of a page that we have already inserted.
+
+        The copy has its own content stream, which just places the image and the text
+        of the page, but it shares the resources of the original page. This way, the
+        image of the page is stored only once in the safe PDF.
+        """
+        self.doc.fullcopy_page(pno)
+        self._page_inserted()
+
+    def set_info(self, info: Dict[str, str]) -> None:
+        """Add custom entries to the document information dictionary of the safe PDF."""
+        kind, value = self.doc.xref_get_key(-1, "Info")
+        if kind == "xref":
+            xref = int(value.split()[0])
+        else:
+            xref = self.doc.get_new_xref()
+            self.doc.update_object(xref, "<<>>")
+            self.doc.xref_set_key(-1, "Info", f"{xref} 0 R")
+        for key, value in info.items():
+            self.doc.xref_set_key(xref, key, fitz.get_pdf_str(value))
+
+    @property
+    def page_count(self) -> int:
+        """The number of pages in the safe PDF, including the ones we have saved."""
+        return self.doc.page_count
+
+    def _page_inserted(self) -> None:
+        self.unsaved_pages += 1
+        if self.unsaved_pages >= self.pages_per_flush:
+            self.flush()
+            self.doc = fitz.open(self.path)
+
+    def flush(self) -> None:
+        """Save the pending pages to disk, and close the document."""
+        if self.saved:
+            self.doc.saveIncr()
+        else:
+            self.doc.save(self.path)
+            self.saved = True
+        self.doc.close()
+        self.unsaved_pages = 0
+
+    def discard(self) -> None:
+        """Close the document, and remove any pages that we have saved."""
+        if not self.doc.is_closed:
+            self.doc.close()
+        if self.saved and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def get_page_pool(workers: int) -> concurrent.futures.ThreadPoolExecutor:
+    """Get the thread pool that compresses the pixels of the pages we don't OCR.
+
+    OCR runs in the worker processes of the OCR scheduler, so this pool just compresses
+    pixels. zlib releases the GIL while it compresses, so threads are enough, and we
+    don't have to pickle the pixels of each page to a worker process. The pool is
+    shared by all the conversions of this session. If the number of requested workers
+    changes, the pool is recreated.
+    """
+    global _page_pool, _page_pool_workers
+    with _page_pool_lock:
+        if _page_pool is None or _page_pool_workers != workers:
+            if _page_pool is not None:
+                _page_pool.shutdown(wait=False)
+            log.debug(f"Starting a pool of {workers} page workers")
+            _page_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="page-worker"
+            )
+            _page_pool_workers = workers
+        return _page_pool
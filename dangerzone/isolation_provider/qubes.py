@@ -25,7 +25,9 @@ class Qubes(IsolationProvider):
     def get_max_parallel_conversions(self) -> int:
         return 1
 
-    def start_doc_to_pixels_proc(self, document: Document) -> subprocess.Popen:
+    def start_doc_to_pixels_proc(
+        self, document: Document, pages: Optional[str] = None, estimate: bool = False
+    ) -> subprocess.Popen:
         dev_mode = getattr(sys, "dangerzone_dev", False) is True
         if dev_mode:
             # Use dz.ConvertDev RPC call instead, if we are in development mode.
@@ -1,7 +1,8 @@
 import concurrent.futures
 import json
 import logging
-from typing import Callable, List, Optional
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional
 
 import colorama
 
@@ -33,6 +34,18 @@ class DangerzoneCore(object):
         self.documents: List[Document] = []
         self.isolation_provider = isolation_provider
 
+    def get_ocr_tier_languages(self, tier: str) -> Dict[str, str]:
+        """Get the OCR languages whose language data are installed for an OCR tier."""
+        try:
+            tessdata = util.get_tessdata_dir(tier)
+        except RuntimeError:
+            return {}
+        return {
+            name: code
+            for name, code in self.ocr_languages.items()
+            if (tessdata / f"{code}.traineddata").exists()
+        }
+
     def add_document_from_filename(
         self,
         input_filename: str,
@@ -59,7 +72,10 @@ class DangerzoneCore(object):
         self.documents = []
 
     def convert_documents(
-        self, ocr_lang: Optional[str], stdout_callback: Optional[Callable] = None
+        self,
+        ocr_lang: Optional[str],
+        stdout_callback: Optional[Callable] = None,
+        pages: Optional[str] = None,
     ) -> None:
         def convert_doc(document: Document) -> None:
             try:
@@ -67,6 +83,7 @@ class DangerzoneCore(object):
                     document,
                     ocr_lang,
                     stdout_callback,
+                    pages,
                 )
 
             except Exception:
@@ -79,6 +96,28 @@ class DangerzoneCore(object):
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_jobs) as executor:
             executor.map(convert_doc, self.documents)
 
+    def estimate_documents(self) -> List[Dict[str, Any]]:
+        """Estimate the cost of converting each document, in the order they were added.
+
+        If we cannot estimate the cost of a document, we report the error instead.
+        """
+
+        def estimate_doc(document: Document) -> Dict[str, Any]:
+            result: Dict[str, Any] = {"filename": document.input_filename}
+            try:
+                estimate = self.isolation_provider.estimate(document)
+                result.update(asdict(estimate))
+            except Exception as e:
+                log.exception(
+                    f"Unexpected error occurred while estimating '{document}'"
+                )
+                result["error"] = str(e)
+            return result
+
+        max_jobs = self.isolation_provider.get_max_parallel_conversions()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_jobs) as executor:
+            return list(executor.map(estimate_doc, self.documents))
+
     def get_unconverted_documents(self) -> List[Document]:
         return [doc for doc in self.documents if doc.is_unconverted()]
 
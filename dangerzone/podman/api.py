@@ -0,0 +1,175 @@
+"""Minimal client for the Podman REST API, over a Unix socket.
+
+This client covers only the few endpoints that we need, and relies solely on the
+standard library, so that we don't need the Python Podman client as a dependency.
+"""
+
+import http.client
+import json
+import queue
+import socket
+import urllib.parse
+from typing import Any, Dict, List, Optional
+
+from . import errors
+
+API_VERSION = "v4.0.0"
+DEFAULT_TIMEOUT = 30
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path: str, timeout: Optional[float] = DEFAULT_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class APIClient:
+    """Client for the Podman REST API, with a pool of persistent connections.
+
+    Attributes:
+        path (str): Path to the Unix socket of the Podman service.
+        pool_size (int): Maximum number of idle connections that we keep around.
+    """
+
+    def __init__(self, uri: str, pool_size: int = 4):
+        """Initialize the APIClient.
+
+        Args:
+            uri (str): The URI of the Podman service, e.g., unix:///run/podman.sock.
+            pool_size (int, optional): Maximum number of idle connections. Defaults to 4.
+
+        Raises:
+            errors.InvalidArgument: If the URI does not point to a Unix socket.
+        """
+        parsed = urllib.parse.urlparse(uri)
+        if parsed.scheme != "unix":
+            raise errors.InvalidArgument(f"Unsupported Podman service URI: {uri}")
+        self.path = parsed.path
+        self.pool_size = pool_size
+        self.pool: "queue.LifoQueue[UnixHTTPConnection]" = queue.LifoQueue(pool_size)
+
+    def _get_connection(self) -> UnixHTTPConnection:
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return UnixHTTPConnection(self.path)
+
+    def _put_connection(self, conn: UnixHTTPConnection) -> None:
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(
+        self,
+        method: str,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+    ) -> Any:
+        """Send a request to the Podman service, and return its decoded response.
+
+        Args:
+            method (str): The HTTP method.
+            endpoint (str): The libpod endpoint, e.g., "/images/json".
+            params (dict, optional): Query parameters. Dicts and lists are encoded as
+                JSON.
+            timeout (float, optional): How long to wait for the response.
+
+        Returns:
+            Any: The decoded JSON response, the text of a non-JSON response, or None
+                if the response is empty.
+
+        Raises:
+            errors.NotFound: If the requested resource does not exist.
+            errors.APIError: If the service returns any other error.
+        """
+        url = f"/{API_VERSION}/libpod{endpoint}"
+        if params:
+            query = {
+                k: json.dumps(v) if isinstance(v, (dict, list)) else str(v)
+                for k, v in params.items()
+            }
+            url += "?" + urllib.parse.urlencode(query)
+
+        conn = self._get_connection()
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            try:
+                conn.request(method, url)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError):
+                # The service has closed an idle connection of the pool, so reconnect.
+                conn.close()
+                conn.request(method, url)
+                response = conn.getresponse()
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+        self._put_connection(conn)
+
+        if response.status >= 400:
+            try:
+                message = json.loads(body)["message"]
+            except (ValueError, KeyError, TypeError):
+                message = body.decode(errors="replace")
+            message = f"{method} {endpoint} failed with {response.status}: {message}"
+            if response.status == 404:
+                raise errors.NotFound(message)
+            raise errors.APIError(message)
+        if not body:
+            return None
+        if response.getheader("Content-Type", "").startswith("application/json"):
+            return json.loads(body)
+        return body.decode(errors="replace")
+
+    def ping(self) -> bool:
+        """Check if the Podman service responds."""
+        try:
+            self.request("GET", "/_ping")
+        except (OSError, ValueError, http.client.HTTPException, errors.APIError):
+            return False
+        return True
+
+    def version(self) -> str:
+        """Get the version of the Podman service."""
+        return self.request("GET", "/version")["Version"]
+
+    def list_images(self, reference: Optional[str] = None) -> List[Dict]:
+        """List the local images, optionally only those that match a reference."""
+        params = {"filters": {"reference": [reference]}} if reference else None
+        return self.request("GET", "/images/json", params) or []
+
+    def list_containers(self) -> List[Dict]:
+        """List all the containers, including the stopped ones."""
+        return self.request("GET", "/containers/json", {"all": "true"}) or []
+
+    def kill_container(
+        self, name: str, timeout: Optional[float] = DEFAULT_TIMEOUT
+    ) -> None:
+        """Kill a container, by its name or ID."""
+        endpoint = f"/containers/{urllib.parse.quote(name)}/kill"
+        self.request("POST", endpoint, timeout=timeout)
+
+    def close(self) -> None:
+        """Close the idle connections of the pool."""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
@@ -5,14 +5,9 @@ import time
 from pathlib import Path
 from typing import Optional, Union
 
-# FIXME: We are commenting out the following import, because it requires the Python
-# Podman client, which Dangerzone does not have as a dependency yet.
-#
-# The side-effect of this change is that we can't start the Podman REST API service, but
-# we don't need this feature yet.
-#
-# from podman import client
-from .. import errors
+# NOTE: Instead of the Python Podman client, which Dangerzone does not have as a
+# dependency, we ping the Podman REST API service with a minimal client of our own.
+from .. import api, errors
 from . import cli_runner, machine_manager
 
 
@@ -173,7 +168,8 @@ class PodmanCommand:
             )
 
         start = time.monotonic()
-        with client.PodmanClient(base_url=uri) as c:
+        c = api.APIClient(uri)
+        try:
             while True:
                 if timeout and time.monotonic() - start > timeout:
                     raise errors.ServiceTimeout(timeout)
@@ -182,12 +178,11 @@ class PodmanCommand:
                 if ret is not None:
                     raise errors.ServiceTerminated(ret)
 
-                try:
-                    if c.ping():
-                        break
-                except errors.APIError:
-                    pass
+                if c.ping():
+                    break
                 time.sleep(check_interval)
+        finally:
+            c.close()
 
     @contextlib.contextmanager
     def service(
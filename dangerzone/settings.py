@@ -9,8 +9,9 @@ from typing import TYPE_CHECKING, Any, Dict
 from packaging import version
 
 from . import errors
+from .conversion.common import DEFAULT_MAX_PAGE_PIXELS
 from .document import SAFE_EXTENSION
-from .util import get_config_dir, get_version
+from .util import OCR_TIER_DEFAULT, get_config_dir, get_version
 
 log = logging.getLogger(__name__)
 
@@ -57,6 +58,39 @@ class Settings:
             "updater_remote_log_index": 0,
             "updater_errors": 0,
             "stop_other_podman_machines": "ask",
+            "page_workers": 1,
+            "max_page_pixels": DEFAULT_MAX_PAGE_PIXELS,
+            # Number of processes that render the pages of a document in the sandbox,
+            # or 0 to start one per CPU (up to a limit). The sandbox renders pages
+            # serially if it can't start them, or if the document has few pages.
+            "render_workers": 0,
+            # Max size of the OCR results that we keep on disk, in bytes, or 0 to
+            # disable the cache. The cache is off by default, since these results
+            # contain the text of the converted documents. If you enable it, you can
+            # clear it by removing the "ocr" directory of the cache directory.
+            "ocr_cache_size": 0,
+            # Number of pages that we OCR at the same time, across all conversions,
+            # and number of Tesseract threads for each one. Set the threads to 0 to
+            # split the CPUs evenly between the OCR slots.
+            "ocr_slots": 1,
+            "ocr_threads": 0,
+            # The language models that Tesseract uses, i.e., "default", "fast" or "best".
+            "ocr_tier": OCR_TIER_DEFAULT,
+            # The image that Tesseract OCRs, i.e., "full" for the page as is, or
+            # "grayscale" and "downsampled" for a cheaper copy of it. In the latter
+            # case, we keep only the text layer of the OCR result.
+            "ocr_image_mode": "full",
+            # Number of pages of a document that we OCR in a single job, with a single
+            # Tesseract setup.
+            "ocr_batch_size": 4,
+            # Number of conversion containers that we start ahead of time, so that
+            # documents don't wait for them to start, or 0 to disable the pool. The
+            # pool is off by default, since its containers take up resources even
+            # when there are no documents to convert.
+            "container_pool_size": 0,
+            # Query Podman via a REST API service that runs for the whole session,
+            # instead of spawning a Podman process each time (Linux only).
+            "podman_api": False,
         }
 
     def custom_runtime_specified(self) -> bool:
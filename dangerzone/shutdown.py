@@ -3,6 +3,7 @@ import platform
 import typing
 
 from . import container_utils, settings, startup
+from .isolation_provider.container import close_container_pool
 from .podman.machine import PodmanMachineManager
 
 logger = logging.getLogger(__name__)
@@ -27,9 +28,16 @@ class ContainerStopTask(startup.Task):
     name = "Stopping the sandbox"
 
     def run(self) -> None:
+        # Stop the containers that wait in the pool for a conversion. Then, report
+        # the containers that have not stopped after their conversion, and stop
+        # listening to container events.
+        close_container_pool()
+        container_utils.close_container_monitor()
+
         # In practice, we don't expect more than 1 container in flight.
         for cont in container_utils.list_containers():
             container_utils.kill_container(cont)
+        container_utils.close_podman_api()
 
 
 class ShutdownMixin:
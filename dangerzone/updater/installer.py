@@ -10,6 +10,7 @@ from . import registry, signatures
 from .signatures import (
     BUNDLED_LOG_INDEX,
     LAST_LOG_INDEX,
+    clear_verification_cache,
     get_last_log_index,
     get_remote_digest_and_logindex,
     install_local_container_tar,
@@ -55,6 +56,9 @@ def apply_installation_strategy(strategy: Strategy) -> None:
         )
         upgrade_container_image(remote_digest, signatures=signatures)
         runtime.clear_old_images(digest_to_keep=remote_digest)
+        clear_verification_cache()
+    # The next conversions must use the image that we have just installed.
+    runtime.clear_launch_profile()
 
 
 def get_installation_strategy() -> Strategy:
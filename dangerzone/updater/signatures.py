@@ -6,6 +6,7 @@ import re
 import subprocess
 import sys
 import tarfile
+import threading
 from base64 import b64decode, b64encode
 from dataclasses import dataclass
 from functools import reduce
@@ -13,7 +14,7 @@ from hashlib import sha256
 from io import BytesIO
 from pathlib import Path, PurePath
 from tempfile import NamedTemporaryFile, TemporaryDirectory
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from .. import container_utils as runtime
 from .. import errors as dzerrors
@@ -43,6 +44,12 @@ SIGNATURES_PATH = appdata_dir() / "signatures"
 LAST_LOG_INDEX = SIGNATURES_PATH / "last_log_index"
 DANGERZONE_MANIFEST = "dangerzone.json"
 
+# The signatures that we have verified in this session, and the lock that guards them.
+# We keep them only in memory, so that a process that can write to our data directory
+# cannot make us skip the verification of an image.
+_verified_signatures: Set[str] = set()
+_verified_signatures_lock = threading.Lock()
+
 
 @dataclass
 class Signature:
@@ -421,6 +428,40 @@ def get_file_digest(
     return ""
 
 
+def get_verification_key(image_digest: str, pubkey: Path, signatures: bytes) -> str:
+    """Get the key under which we cache the verification of some signatures.
+
+    The key changes if any of the image digest, the public key, or the contents of the
+    signatures file change.
+    """
+    pubkey_digest = get_file_digest(pubkey)
+    signatures_digest = get_file_digest(content=signatures)
+    return get_file_digest(
+        content=f"{image_digest}:{pubkey_digest}:{signatures_digest}".encode()
+    )
+
+
+def is_verified(key: str) -> bool:
+    with _verified_signatures_lock:
+        return key in _verified_signatures
+
+
+def mark_verified(key: str) -> None:
+    """Remember that some signatures are valid, for the rest of this session."""
+    with _verified_signatures_lock:
+        _verified_signatures.add(key)
+
+
+def clear_verification_cache() -> None:
+    """Forget the signatures that we have verified.
+
+    Call it whenever the local signatures or images change, so that the next
+    conversion verifies them from scratch.
+    """
+    with _verified_signatures_lock:
+        _verified_signatures.clear()
+
+
 def load_and_verify_signatures(
     image_digest: str,
     pubkey: Path,
@@ -452,12 +493,20 @@ def load_and_verify_signatures(
         )
         raise errors.LocalSignatureNotFound(msg)
 
-    with open(signatures_file) as f:
+    with open(signatures_file, "rb") as f:
         log.debug("Loading signatures from %s", f.name)
-        signatures = json.load(f)
+        signatures_raw = f.read()
+    signatures = json.loads(signatures_raw)
 
     if not bypass_verification:
-        verify_signatures(signatures, image_digest, pubkey)
+        # Verifying the signatures requires a cosign call per signature, so skip it
+        # if we have already verified these exact signatures.
+        key = get_verification_key(image_digest, pubkey, signatures_raw)
+        if is_verified(key):
+            log.debug("Signatures have already been verified")
+        else:
+            verify_signatures(signatures, image_digest, pubkey)
+            mark_verified(key)
 
     return signatures
 
@@ -511,6 +560,7 @@ def store_signatures(
             f"Storing signatures for {image_digest} in {pubkey_signatures}/{image_digest}.json"
         )
         json.dump(signatures, f)
+    clear_verification_cache()
 
     if update_logindex:
         write_log_index(get_log_index_from_signatures(signatures))
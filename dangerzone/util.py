@@ -47,7 +47,29 @@ def get_resource_path(filename: str) -> Path:
     return prefix / filename
 
 
-def get_tessdata_dir() -> Path:
+# The OCR tiers, i.e., the language models that Tesseract uses. The default tier uses
+# the language data that Dangerzone bundles, or that the system has. The rest use the
+# "fast" (integer) or "best" (float) LSTM models of the Tesseract project, if installed.
+OCR_TIER_DEFAULT = "default"
+OCR_TIER_FAST = "fast"
+OCR_TIER_BEST = "best"
+OCR_TIERS = (OCR_TIER_DEFAULT, OCR_TIER_FAST, OCR_TIER_BEST)
+# The Tesseract engine modes (--oem) of the OCR tiers. The default tier uses the
+# engines that its language data have, since the ones of the system may have the
+# legacy models as well. The rest of the tiers use only the LSTM models.
+OCR_ENGINE_LSTM_ONLY = 1
+OCR_ENGINE_DEFAULT = 3
+OCR_TIER_ENGINE_MODES = {
+    OCR_TIER_DEFAULT: OCR_ENGINE_DEFAULT,
+    OCR_TIER_FAST: OCR_ENGINE_LSTM_ONLY,
+    OCR_TIER_BEST: OCR_ENGINE_LSTM_ONLY,
+}
+
+
+def get_tessdata_dir(tier: str = OCR_TIER_DEFAULT) -> Path:
+    if tier != OCR_TIER_DEFAULT:
+        return get_tier_tessdata_dir(tier)
+
     if getattr(sys, "dangerzone_dev", False) or platform.system() in (
         "Windows",
         "Darwin",
@@ -79,6 +101,42 @@ def get_tessdata_dir() -> Path:
     raise RuntimeError("Tesseract language data are not installed in the system")
 
 
+def get_tier_tessdata_dir(tier: str) -> Path:
+    """Get the Tesseract language data of an OCR tier, other than the default one."""
+    if tier not in OCR_TIERS:
+        raise ValueError(f"Unknown OCR tier '{tier}'")
+
+    tessdata_dirs = [get_resource_path(f"tessdata_{tier}")]
+    if tier == OCR_TIER_FAST and (
+        getattr(sys, "dangerzone_dev", False)
+        or platform.system() in ("Windows", "Darwin")
+    ):
+        # The language data that we bundle are the fast ones.
+        tessdata_dirs.append(get_resource_path("tessdata"))
+    if platform.system() == "Linux":
+        tessdata_dirs += [
+            Path(f"/usr/share/tessdata_{tier}/"),
+            Path(f"/usr/share/tesseract-ocr/tessdata_{tier}/"),
+            Path(f"/usr/local/share/tessdata_{tier}/"),
+        ]
+
+    for dir in tessdata_dirs:
+        if dir.is_dir():
+            return dir
+
+    raise RuntimeError(
+        f"Tesseract language data for the '{tier}' OCR tier are not installed in the"
+        " system"
+    )
+
+
+def get_ocr_engine_mode(tier: str) -> int:
+    """Get the Tesseract engine mode (--oem) of an OCR tier."""
+    if tier not in OCR_TIERS:
+        raise ValueError(f"Unknown OCR tier '{tier}'")
+    return OCR_TIER_ENGINE_MODES[tier]
+
+
 def get_version() -> str:
     """Returns the Dangerzone version string."""
     try:
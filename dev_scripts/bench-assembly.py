@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Compare two ways to assemble the safe PDF out of page images, without OCR.
+
+The old way creates a throwaway PDF document for each page, inserts the pixmap,
+serializes it, parses it back, and then copies it to the safe PDF. The new way
+compresses the pixels of each page once, and inserts them as an image on a new page
+of the safe PDF. This script assembles the same synthetic document both ways, and
+reports the time that each one takes, and the size of the resulting PDF.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+PROJECT_DIR = Path(__file__).parents[1]
+sys.path.insert(0, str(PROJECT_DIR))
+sys.dangerzone_dev = True  # type: ignore [attr-defined]
+
+import fitz  # noqa: E402
+
+from dangerzone.conversion.common import DEFAULT_DPI  # noqa: E402
+from dangerzone.isolation_provider.pixels_to_pdf import (  # noqa: E402
+    SafePDFWriter,
+    UntrustedPage,
+    compress_pixels,
+    pixels_to_pixmap,
+)
+
+TEXT = (
+    "Dangerzone takes potentially dangerous PDFs, office documents, or images and"
+    " converts them to safe PDFs. Page {page} of the benchmark document."
+)
+
+
+def make_pages(n_pages: int) -> List[UntrustedPage]:
+    """Render a synthetic letter-sized document with a few lines of text per page."""
+    doc = fitz.open()
+    for page in range(1, n_pages + 1):
+        pdf_page = doc.new_page(width=612, height=792)
+        for line in range(20):
+            pdf_page.insert_text(
+                (72, 72 + line * 30), TEXT.format(page=page)[:90], fontsize=10
+            )
+    pages = []
+    for pdf_page in doc:
+        pixmap = pdf_page.get_pixmap(dpi=DEFAULT_DPI)
+        pages.append(UntrustedPage(pixmap.width, pixmap.height, pixmap.samples))
+    return pages
+
+
+def round_trip(writer: SafePDFWriter, page: UntrustedPage) -> None:
+    """Insert a page the old way, through a throwaway PDF document."""
+    page_doc = fitz.Document()
+    page_doc.insert_file(pixels_to_pixmap(page))
+    writer.insert_pdf(fitz.open("pdf", page_doc.tobytes(deflate_images=True)))
+
+
+def direct(writer: SafePDFWriter, page: UntrustedPage) -> None:
+    """Insert a page the new way, as an image with the compressed pixels."""
+    writer.insert_image(page, compress_pixels(page))
+
+
+def assemble(
+    pages: List[UntrustedPage],
+    insert: Callable[[SafePDFWriter, UntrustedPage], None],
+    path: Path,
+) -> float:
+    start = time.perf_counter()
+    writer = SafePDFWriter(str(path))
+    for page in pages:
+        insert(writer, page)
+    writer.flush()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=100, help="Number of pages")
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    print(
+        f"{len(pages)} pages of {pages[0].width}x{pages[0].height} RGB pixels,"
+        f" PyMuPDF {fitz.VersionBind}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, insert in (
+            ("per-page PDF round trip", round_trip),
+            ("direct image insertion", direct),
+        ):
+            path = Path(tmp) / f"{insert.__name__}.pdf"
+            duration = assemble(pages, insert, path)
+            size = path.stat().st_size
+            print(f"  {name}: {duration:.1f}s, {size:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Measure the fixed overhead of launching a conversion container.
+
+Before a conversion container starts, we find the Podman version and the digest of
+the local image, copy the seccomp policy where Podman can read it, and verify the
+signatures of the image. This script times these steps when they run from scratch
+for every document, and when they reuse the launch profile of the session.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parents[1]
+sys.path.insert(0, str(PROJECT_DIR))
+sys.dangerzone_dev = True  # type: ignore [attr-defined]
+
+from dangerzone import container_utils  # noqa: E402
+from dangerzone.isolation_provider.container import Container  # noqa: E402
+from dangerzone.updater.signatures import (  # noqa: E402
+    bypass_signature_checks,
+    clear_verification_cache,
+    verify_local_image,
+)
+
+
+def prepare_launch() -> None:
+    """Run the steps that precede `podman run`, as `Container.exec_container` does."""
+    profile = container_utils.get_launch_profile()
+    if not bypass_signature_checks():
+        verify_local_image(image_digest=profile.image_digest)
+    Container.get_runtime_security_args(profile)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--documents", type=int, default=20, help="Number of simulated documents"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.documents):
+        container_utils.clear_launch_profile()
+        clear_verification_cache()
+        prepare_launch()
+    cold = (time.perf_counter() - start) / args.documents
+    print(f"From scratch: {cold * 1000:.1f}ms per document")
+
+    start = time.perf_counter()
+    for _ in range(args.documents):
+        prepare_launch()
+    warm = (time.perf_counter() - start) / args.documents
+    print(
+        f"With a launch profile: {warm * 1000:.1f}ms per document ({cold / warm:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
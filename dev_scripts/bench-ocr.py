@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Compare the time it takes to OCR a document page by page, and in batches.
+
+OCR'ing a page on its own sets up Tesseract from scratch, and loads the language
+data of every language again. OCR'ing a batch of pages sets it up once for the whole
+batch. This script OCRs the same synthetic document both ways, and reports the time
+that each one takes.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+PROJECT_DIR = Path(__file__).parents[1]
+sys.path.insert(0, str(PROJECT_DIR))
+sys.dangerzone_dev = True  # type: ignore [attr-defined]
+
+import fitz  # noqa: E402
+
+from dangerzone.conversion.common import DEFAULT_DPI  # noqa: E402
+from dangerzone.isolation_provider.pixels_to_pdf import (  # noqa: E402
+    UntrustedPage,
+    ocr_pixmap,
+    pixels_to_pdf_batch,
+    pixels_to_pixmap,
+)
+from dangerzone.util import get_tessdata_dir  # noqa: E402
+
+TEXT = (
+    "Dangerzone takes potentially dangerous PDFs, office documents, or images and"
+    " converts them to safe PDFs. Page {page} of the benchmark document."
+)
+
+
+def make_pages(n_pages: int) -> List[UntrustedPage]:
+    """Render a synthetic document with a few lines of text per page."""
+    doc = fitz.open()
+    for page in range(1, n_pages + 1):
+        pdf_page = doc.new_page()
+        for line in range(20):
+            pdf_page.insert_text(
+                (72, 72 + line * 30), TEXT.format(page=page)[:90], fontsize=10
+            )
+    pages = []
+    for pdf_page in doc:
+        pixmap = pdf_page.get_pixmap(dpi=DEFAULT_DPI)
+        pages.append(UntrustedPage(pixmap.width, pixmap.height, pixmap.samples))
+    return pages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=100, help="Number of pages")
+    parser.add_argument("--lang", default="eng", help="OCR languages, e.g., eng+deu")
+    parser.add_argument("--batch-size", type=int, default=4, help="Pages per batch")
+    parser.add_argument("--tessdata", help="Tesseract language data directory")
+    args = parser.parse_args()
+
+    tessdata = args.tessdata or str(get_tessdata_dir())
+    pages = make_pages(args.pages)
+
+    start = time.perf_counter()
+    for page in pages:
+        ocr_pixmap(pixels_to_pixmap(page), args.lang, tessdata)
+    per_page = time.perf_counter() - start
+    print(f"Page by page: {per_page:.2f}s ({per_page / len(pages):.3f}s per page)")
+
+    start = time.perf_counter()
+    for i in range(0, len(pages), args.batch_size):
+        pixels_to_pdf_batch(pages[i : i + args.batch_size], args.lang, tessdata)
+    batched = time.perf_counter() - start
+    print(
+        f"In batches of {args.batch_size}: {batched:.2f}s"
+        f" ({batched / len(pages):.3f}s per page, {per_page / batched:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
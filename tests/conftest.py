@@ -15,6 +15,7 @@ from dangerzone.gui import Application
 from dangerzone.isolation_provider import container
 from dangerzone.podman.machine import PodmanMachineManager
 from dangerzone.settings import Settings
+from dangerzone.updater import signatures
 
 sys.dangerzone_dev = True  # type: ignore[attr-defined]
 
@@ -32,12 +33,31 @@ def isolated_settings(mocker: MockerFixture, tmp_path: Path) -> Settings:
     return Settings()
 
 
+@pytest.fixture(autouse=True)
+def isolated_ocr_cache(mocker: MockerFixture, tmp_path: Path) -> Path:
+    cache_dir = tmp_path / "cache"
+    mocker.patch(
+        "dangerzone.isolation_provider.ocr_cache.get_cache_dir", return_value=cache_dir
+    )
+    return cache_dir
+
+
+@pytest.fixture(autouse=True)
+def isolated_verification_cache() -> Generator[None, None, None]:
+    signatures.clear_verification_cache()
+    yield
+    signatures.clear_verification_cache()
+
+
 @pytest.fixture(autouse=True)
 def setup_function() -> Generator[None, None, None]:
     # Reset the settings singleton between each test.
     Settings._singleton = None
     container_utils.init_podman_command.cache_clear()
+    container_utils.clear_launch_profile()
     yield
+    container_utils.close_container_monitor()
+    container_utils.close_podman_api()
 
 
 # Use this fixture to make `pytest-qt` invoke our custom QApplication.
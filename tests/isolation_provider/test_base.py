@@ -0,0 +1,700 @@
+import concurrent.futures
+import io
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, List, Union
+from unittest import mock
+
+import fitz
+import pytest
+from pytest_mock import MockerFixture
+
+from dangerzone.conversion import errors
+from dangerzone.conversion.common import (
+    CHUNK_SIZE,
+    DEFAULT_DPI,
+    FEATURE_ESTIMATE,
+    FEATURE_GRAYSCALE,
+    FEATURE_PAGE_DPI,
+    FEATURE_ZLIB,
+    PROTOCOL_MAGIC,
+    ROUTE_LIBREOFFICE,
+    DangerzoneConverter,
+)
+from dangerzone.document import Document
+from dangerzone.isolation_provider.base import (
+    DocumentEstimate,
+    PageReader,
+    decompress_pixels,
+    read_estimate,
+    read_handshake,
+    read_page,
+    write_file,
+)
+from dangerzone.isolation_provider.dummy import Dummy
+from dangerzone.isolation_provider.pixels_to_pdf import (
+    OCR_IMAGE_DOWNSAMPLED,
+    OCR_IMAGE_GRAYSCALE,
+    PAGE_BLANK,
+    PAGE_PHOTO,
+    PAGE_TEXT,
+    TESSDATA_LEGACY,
+    TESSDATA_LSTM,
+    SafePDFWriter,
+    UntrustedPage,
+    check_language_data,
+    classify_page,
+    compress_pixels,
+    pdf_text_layer,
+    pixels_to_pdf_batch,
+    pixels_to_pixmap,
+)
+from dangerzone.util import OCR_ENGINE_DEFAULT, OCR_ENGINE_LSTM_ONLY, get_tessdata_dir
+
+
+def to_bytes(*nums: int) -> bytes:
+    return b"".join(num.to_bytes(2, "big") for num in nums)
+
+
+def page_header(width: int, height: int) -> bytes:
+    return to_bytes(width, height)
+
+
+def zlib_page(width: int, height: int, data: bytes) -> bytes:
+    compressed = zlib.compress(data)
+    return page_header(width, height) + len(compressed).to_bytes(4, "big") + compressed
+
+
+def test_read_handshake_legacy() -> None:
+    f = io.BytesIO(to_bytes(3))
+    assert read_handshake(f, FEATURE_ZLIB | FEATURE_GRAYSCALE) == (0, 3)
+
+
+def test_read_handshake() -> None:
+    f = io.BytesIO(to_bytes(PROTOCOL_MAGIC, 1, FEATURE_ZLIB, 3))
+    assert read_handshake(f, FEATURE_ZLIB | FEATURE_GRAYSCALE) == (FEATURE_ZLIB, 3)
+
+
+@pytest.mark.parametrize(
+    "version,features",
+    [(0, FEATURE_ZLIB), (2, FEATURE_ZLIB), (1, FEATURE_PAGE_DPI)],
+    ids=["old-version", "new-version", "unrequested-feature"],
+)
+def test_read_handshake_invalid(version: int, features: int) -> None:
+    f = io.BytesIO(to_bytes(PROTOCOL_MAGIC, version, features, 3))
+    with pytest.raises(errors.ProtocolException):
+        read_handshake(f, FEATURE_ZLIB | FEATURE_GRAYSCALE)
+
+
+def test_read_estimate() -> None:
+    f = io.BytesIO(
+        to_bytes(PROTOCOL_MAGIC, 1, FEATURE_ESTIMATE, 2)
+        + to_bytes(ROUTE_LIBREOFFICE, 612, 792, 842, 595)
+    )
+    features, n_pages = read_handshake(f, FEATURE_ESTIMATE)
+    assert read_estimate(f, n_pages) == DocumentEstimate(
+        page_count=2, route="libreoffice", page_sizes=[(612, 792), (842, 595)]
+    )
+
+
+def test_read_estimate_invalid_route() -> None:
+    f = io.BytesIO(to_bytes(0, 612, 792))
+    with pytest.raises(errors.ProtocolException):
+        read_estimate(f, 1)
+
+
+def test_read_page_raw() -> None:
+    pixels = bytes(range(2 * 3 * 3))
+    f = io.BytesIO(page_header(2, 3) + pixels)
+    assert read_page(f) == UntrustedPage(2, 3, pixels)
+
+
+def test_read_page_zlib() -> None:
+    pixels = bytes(range(2 * 3 * 3))
+    f = io.BytesIO(zlib_page(2, 3, pixels))
+    assert read_page(f, FEATURE_ZLIB) == UntrustedPage(2, 3, pixels)
+
+
+def test_read_page_buffer() -> None:
+    small = bytes(range(2 * 3 * 3))
+    large = os.urandom(20 * 30 * 3)
+    f = io.BytesIO(zlib_page(20, 30, large) + zlib_page(2, 3, small))
+    buf = bytearray()
+    assert read_page(f, FEATURE_ZLIB, buf) == UntrustedPage(20, 30, large)
+    assert read_page(f, FEATURE_ZLIB, buf) == UntrustedPage(2, 3, small)
+    assert len(buf) == len(zlib.compress(large))
+    # No views of the buffer are left, else we could not resize it.
+    buf.clear()
+
+
+def test_read_page_buffer_truncated() -> None:
+    f = io.BytesIO(zlib_page(2, 3, bytes(18))[:-1])
+    with pytest.raises(errors.ConverterProcException):
+        read_page(f, FEATURE_ZLIB, bytearray())
+
+
+def test_write_chunks() -> None:
+    """Write chunks that do not fit in a pipe, and read them back in order."""
+    chunks: List[Union[bytes, memoryview]] = [
+        b"header",
+        os.urandom(256 * 1024),
+        b"",
+        memoryview(b"trailer"),
+    ]
+    r, w = os.pipe()
+    with io.TextIOWrapper(os.fdopen(w, "wb")) as pipe:
+        thread = threading.Thread(
+            target=DangerzoneConverter._write_chunks, args=(chunks, pipe)
+        )
+        thread.start()
+        with os.fdopen(r, "rb") as f:
+            data = f.read(sum(len(c) for c in chunks))
+        thread.join()
+    assert data == b"".join(chunks)
+
+
+def test_read_page_grayscale() -> None:
+    pixels = bytes(range(2 * 3))
+    f = io.BytesIO(page_header(2, 3) + (1).to_bytes(2, "big") + pixels)
+    assert read_page(f, FEATURE_GRAYSCALE) == UntrustedPage(2, 3, pixels, channels=1)
+
+
+def test_read_page_dpi() -> None:
+    pixels = bytes(range(2 * 3))
+    header = page_header(2, 3) + (72).to_bytes(2, "big") + (1).to_bytes(2, "big")
+    f = io.BytesIO(header + pixels)
+    assert read_page(f, FEATURE_GRAYSCALE | FEATURE_PAGE_DPI) == UntrustedPage(
+        2, 3, pixels, channels=1, dpi=72
+    )
+
+
+@pytest.mark.parametrize("dpi", [0, DEFAULT_DPI + 1])
+def test_read_page_invalid_dpi(dpi: int) -> None:
+    f = io.BytesIO(page_header(2, 3) + dpi.to_bytes(2, "big") + b"A" * 18)
+    with pytest.raises(errors.PageDpiException):
+        read_page(f, FEATURE_PAGE_DPI)
+
+
+@pytest.mark.parametrize("channels", [0, 2, 4])
+def test_read_page_invalid_channels(channels: int) -> None:
+    f = io.BytesIO(page_header(2, 3) + channels.to_bytes(2, "big") + b"A" * 24)
+    with pytest.raises(errors.PageDataException):
+        read_page(f, FEATURE_GRAYSCALE)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"A" * (4 * 4 * 3 - 1),  # Too few pixels
+        b"A" * (4 * 4 * 3 + 1),  # Too many pixels
+        b"A" * 10_000_000,  # Way too many pixels (decompression bomb)
+    ],
+    ids=["short", "long", "bomb"],
+)
+def test_read_page_zlib_wrong_size(data: bytes) -> None:
+    f = io.BytesIO(zlib_page(4, 4, data))
+    with pytest.raises(errors.PageDataException):
+        read_page(f, FEATURE_ZLIB)
+
+
+def test_read_page_zlib_oversized_length() -> None:
+    # The sandbox should not be able to make us read more than the expected
+    # compressed size.
+    f = io.BytesIO(page_header(4, 4) + (2**32 - 1).to_bytes(4, "big"))
+    with pytest.raises(errors.PageDataException):
+        read_page(f, FEATURE_ZLIB)
+
+
+def test_decompress_pixels_garbage() -> None:
+    with pytest.raises(errors.PageDataException):
+        decompress_pixels(b"not zlib data", 12)
+
+    # Trailing data after the end of the zlib stream should be rejected too.
+    with pytest.raises(errors.PageDataException):
+        decompress_pixels(zlib.compress(b"A" * 12) + b"trailing", 12)
+
+
+def test_page_reader_pages() -> None:
+    pages = [bytes([i]) * 2 * 3 * 3 for i in range(4)]
+    # The stream lacks the last page, which we should not attempt to read.
+    f = io.BytesIO(b"".join(page_header(2, 3) + page for page in pages[:3]))
+    with PageReader(f, 4, pages=[0, 2]) as reader:
+        assert reader.get_page().pixels == pages[0]
+        assert reader.get_page().pixels == pages[2]
+
+
+def test_page_reader_exit_early() -> None:
+    """Stop mid-stream, and check that the reader thread finishes."""
+    page = bytes(2 * 3 * 3)
+    r, w = os.pipe()
+    with os.fdopen(r, "rb") as f, os.fdopen(w, "wb") as pipe:
+        pipe.write(page_header(2, 3) + page)
+        pipe.flush()
+        # Closing the write end of the pipe is like killing the conversion process.
+        abort = mock.Mock(side_effect=pipe.close)
+        with pytest.raises(RuntimeError):
+            with PageReader(f, 3, abort=abort) as reader:
+                assert reader.get_page().pixels == page
+                raise RuntimeError("Could not convert the page")
+        abort.assert_called_once()
+        assert not reader.thread.is_alive()
+
+    # If we have read all the pages, there is nothing to abort.
+    abort = mock.Mock()
+    with PageReader(io.BytesIO(page_header(2, 3) + page), 1, abort=abort) as reader:
+        reader.get_page()
+    abort.assert_not_called()
+    assert not reader.thread.is_alive()
+
+
+@pytest.mark.parametrize("system", ["Linux", "Windows"])
+def test_write_file(system: str, tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch("platform.system", return_value=system)
+    data = os.urandom(3 * CHUNK_SIZE + 1)
+    src = tmp_path / "src"
+    src.write_bytes(data)
+    dst = tmp_path / "dst"
+
+    with open(src, "rb") as f, open(dst, "wb") as pipe:
+        pipe.write(b"header")
+        write_file(f, pipe)
+
+    assert dst.read_bytes() == b"header" + data
+
+
+@pytest.mark.parametrize("pages_per_flush", [1, 3, 100])
+def test_safe_pdf_writer(pages_per_flush: int, tmp_path: Path) -> None:
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path, pages_per_flush=pages_per_flush)
+    for i in range(1, 8):
+        page = UntrustedPage(i, i, bytes([i]) * i * i * 3)
+        page_doc = fitz.Document()
+        page_doc.insert_file(pixels_to_pixmap(page))
+        writer.insert_pdf(page_doc)
+    writer.flush()
+
+    safe_doc = fitz.open(path)
+    assert len(safe_doc) == 7
+    for i, safe_page in enumerate(safe_doc, start=1):
+        assert safe_page.get_images()[0][2:4] == (i, i)
+
+
+def test_safe_pdf_writer_discard(tmp_path: Path) -> None:
+    path = tmp_path / "safe.pdf"
+    writer = SafePDFWriter(str(path), pages_per_flush=1)
+    page_doc = fitz.Document()
+    page_doc.insert_file(pixels_to_pixmap(UntrustedPage(1, 1, b"AAA")))
+    writer.insert_pdf(page_doc)
+    assert path.exists()
+
+    writer.discard()
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+@pytest.mark.parametrize("pages_per_flush", [1, 100])
+def test_safe_pdf_writer_insert_image(
+    channels: int, pages_per_flush: int, tmp_path: Path
+) -> None:
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path, pages_per_flush=pages_per_flush)
+    pages = [
+        UntrustedPage(30, 20, os.urandom(30 * 20 * channels), channels),
+        UntrustedPage(20, 30, os.urandom(20 * 30 * channels), channels, dpi=72),
+    ]
+    for page in pages:
+        writer.insert_image(page, compress_pixels(page))
+    writer.flush()
+
+    safe_doc = fitz.open(path)
+    assert len(safe_doc) == 2
+    for page, safe_page in zip(pages, safe_doc):
+        # The page should have the same size that a pixmap with our DPI would have.
+        page_doc = fitz.Document()
+        page_doc.insert_file(pixels_to_pixmap(page))
+        assert safe_page.rect == page_doc[0].rect
+
+        # The page should contain just the original pixels.
+        assert len(safe_page.get_images()) == 1
+        xref = safe_page.get_images()[0][0]
+        pixmap = fitz.Pixmap(safe_doc, xref)
+        assert (pixmap.width, pixmap.height, pixmap.n) == (
+            page.width,
+            page.height,
+            channels,
+        )
+        assert pixmap.samples == page.pixels
+
+
+@pytest.mark.parametrize("pages_per_flush", [1, 100])
+def test_safe_pdf_writer_duplicate_page(pages_per_flush: int, tmp_path: Path) -> None:
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path, pages_per_flush=pages_per_flush)
+    page = UntrustedPage(30, 20, os.urandom(30 * 20 * 3))
+    writer.insert_image(page, compress_pixels(page))
+    writer.duplicate_page(0)
+    writer.duplicate_page(1)
+    assert writer.page_count == 3
+    writer.flush()
+
+    safe_doc = fitz.open(path)
+    assert len(safe_doc) == 3
+    # All the pages should show the same image, which is stored only once.
+    [xref] = {safe_page.get_images()[0][0] for safe_page in safe_doc}
+    assert fitz.Pixmap(safe_doc, xref).samples == page.pixels
+
+
+def test_convert_pages_duplicates(sample_pdf: str, tmp_path: Path) -> None:
+    provider = Dummy()
+    progress_callback = mock.Mock()
+    provider.progress_callback = progress_callback
+    pages = [
+        UntrustedPage(3, 2, os.urandom(3 * 2 * 3)),
+        UntrustedPage(3, 2, os.urandom(3 * 2 * 3)),
+    ]
+    order = [0, 1, 0, 0, 1]
+    f = io.BytesIO(b"".join(page_header(3, 2) + pages[i].pixels for i in order))
+
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path)
+    with PageReader(f, len(order)) as reader:
+        provider.convert_pages(Document(sample_pdf), None, reader, writer)
+    writer.flush()
+
+    safe_doc = fitz.open(path)
+    xrefs = [safe_page.get_images()[0][0] for safe_page in safe_doc]
+    assert len(set(xrefs)) == 2
+    for i, xref in zip(order, xrefs):
+        assert fitz.Pixmap(safe_doc, xref).samples == pages[i].pixels
+    progress_callback.assert_called_with(
+        False,
+        "Reused 3 duplicate page(s) out of 5, instead of converting them again",
+        mock.ANY,
+    )
+
+
+def text_page(
+    text: str = "Continued on next page", fontsize: int = 10
+) -> UntrustedPage:
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 100), text, fontsize=fontsize)
+    pixmap = doc[0].get_pixmap(dpi=DEFAULT_DPI)
+    return UntrustedPage(pixmap.width, pixmap.height, pixmap.samples)
+
+
+def test_classify_page() -> None:
+    page = text_page()
+    assert classify_page(page) == PAGE_TEXT
+    # A page with just a page number is not blank.
+    assert classify_page(text_page("1", fontsize=8)) == PAGE_TEXT
+
+    blank = UntrustedPage(page.width, page.height, b"\xff" * len(page.pixels))
+    assert classify_page(blank) == PAGE_BLANK
+    # A blank page can have any color, e.g., it can be a black grayscale page.
+    blank = UntrustedPage(page.width, page.height, bytes(page.width * page.height), 1)
+    assert classify_page(blank) == PAGE_BLANK
+
+    # A page with pixels of all levels, and no background.
+    levels = bytes(range(256)) * (page.width * page.height * 3 // 256 + 1)
+    photo = UntrustedPage(page.width, page.height, levels[: len(page.pixels)])
+    assert classify_page(photo) == PAGE_PHOTO
+
+
+def done_future(result: Any) -> concurrent.futures.Future:
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+def test_convert_pages_skip_ocr(
+    mocker: MockerFixture, sample_pdf: str, tmp_path: Path
+) -> None:
+    provider = Dummy()
+    progress_callback = mock.Mock()
+    provider.progress_callback = progress_callback
+    doc = fitz.open()
+    doc.new_page()
+    ocr_pages = mocker.patch.object(
+        provider,
+        "ocr_pages",
+        side_effect=lambda _, pages, *args: done_future([doc.tobytes()] * len(pages)),
+    )
+
+    page = text_page()
+    word = text_page("Yes", fontsize=8)
+    blank = UntrustedPage(page.width, page.height, b"\xff" * len(page.pixels))
+    f = io.BytesIO(
+        b"".join(page_header(p.width, p.height) + p.pixels for p in (blank, page, word))
+    )
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path)
+    with PageReader(f, 3) as reader:
+        provider.convert_pages(Document(sample_pdf), "eng", reader, writer)
+    writer.flush()
+
+    # Only the text pages are OCR'd, even if they have a single short word, and the
+    # blank page is just an image.
+    ocr_pages.assert_called_once()
+    assert ocr_pages.call_args.args[1] == [page, word]
+    safe_doc = fitz.open(path)
+    assert len(safe_doc) == 3
+    assert len(safe_doc[0].get_images()) == 1
+    progress_callback.assert_called_with(
+        False, "Skipped OCR for 1 blank page(s), which yield no text", mock.ANY
+    )
+
+
+def test_convert_pages_ocr_tier(
+    mocker: MockerFixture, sample_pdf: str, tmp_path: Path
+) -> None:
+    get_tessdata_dir = mocker.patch(
+        "dangerzone.isolation_provider.base.get_tessdata_dir",
+        return_value=tmp_path / "tessdata_best",
+    )
+    provider = Dummy(ocr_tier="best")
+    provider.progress_callback = None
+
+    page = text_page()
+    blank = UntrustedPage(page.width, page.height, b"\xff" * len(page.pixels))
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path)
+    f = io.BytesIO(page_header(blank.width, blank.height) + blank.pixels)
+    with PageReader(f, 1) as reader:
+        provider.convert_pages(Document(sample_pdf), "eng", reader, writer)
+    writer.flush()
+
+    # We OCR with the language data of the tier, and record it in the safe PDF.
+    get_tessdata_dir.assert_called_once_with("best")
+    safe_doc = fitz.open(path)
+    info = int(safe_doc.xref_get_key(-1, "Info")[1].split()[0])
+    assert safe_doc.xref_get_key(info, "DangerzoneOCRLanguage") == ("string", "eng")
+    assert safe_doc.xref_get_key(info, "DangerzoneOCRTier") == ("string", "best")
+
+
+def test_check_ocr_tier(mocker: MockerFixture, sample_pdf: str, tmp_path: Path) -> None:
+    (tmp_path / "eng.traineddata").write_bytes(b"data")
+    mocker.patch(
+        "dangerzone.isolation_provider.base.get_tessdata_dir", return_value=tmp_path
+    )
+    provider = Dummy(ocr_tier="best")
+    provider.progress_callback = None
+    provider.check_ocr_tier("eng")
+    provider.check_ocr_tier(None)
+    with pytest.raises(
+        errors.OCRTierException,
+        match="The 'best' OCR tier does not have the language data for 'eng\\+deu'",
+    ):
+        provider.check_ocr_tier("eng+deu")
+
+    # A conversion with a language that the tier lacks fails before it starts the
+    # conversion process.
+    start = mocker.patch.object(provider, "start_doc_to_pixels_proc")
+    doc = Document(sample_pdf)
+    provider.convert(doc, "deu")
+    assert doc.is_failed()
+    start.assert_not_called()
+
+    # The default tier has the language data of every language.
+    Dummy(ocr_tier="default").check_ocr_tier("deu")
+
+
+def searchable_pdf(pixmap: fitz.Pixmap, text: str) -> bytes:
+    """Create a PDF page like the ones that Tesseract creates, i.e., an image with
+    invisible text over it."""
+    doc = fitz.open()
+    width = pixmap.width * 72 / pixmap.xres
+    height = pixmap.height * 72 / pixmap.yres
+    page = doc.new_page(width=width, height=height)
+    page.insert_image(page.rect, pixmap=pixmap)
+    page.insert_text((10, height / 2), text, fontsize=8, render_mode=3)
+    return doc.tobytes()
+
+
+def tessdata_installed(lang: str) -> bool:
+    try:
+        return (get_tessdata_dir() / f"{lang}.traineddata").exists()
+    except RuntimeError:
+        return False
+
+
+@pytest.mark.skipif(
+    not tessdata_installed("eng"), reason="The English language data are not installed"
+)
+def test_pixels_to_pdf_batch_ocr() -> None:
+    """OCR several pages with a single Tesseract setup, via the OCR writer of MuPDF."""
+    pages = [text_page("Continued on next page"), text_page("End of the document")]
+    results = pixels_to_pdf_batch(pages, "eng", str(get_tessdata_dir()))
+    assert len(results) == 2
+    for result, words in zip(results, ("Continued", "End")):
+        pdf = fitz.open("pdf", result)
+        assert len(pdf) == 1
+        assert len(pdf[0].get_images()) == 1
+        assert words in pdf[0].get_text()
+
+
+def write_language_data(path: Path, components: List[int]) -> None:
+    """Write the table of contents of a Tesseract language data file."""
+    offsets = [-1] * 24
+    for component in components:
+        offsets[component] = 4 + 8 * len(offsets) + component
+    path.write_bytes(
+        len(offsets).to_bytes(4, "little")
+        + b"".join(o.to_bytes(8, "little", signed=True) for o in offsets)
+        + bytes(len(offsets))
+    )
+
+
+def test_check_language_data(tmp_path: Path) -> None:
+    write_language_data(tmp_path / "eng.traineddata", [TESSDATA_LSTM])
+    write_language_data(tmp_path / "deu.traineddata", [TESSDATA_LEGACY, TESSDATA_LSTM])
+    check_language_data(str(tmp_path), "eng+deu", OCR_ENGINE_DEFAULT)
+    check_language_data(str(tmp_path), "eng", OCR_ENGINE_LSTM_ONLY)
+
+    # Tesseract would run the legacy engine as well, so the LSTM-only engine mode
+    # needs language data with just the LSTM models.
+    with pytest.raises(RuntimeError, match="'deu' are not for the LSTM engine only"):
+        check_language_data(str(tmp_path), "eng+deu", OCR_ENGINE_LSTM_ONLY)
+    with pytest.raises(RuntimeError, match="'deu' are not for the LSTM engine only"):
+        pixels_to_pdf_batch(
+            [text_page()], "deu", str(tmp_path), oem=OCR_ENGINE_LSTM_ONLY
+        )
+    with pytest.raises(RuntimeError, match="'fra' are not installed"):
+        check_language_data(str(tmp_path), "fra", OCR_ENGINE_DEFAULT)
+
+
+def test_check_language_data_corrupted(tmp_path: Path) -> None:
+    """Reject language data that would make Tesseract abort the process."""
+    path = tmp_path / "eng.traineddata"
+    write_language_data(path, [TESSDATA_LSTM])
+    data = path.read_bytes()
+    corrupted = [
+        b"",  # Empty
+        data[:50],  # Truncated table of contents
+        data[: 4 + 8 * 24],  # Truncated components
+        b"\xff" * len(data),  # Garbage
+    ]
+    for contents in corrupted:
+        path.write_bytes(contents)
+        with pytest.raises(RuntimeError, match="are not valid"):
+            check_language_data(str(tmp_path), "eng", OCR_ENGINE_DEFAULT)
+
+    write_language_data(path, [])
+    with pytest.raises(RuntimeError, match="have no OCR models"):
+        check_language_data(str(tmp_path), "eng", OCR_ENGINE_DEFAULT)
+
+    # We OCR one or more pages with the same Tesseract setup, and neither crashes.
+    path.write_bytes(b"")
+    for n_pages in (1, 2):
+        with pytest.raises(RuntimeError, match="are not valid"):
+            pixels_to_pdf_batch([text_page()] * n_pages, "eng", str(tmp_path))
+
+
+def test_pixels_to_pdf_batch_reduced(mocker: MockerFixture) -> None:
+    page = text_page()
+    ocr_pixmap = mocker.patch(
+        "dangerzone.isolation_provider.pixels_to_pdf.ocr_pixmap",
+        side_effect=lambda pixmap, *args: searchable_pdf(pixmap, "Continued"),
+    )
+
+    # We OCR a grayscale copy of the page, and keep just the text of the result.
+    [result] = pixels_to_pdf_batch([page], "eng", "", OCR_IMAGE_GRAYSCALE)
+    pdf = fitz.open("pdf", result)
+    pixmap = ocr_pixmap.call_args.args[0]
+    assert (pixmap.n, pixmap.width, pixmap.height) == (1, page.width, page.height)
+    assert pdf[0].get_images() == []
+    assert pdf[0].get_text().strip() == "Continued"
+
+    # We can also halve its resolution, and the size of the page stays the same, give
+    # or take a pixel. The writer scales the text layer to the actual page size.
+    [result] = pixels_to_pdf_batch([page], "eng", "", OCR_IMAGE_DOWNSAMPLED)
+    pdf = fitz.open("pdf", result)
+    pixmap = ocr_pixmap.call_args.args[0]
+    assert (pixmap.n, pixmap.width, pixmap.xres) == (
+        1,
+        page.width // 2,
+        DEFAULT_DPI // 2,
+    )
+    pixel = 72 / (DEFAULT_DPI // 2)
+    assert abs(pdf[0].rect.width - page.width * 72 / DEFAULT_DPI) < pixel
+    assert abs(pdf[0].rect.height - page.height * 72 / DEFAULT_DPI) < pixel
+
+
+def test_safe_pdf_writer_text_layer(tmp_path: Path) -> None:
+    page = text_page()
+    text_layer = pdf_text_layer(searchable_pdf(pixels_to_pixmap(page), "Continued"))
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path)
+    writer.insert_image(page, compress_pixels(page), fitz.open("pdf", text_layer))
+    writer.flush()
+
+    # The page has our image, along with the text of the OCR result.
+    safe_doc = fitz.open(path)
+    assert len(safe_doc[0].get_images(full=True)) == 1
+    assert safe_doc[0].get_text().strip() == "Continued"
+    pixmap = safe_doc[0].get_pixmap(dpi=DEFAULT_DPI)
+    assert pixmap.samples == page.pixels
+
+
+def test_pixels_to_pdf_batch(mocker: MockerFixture) -> None:
+    def fake_ocr_pixmaps(pixmaps: list, *args: str) -> bytes:
+        doc = fitz.open()
+        for pixmap in pixmaps:
+            doc.insert_pdf(fitz.open("pdf", searchable_pdf(pixmap, "Continued")))
+        return doc.tobytes()
+
+    ocr_pixmaps = mocker.patch(
+        "dangerzone.isolation_provider.pixels_to_pdf.ocr_pixmaps",
+        side_effect=fake_ocr_pixmaps,
+    )
+    ocr_pixmap = mocker.patch(
+        "dangerzone.isolation_provider.pixels_to_pdf.ocr_pixmap",
+        side_effect=lambda pixmap, *args: searchable_pdf(pixmap, "Continued"),
+    )
+    page = text_page()
+    other_page = UntrustedPage(page.width, page.height, page.pixels, dpi=100)
+    pages = [page, page, page, other_page]
+
+    # We OCR the pages with the same resolution together, with a single Tesseract
+    # setup, and then split the result into a PDF per page.
+    results = pixels_to_pdf_batch(pages, "eng+deu", "")
+    ocr_pixmaps.assert_called_once()
+    assert len(ocr_pixmaps.call_args.args[0]) == 3
+    ocr_pixmap.assert_called_once()
+    assert len(results) == 4
+    for result, page in zip(results, pages):
+        pdf = fitz.open("pdf", result)
+        assert len(pdf) == 1
+        assert pdf[0].rect.width == pytest.approx(page.width * 72 / page.dpi)
+        assert pdf[0].rect.height == pytest.approx(page.height * 72 / page.dpi)
+        assert pdf[0].get_text().strip() == "Continued"
+
+
+def test_convert_pages_ocr_batches(
+    mocker: MockerFixture, sample_pdf: str, tmp_path: Path
+) -> None:
+    provider = Dummy()
+    provider.progress_callback = None
+    mocker.patch.object(provider, "get_ocr_batch_size", return_value=2)
+    mocker.patch.object(provider, "get_ocr_cache", return_value=None)
+
+    pages = [text_page(f"Continued on page {i + 1}") for i in range(5)]
+
+    def fake_ocr_pages(_: Document, batch: list, *args: str) -> Any:
+        return done_future(
+            [searchable_pdf(pixels_to_pixmap(p), str(pages.index(p))) for p in batch]
+        )
+
+    ocr_pages = mocker.patch.object(provider, "ocr_pages", side_effect=fake_ocr_pages)
+    f = io.BytesIO(b"".join(page_header(p.width, p.height) + p.pixels for p in pages))
+    path = str(tmp_path / "safe.pdf")
+    writer = SafePDFWriter(path)
+    with PageReader(f, 5) as reader:
+        provider.convert_pages(Document(sample_pdf), "eng", reader, writer)
+    writer.flush()
+
+    # We OCR the pages two at a time, and insert them in order.
+    assert [len(call.args[1]) for call in ocr_pages.call_args_list] == [2, 2, 1]
+    safe_doc = fitz.open(path)
+    assert [page.get_text().strip() for page in safe_doc] == ["0", "1", "2", "3", "4"]
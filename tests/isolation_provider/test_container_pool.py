@@ -0,0 +1,219 @@
+import io
+import subprocess
+import sys
+import time
+from typing import Iterator, List
+from unittest import mock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from dangerzone import shutdown
+from dangerzone.document import Document
+from dangerzone.isolation_provider import container
+from dangerzone.isolation_provider.container import Container, ContainerPool
+from dangerzone.settings import Settings
+
+
+class FakeContainer(Container):
+    """A container provider that starts processes instead of containers."""
+
+    def __init__(self, debug: bool = False) -> None:
+        super().__init__(debug=debug)
+        self.names: List[str] = []
+
+    def exec_container(self, command: List[str], name: str) -> subprocess.Popen:
+        self.names.append(name)
+        return subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import sys; sys.stderr.write('waiting\\n'); sys.stderr.flush();"
+                " sys.stdin.read()",
+            ],
+            stdin=subprocess.PIPE,
+            stderr=self.proc_stderr,
+            start_new_session=True,
+        )
+
+
+@pytest.fixture
+def kill_container(mocker: MockerFixture) -> mock.MagicMock:
+    return mocker.patch.object(container.container_utils, "kill_container")
+
+
+@pytest.fixture
+def launch_profile(mocker: MockerFixture) -> mock.MagicMock:
+    profile = mocker.MagicMock(image_reference="dangerzone@sha256:aaa")
+    mocker.patch.object(
+        container.container_utils, "get_launch_profile", return_value=profile
+    )
+    return profile
+
+
+@pytest.fixture
+def provider(
+    kill_container: mock.MagicMock, launch_profile: mock.MagicMock
+) -> Iterator[FakeContainer]:
+    provider = FakeContainer()
+    yield provider
+    container.get_container_pool(provider, 0)
+
+
+def wait_for_pool(pool: ContainerPool, size: int) -> None:
+    for _ in range(100):
+        with pool.lock:
+            if len(pool.containers) == size and pool.starting == 0:
+                return
+        time.sleep(0.05)
+    raise AssertionError("The pool has not been filled")
+
+
+def test_container_pool(
+    mocker: MockerFixture, provider: FakeContainer, sample_pdf: str
+) -> None:
+    mocker.patch.object(container.container_utils, "get_container_monitor")
+    Settings().set("container_pool_size", 2)
+    doc = Document(sample_pdf)
+    command = provider.doc_to_pixels_command()
+
+    # The first conversion starts its own container, and the pool fills up.
+    p = provider.start_doc_to_pixels_proc(doc)
+    assert provider.names[0] == provider.doc_to_pixels_container_name(doc)
+    pool = container.get_container_pool(provider, 2)
+    assert pool is not None and pool.command == command
+    wait_for_pool(pool, 2)
+    p.kill()
+
+    # The next one takes a container from the pool, which starts another one.
+    doc = Document(sample_pdf)
+    p = provider.start_doc_to_pixels_proc(doc)
+    name = provider.doc_to_pixels_container_name(doc)
+    assert name in provider.names[1:3]
+    assert "-pool-" in name
+    wait_for_pool(pool, 2)
+    assert len(provider.names) == 4
+    assert name not in [c.name for c in pool.containers]
+    p.kill()
+
+    # Once the conversion is over, we forget the name of its container.
+    provider.ensure_stop_doc_to_pixels_proc(doc, p)
+    assert doc.id not in provider.pool_container_names
+
+    # Conversions of page ranges don't use the pool.
+    doc = Document(sample_pdf)
+    p = provider.start_doc_to_pixels_proc(doc, pages="1-2")
+    assert provider.names[-1] == provider.doc_to_pixels_container_name(doc)
+    assert len(pool.containers) == 2
+    p.kill()
+
+
+def test_container_pool_exited(
+    provider: FakeContainer, kill_container: mock.MagicMock
+) -> None:
+    pool = ContainerPool(1)
+    command = provider.doc_to_pixels_command()
+    assert pool.take(provider, command) is None
+    pool.fill(provider)
+    wait_for_pool(pool, 1)
+
+    # Containers that have exited while in the pool are discarded.
+    p = pool.containers[0].proc
+    p.kill()
+    p.wait()
+    assert pool.take(provider, command) is None
+    pool.fill(provider)
+    wait_for_pool(pool, 1)
+
+    # If the command changes, the containers of the pool are stopped.
+    p = pool.containers[0].proc
+    assert pool.take(provider, command + ["--other"]) is None
+    assert p.wait(timeout=5) is not None
+    pool.fill(provider)
+    wait_for_pool(pool, 1)
+    assert pool.command == command + ["--other"]
+
+    pool.close(provider)
+    assert len(pool.containers) == 0
+    assert kill_container.call_count == 2
+
+
+def test_container_pool_image(
+    provider: FakeContainer, launch_profile: mock.MagicMock
+) -> None:
+    pool = ContainerPool(1)
+    command = provider.doc_to_pixels_command()
+    pool.take(provider, command)
+    pool.fill(provider)
+    wait_for_pool(pool, 1)
+
+    # If a new image has been installed, the containers of the pool are stopped.
+    p = pool.containers[0].proc
+    launch_profile.image_reference = "dangerzone@sha256:bbb"
+    assert pool.take(provider, command) is None
+    assert p.wait(timeout=5) is not None
+    assert pool.image == "dangerzone@sha256:bbb"
+    pool.close(provider)
+
+
+def test_container_pool_stderr(
+    kill_container: mock.MagicMock, launch_profile: mock.MagicMock
+) -> None:
+    provider = FakeContainer(debug=True)
+    pool = ContainerPool(1)
+    command = provider.doc_to_pixels_command()
+    pool.take(provider, command)
+    pool.fill(provider)
+    wait_for_pool(pool, 1)
+
+    # We read the standard error of the container while it waits in the pool, and
+    # pass it on to the conversion that takes the container.
+    reader = pool.containers[0].stderr
+    assert reader is not None
+    for _ in range(100):
+        if reader.buffer.getvalue():
+            break
+        time.sleep(0.05)
+    taken = pool.take(provider, command)
+    assert taken is not None and taken.stderr is reader
+    provider.pool_stderr_readers[taken.proc.pid] = taken.stderr
+    stderr = io.BytesIO()
+    thread = provider.start_stderr_thread(taken.proc, stderr)
+    assert thread is taken.stderr.thread
+    taken.proc.kill()
+    thread.join(timeout=5)
+    assert stderr.getvalue() == b"waiting\n"
+    assert provider.pool_stderr_readers == {}
+    pool.close(provider)
+
+
+def test_container_pool_disabled(provider: FakeContainer, sample_pdf: str) -> None:
+    Settings().set("container_pool_size", 0)
+    assert container.get_container_pool(provider, 0) is None
+    for _ in range(2):
+        p = provider.start_doc_to_pixels_proc(Document(sample_pdf))
+        p.kill()
+    time.sleep(0.1)
+    assert all("-pool-" not in name for name in provider.names)
+    assert len(provider.names) == 2
+
+
+def test_close_container_pool(
+    mocker: MockerFixture, provider: FakeContainer, kill_container: mock.MagicMock
+) -> None:
+    pool = container.get_container_pool(provider, 1)
+    assert pool is not None
+    pool.take(provider, provider.doc_to_pixels_command())
+    pool.fill(provider)
+    wait_for_pool(pool, 1)
+    name, p = pool.containers[0].name, pool.containers[0].proc
+
+    # When Dangerzone shuts down, it stops the containers of the pool.
+    mocker.patch.object(shutdown.container_utils, "close_container_monitor")
+    mocker.patch.object(shutdown.container_utils, "list_containers", return_value=[])
+    mocker.patch.object(shutdown.container_utils, "close_podman_api")
+    shutdown.ContainerStopTask().run()
+    assert p.wait(timeout=5) is not None
+    kill_container.assert_called_once_with(name)
+    assert pool.closed
+    assert container._container_pool is None
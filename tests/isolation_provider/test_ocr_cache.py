@@ -0,0 +1,135 @@
+import io
+import os
+import time
+from pathlib import Path
+
+import fitz
+from pytest_mock import MockerFixture
+
+from dangerzone.document import Document
+from dangerzone.isolation_provider.base import PageReader
+from dangerzone.isolation_provider.dummy import Dummy
+from dangerzone.isolation_provider.ocr_cache import OCRCache, get_ocr_cache_dir
+from dangerzone.isolation_provider.pixels_to_pdf import (
+    SafePDFWriter,
+    UntrustedPage,
+    page_digest,
+)
+from dangerzone.settings import Settings
+
+from .test_base import done_future
+
+
+def make_page(fill: bytes = b"A", width: int = 4, height: int = 3) -> UntrustedPage:
+    return UntrustedPage(width, height, fill * (width * height * 3))
+
+
+def make_text_page(ink: int) -> UntrustedPage:
+    """Create a white page with a black pixel, so that it looks like it has text."""
+    pixels = bytearray(b"\xff" * (4 * 3 * 3))
+    pixels[ink * 3 : ink * 3 + 3] = bytes(3)
+    return UntrustedPage(4, 3, bytes(pixels))
+
+
+def page_key(cache: OCRCache, page: UntrustedPage, ocr_lang: str = "eng") -> str:
+    return cache.key(page_digest(page), ocr_lang, str(cache.path))
+
+
+def page_pdf() -> bytes:
+    doc = fitz.open()
+    doc.new_page()
+    return doc.tobytes()
+
+
+def test_ocr_cache_get_put(tmp_path: Path) -> None:
+    cache = OCRCache(tmp_path, max_size=1024)
+    key = page_key(cache, make_page())
+    assert cache.get(key) is None
+    cache.put(key, b"result")
+    assert cache.get(key) == b"result"
+    # Another instance of the cache (e.g., a later conversion) finds the same entry.
+    assert OCRCache(tmp_path, max_size=1024).get(key) == b"result"
+
+
+def test_ocr_cache_key(tmp_path: Path) -> None:
+    cache = OCRCache(tmp_path, max_size=1024)
+    key = page_key(cache, make_page())
+    assert key == page_key(cache, make_page())
+    assert key != page_key(cache, make_page(b"B"))
+    assert key != page_key(cache, make_page(width=3, height=4))
+    assert key != page_key(cache, make_page(), "eng+fra")
+
+    # If the language data change, so does the key.
+    (tmp_path / "eng.traineddata").write_bytes(b"data")
+    assert key != page_key(OCRCache(tmp_path, max_size=1024), make_page())
+
+
+def test_ocr_cache_eviction(tmp_path: Path) -> None:
+    cache = OCRCache(tmp_path, max_size=25)
+    keys = [page_key(cache, make_page(bytes([i]))) for i in range(3)]
+    cache.put(keys[0], 10 * b"0")
+    cache.put(keys[1], 10 * b"1")
+    # Use the first entry, so that the second one is the least recently used.
+    past = time.time() - 60
+    os.utime(cache.entry_path(keys[1]), (past, past))
+    assert cache.get(keys[0]) is not None
+
+    cache.put(keys[2], 10 * b"2")
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+    assert cache.size == 20
+
+    # Entries that are larger than the cache are not stored.
+    cache.put(keys[1], 30 * b"1")
+    assert cache.get(keys[1]) is None
+
+    # Replacing an entry does not count its size twice.
+    cache.put(keys[2], 5 * b"2")
+    assert cache.size == 15
+    assert cache.get(keys[0]) is not None
+
+
+def test_convert_pages_cached(
+    mocker: MockerFixture, sample_pdf: str, tmp_path: Path
+) -> None:
+    Settings().set("ocr_cache_size", 1024 * 1024)
+    provider = Dummy()
+    provider.progress_callback = None
+    ocr_pages = mocker.patch.object(
+        provider,
+        "ocr_pages",
+        side_effect=lambda _, pages, *args: done_future([page_pdf()] * len(pages)),
+    )
+
+    def ocr_count() -> int:
+        return sum(len(call.args[1]) for call in ocr_pages.call_args_list)
+
+    document = Document(sample_pdf)
+
+    def convert(pages: bytes) -> int:
+        path = str(tmp_path / "safe.pdf")
+        reader = PageReader(io.BytesIO(pages), 2)
+        writer = SafePDFWriter(path)
+        with reader:
+            provider.convert_pages(document, "eng", reader, writer)
+        writer.flush()
+        return fitz.open(path).page_count
+
+    pages = b""
+    for page in (make_text_page(0), make_text_page(1)):
+        header = page.width.to_bytes(2, "big") + page.height.to_bytes(2, "big")
+        pages += header + page.pixels
+
+    assert convert(pages) == 2
+    assert ocr_count() == 2
+    assert len(list(get_ocr_cache_dir().glob("*/*.pdf"))) == 2
+
+    # If we convert the document again, we skip OCR entirely.
+    assert convert(pages) == 2
+    assert ocr_count() == 2
+
+    # Unless the cache is disabled.
+    Settings().set("ocr_cache_size", 0)
+    assert convert(pages) == 2
+    assert ocr_count() == 4
@@ -0,0 +1,114 @@
+import concurrent.futures
+import os
+import time
+from typing import Iterator, Optional, Tuple
+
+import pytest
+
+from dangerzone.isolation_provider import ocr_scheduler
+from dangerzone.isolation_provider.ocr_scheduler import (
+    OCRJob,
+    OCRScheduler,
+    get_ocr_scheduler,
+    get_ocr_threads,
+    shutdown_ocr_scheduler,
+)
+
+
+def run_job(duration: float) -> Tuple[float, float]:
+    """Simulate an OCR job, and return the time that it started and ended."""
+    start = time.monotonic()
+    time.sleep(duration)
+    return start, time.monotonic()
+
+
+def get_thread_limit() -> Optional[str]:
+    return os.environ.get("OMP_THREAD_LIMIT")
+
+
+@pytest.fixture
+def scheduler() -> Iterator[OCRScheduler]:
+    scheduler = OCRScheduler(slots=1, threads=1)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_get_ocr_threads(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ocr_scheduler, "get_cpu_count", lambda: 8)
+    assert get_ocr_threads(1) == 8
+    assert get_ocr_threads(3) == 2
+    assert get_ocr_threads(16) == 1
+    assert get_ocr_threads(3, threads=4) == 4
+
+
+def test_thread_limit(scheduler: OCRScheduler) -> None:
+    assert scheduler.submit("doc", get_thread_limit).result() == "1"
+    # The limit applies only to the OCR workers, not to the host process.
+    assert get_thread_limit() is None
+
+
+def test_job_cancelled(scheduler: OCRScheduler) -> None:
+    """A job that the executor drops fails, instead of leaving its caller hanging."""
+    job = OCRJob(concurrent.futures.Future(), run_job, (0,))
+    assert job.future.set_running_or_notify_cancel()
+    inner: concurrent.futures.Future = concurrent.futures.Future()
+    inner.cancel()
+    with scheduler.cond:
+        scheduler.running += 1
+    scheduler._job_done(job, None, inner)
+    with pytest.raises(concurrent.futures.CancelledError):
+        job.future.result(timeout=0)
+    assert scheduler.running == 0
+
+
+def test_fairness(scheduler: OCRScheduler) -> None:
+    # Keep the single slot busy, until both documents have queued their pages.
+    blocker = scheduler.submit("other", run_job, 1)
+    while not blocker.running():
+        time.sleep(0.01)
+
+    futures = {
+        "a1": scheduler.submit("a", run_job, 0),
+        "a2": scheduler.submit("a", run_job, 0),
+        "a3": scheduler.submit("a", run_job, 0),
+        "b1": scheduler.submit("b", run_job, 0),
+        "b2": scheduler.submit("b", run_job, 0),
+    }
+    order = sorted(futures, key=lambda name: futures[name].result())
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_slots() -> None:
+    scheduler = OCRScheduler(slots=2, threads=1)
+    try:
+        futures = [scheduler.submit(f"doc{i}", run_job, 0.3) for i in range(5)]
+        intervals = [future.result() for future in futures]
+    finally:
+        scheduler.shutdown()
+
+    # No more than two jobs run at the same time.
+    for start, _ in intervals:
+        running = sum(1 for s, e in intervals if s <= start < e)
+        assert running <= 2
+
+
+def test_shutdown(scheduler: OCRScheduler) -> None:
+    blocker = scheduler.submit("doc", run_job, 1)
+    while not blocker.running():
+        time.sleep(0.01)
+    queued = scheduler.submit("doc", run_job, 0)
+    scheduler.shutdown()
+    assert queued.cancelled()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("doc", run_job, 0)
+
+
+def test_get_ocr_scheduler() -> None:
+    try:
+        scheduler = get_ocr_scheduler(1, 1)
+        assert get_ocr_scheduler(1, 1) is scheduler
+        # The scheduler is recreated if its slots or threads change.
+        assert get_ocr_scheduler(1, 2) is not scheduler
+        assert scheduler.closed
+    finally:
+        shutdown_ocr_scheduler()
@@ -0,0 +1,104 @@
+import http.server
+import json
+import socketserver
+import threading
+import urllib.parse
+from pathlib import Path
+from typing import Any, Iterator, List
+
+import pytest
+
+from dangerzone.podman import api, errors
+
+
+class PodmanHandler(http.server.BaseHTTPRequestHandler):
+    """Reply to a few libpod endpoints, like the Podman REST API service would."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.connections += 1  # type: ignore [attr-defined]
+
+    def reply(self, status: int, body: Any, content_type: str) -> None:
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self) -> None:
+        self.server.requests.append(f"{self.command} {self.path}")  # type: ignore [attr-defined]
+        url = urllib.parse.urlparse(self.path)
+        endpoint = url.path.removeprefix(f"/{api.API_VERSION}/libpod")
+        if endpoint == "/_ping":
+            self.reply(200, "OK", "text/plain")
+        elif endpoint == "/version":
+            self.reply(200, {"Version": "5.4.2"}, "application/json")
+        elif endpoint == "/images/json":
+            self.reply(200, [{"Digest": "sha256:1234"}], "application/json")
+        elif endpoint == "/containers/json":
+            self.reply(200, [{"Names": ["dangerzone-1"]}], "application/json")
+        elif endpoint == "/containers/dangerzone-1/kill":
+            self.send_response(204)
+            self.end_headers()
+        else:
+            self.reply(404, {"message": "no such container"}, "application/json")
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class PodmanServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    connections = 0
+    requests: List[str]
+
+    def get_request(self):  # type: ignore [no-untyped-def]
+        request, _ = super().get_request()
+        # The HTTP handler expects a client address.
+        return request, ("localhost", 0)
+
+
+@pytest.fixture
+def podman_service(tmp_path: Path) -> Iterator[PodmanServer]:
+    server = PodmanServer(str(tmp_path / "podman.sock"), PodmanHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_api_client(podman_service: PodmanServer) -> None:
+    client = api.APIClient(f"unix://{podman_service.server_address}")
+    assert client.ping()
+    assert client.version() == "5.4.2"
+    assert client.list_images("dangerzone") == [{"Digest": "sha256:1234"}]
+    assert client.list_containers() == [{"Names": ["dangerzone-1"]}]
+    client.kill_container("dangerzone-1")
+    with pytest.raises(errors.NotFound, match="no such container"):
+        client.kill_container("dangerzone-2")
+
+    # The client reuses the same connection for all the requests.
+    assert podman_service.connections == 1
+    query = urllib.parse.urlencode({"filters": '{"reference": ["dangerzone"]}'})
+    assert podman_service.requests[2] == (
+        f"GET /{api.API_VERSION}/libpod/images/json?{query}"
+    )
+    assert podman_service.requests[3].endswith("/containers/json?all=true")
+    client.close()
+
+
+def test_api_client_unavailable(tmp_path: Path) -> None:
+    client = api.APIClient(f"unix://{tmp_path / 'missing.sock'}")
+    assert not client.ping()
+    with pytest.raises(OSError):
+        client.version()
+
+    with pytest.raises(errors.InvalidArgument):
+        api.APIClient("tcp://localhost:8080")
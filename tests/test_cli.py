@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import base64
 import copy
+import json
 import os
 import platform
 import shutil
@@ -344,10 +345,85 @@ class TestCliConversion(TestCliBasic):
         result.assert_failure()
         assert not isinstance(result.exception, UnicodeEncodeError)
 
+    def test_page_workers(self, sample_pdf: str, tmp_path: Path) -> None:
+        """Ensure that compressing pages in a thread pool yields the same document."""
+        outputs = []
+        for workers in ("1", "3"):
+            output_filename = str(tmp_path / f"safe-{workers}.pdf")
+            result = self.run_cli(
+                [
+                    sample_pdf,
+                    "--page-workers",
+                    workers,
+                    "--output-filename",
+                    output_filename,
+                ]
+            )
+            result.assert_success()
+            outputs.append(fitz.open(output_filename))
+
+        assert len(outputs[0]) == len(outputs[1])
+        for page, other_page in zip(*outputs):
+            assert page.get_pixmap().samples == other_page.get_pixmap().samples
+
+    def test_invalid_page_workers(self, sample_pdf: str) -> None:
+        result = self.run_cli([sample_pdf, "--page-workers", "0"])
+        result.assert_failure()
+
+    def test_invalid_ocr_slots(self, sample_pdf: str) -> None:
+        result = self.run_cli([sample_pdf, "--ocr-slots", "0"])
+        result.assert_failure()
+
+    def test_pages(self, sample_pdf: str, tmp_path: Path) -> None:
+        output_filename = str(tmp_path / "safe.pdf")
+        result = self.run_cli(
+            [sample_pdf, "--pages", "2", "--output-filename", output_filename]
+        )
+        result.assert_success()
+        assert len(fitz.open(output_filename)) == 1
+
+    def test_pages_out_of_range(self, sample_pdf: str) -> None:
+        result = self.run_cli([sample_pdf, "--pages", "100-"])
+        result.assert_failure()
+
+    @pytest.mark.parametrize("pages", ["", "0", "3-1", "-2", "1,a", "1-2-3"])
+    def test_invalid_pages(self, pages: str, sample_pdf: str) -> None:
+        result = self.run_cli([sample_pdf, "--pages", pages])
+        result.assert_failure(exit_code=2, message="Invalid value for '--pages'")
+
+    def test_estimate(self, sample_pdf: str, tmp_path: Path) -> None:
+        doc_dir = tmp_path / "docs"
+        doc_dir.mkdir()
+        doc_path = str(doc_dir / "sample.pdf")
+        shutil.copyfile(sample_pdf, doc_path)
+        result = self.run_cli([doc_path, "--estimate"])
+        result.assert_success()
+        [estimate] = json.loads(result.stdout)
+        assert estimate["filename"] == doc_path
+        assert estimate["page_count"] > 0
+        assert "error" not in estimate
+        # Estimating a document should not convert it.
+        assert os.listdir(doc_dir) == ["sample.pdf"]
+
     def test_lang_eng(self, sample_pdf: str) -> None:
         result = self.run_cli([sample_pdf, "--ocr-lang", "eng"])
         result.assert_success()
 
+    def test_ocr_tier_not_installed(
+        self, mocker: MockerFixture, sample_pdf: str
+    ) -> None:
+        mocker.patch(
+            "dangerzone.util.get_tier_tessdata_dir",
+            side_effect=RuntimeError("Not installed"),
+        )
+        result = self.run_cli([sample_pdf, "--ocr-lang", "eng", "--ocr-tier", "best"])
+        result.assert_failure()
+        assert "The 'best' OCR tier does not have the language data" in result.stdout
+
+    def test_invalid_ocr_tier(self, sample_pdf: str) -> None:
+        result = self.run_cli([sample_pdf, "--ocr-lang", "eng", "--ocr-tier", "slow"])
+        result.assert_failure()
+
     @pytest.mark.parametrize(
         "filename,",
         [
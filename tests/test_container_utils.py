@@ -1,5 +1,8 @@
+import json
 import pathlib
 import subprocess
+import sys
+import time
 from typing import Any
 from unittest.mock import MagicMock
 
@@ -7,6 +10,7 @@ import pytest
 from pytest_mock import MockerFixture
 
 from dangerzone import container_utils, settings
+from dangerzone.podman import errors
 
 
 def test_get_podman_path(mocker: MockerFixture) -> None:
@@ -168,3 +172,210 @@ def test_kill_container_exception(mocker: MockerFixture, caplog: Any) -> None:
         "Unexpected error occurred while killing container 'test-container'"
         in caplog.text
     )
+
+
+def test_get_launch_profile(mocker: MockerFixture) -> None:
+    """Test that we query Podman once per session, until the image changes."""
+    runtime_version = mocker.patch(
+        "dangerzone.container_utils.get_runtime_version", return_value=(5, 0)
+    )
+    image_digest = mocker.patch(
+        "dangerzone.container_utils.get_local_image_digest", return_value="1234"
+    )
+    mocker.patch("platform.system", return_value="Linux")
+
+    profile = container_utils.get_launch_profile()
+    assert profile.runtime_version == (5, 0)
+    assert profile.seccomp_path.name == "seccomp.gvisor.json"
+    assert profile.image_reference == (
+        f"{container_utils.expected_image_name()}@sha256:1234"
+    )
+    assert container_utils.get_launch_profile() is profile
+    assert runtime_version.call_count == 1
+    assert image_digest.call_count == 1
+
+    # Once a new image is installed, the profile is built again.
+    image_digest.return_value = "5678"
+    container_utils.clear_launch_profile()
+    assert container_utils.get_launch_profile().image_digest == "5678"
+    assert runtime_version.call_count == 2
+
+
+def test_container_monitor(mocker: MockerFixture, caplog: Any) -> None:
+    """Test that we track the removal of containers via `podman events`."""
+    docker_actor = {"ID": "1234", "Attributes": {"name": "dangerzone-doc-to-pixels-6"}}
+    events = [
+        {"Name": "dangerzone-doc-to-pixels-1", "Status": "died", "Type": "container"},
+        {"Name": "dangerzone-doc-to-pixels-1", "Status": "remove", "Type": "container"},
+        {"Name": "other-container", "Status": "remove", "Type": "container"},
+        # Docker reports events differently.
+        {"status": "die", "Type": "container", "Action": "die", "Actor": docker_actor},
+        {
+            "status": "destroy",
+            "Type": "container",
+            "Action": "destroy",
+            "Actor": docker_actor,
+        },
+    ]
+    script = "\n".join(f"print({json.dumps(json.dumps(e))})" for e in events)
+    script += "\nprint('not json', flush=True)\nimport time; time.sleep(60)"
+    mock_podman = mocker.patch("dangerzone.container_utils.init_podman_command")
+    mock_podman.return_value.run.return_value = subprocess.Popen(
+        [sys.executable, "-c", script], stdout=subprocess.PIPE
+    )
+
+    monitor = container_utils.get_container_monitor()
+    assert monitor is not None
+    assert container_utils.get_container_monitor() is monitor
+    cmd = mock_podman.return_value.run.call_args.args[0]
+    assert cmd[:3] == ["events", "--since", cmd[2]]
+    for _ in range(100):
+        with monitor.cond:
+            if len(monitor.removed) == 2:
+                break
+        time.sleep(0.05)
+
+    # Containers that have been removed are not stragglers, even if we learn about
+    # their removal before we expect it.
+    assert sorted(monitor.removed) == [
+        "dangerzone-doc-to-pixels-1",
+        "dangerzone-doc-to-pixels-6",
+    ]
+    monitor.expect_removed("dangerzone-doc-to-pixels-1")
+    monitor.expect_removed("dangerzone-doc-to-pixels-2")
+    monitor.expect_removed("dangerzone-doc-to-pixels-3")
+    assert monitor.get_stragglers() == []
+    assert monitor.report_stragglers(grace=0) == [
+        "dangerzone-doc-to-pixels-2",
+        "dangerzone-doc-to-pixels-3",
+    ]
+    assert (
+        "Containers 'dangerzone-doc-to-pixels-2', 'dangerzone-doc-to-pixels-3' did"
+        " not stop gracefully" in caplog.text
+    )
+    # Each straggler is reported only once.
+    assert monitor.report_stragglers(grace=0) == []
+
+    # We forget the removals that we don't expect within the grace period, so that
+    # the containers of other Dangerzone instances don't pile up.
+    assert list(monitor.removed) == ["dangerzone-doc-to-pixels-6"]
+    monitor.removed["dangerzone-doc-to-pixels-6"] -= container_utils.TIMEOUT_REMOVE
+    assert monitor.get_stragglers() == []
+    assert monitor.removed == {}
+
+    # If we can't receive events anymore, we don't subscribe again, and the callers
+    # list the containers themselves. We still report the containers that the
+    # monitor was waiting for, if they are still around.
+    monitor.expect_removed("dangerzone-doc-to-pixels-4")
+    monitor.expect_removed("dangerzone-doc-to-pixels-5")
+    monitor.proc.kill()
+    monitor.proc.wait()
+    assert container_utils.get_container_monitor() is None
+    assert container_utils.get_container_monitor() is None
+    assert mock_podman.return_value.run.call_count == 1
+    mocker.patch(
+        "dangerzone.container_utils.list_containers",
+        return_value=["dangerzone-doc-to-pixels-5"],
+    )
+    container_utils.close_container_monitor()
+    assert (
+        "Containers 'dangerzone-doc-to-pixels-5' did not stop gracefully" in caplog.text
+    )
+    assert "'dangerzone-doc-to-pixels-4'" not in caplog.text
+
+
+def test_close_container_monitor(mocker: MockerFixture, caplog: Any) -> None:
+    """Test that we wait for the last containers to be removed, before we report."""
+    event = {"Name": "dangerzone-doc-to-pixels-1", "Status": "remove"}
+    script = (
+        f"import time; time.sleep(0.5); print({json.dumps(json.dumps(event))},"
+        " flush=True); time.sleep(60)"
+    )
+    mock_podman = mocker.patch("dangerzone.container_utils.init_podman_command")
+    mock_podman.return_value.run.return_value = subprocess.Popen(
+        [sys.executable, "-c", script], stdout=subprocess.PIPE
+    )
+
+    monitor = container_utils.get_container_monitor()
+    assert monitor is not None
+    monitor.expect_removed("dangerzone-doc-to-pixels-1")
+    start = time.monotonic()
+    container_utils.close_container_monitor()
+    assert time.monotonic() - start < container_utils.TIMEOUT_REMOVE
+    assert monitor.expected == {}
+    assert "did not stop gracefully" not in caplog.text
+
+
+def test_container_monitor_unavailable(mocker: MockerFixture, caplog: Any) -> None:
+    mock_podman = mocker.patch("dangerzone.container_utils.init_podman_command")
+    mock_podman.return_value.run.side_effect = FileNotFoundError("podman")
+    assert container_utils.get_container_monitor() is None
+    assert "Could not subscribe to container events" in caplog.text
+    # We don't try again for the rest of the session.
+    assert container_utils.get_container_monitor() is None
+    assert mock_podman.return_value.run.call_count == 1
+
+
+def test_podman_api(mocker: MockerFixture, caplog: Any) -> None:
+    """Test that we query the Podman REST API, and fall back to the Podman CLI."""
+    settings.Settings().set("podman_api", True)
+    mocker.patch("platform.system", return_value="Linux")
+    mock_podman = mocker.patch("dangerzone.container_utils.init_podman_command")
+    mock_podman.return_value.proc_service = None
+    client = MagicMock()
+    mocker.patch("dangerzone.container_utils.api.APIClient", return_value=client)
+
+    client.list_containers.return_value = [
+        {"Names": ["dangerzone-container1"]},
+        {"Names": ["other-container"]},
+    ]
+    assert container_utils.list_containers() == ["dangerzone-container1"]
+    mock_podman.return_value.start_service.assert_called_once()
+    uri = mock_podman.return_value.start_service.call_args.kwargs["uri"]
+    assert uri == container_utils.get_podman_api_uri()
+
+    client.list_images.return_value = [{"Digest": "sha256:1234"}] * 2
+    assert container_utils.get_local_image_digest("image") == "1234"
+    client.list_images.assert_called_once_with("image")
+
+    # Killing a container that has already stopped is not an error.
+    client.kill_container.side_effect = errors.APIError("not running")
+    container_utils.kill_container("dangerzone-container1")
+    mock_podman.return_value.run.assert_not_called()
+
+    # If the REST API fails, we use the Podman CLI instead.
+    client.version.side_effect = ConnectionResetError("reset")
+    mock_podman.return_value.run.return_value = "5.4.2"
+    assert container_utils.get_runtime_version() == (5, 4)
+    mock_podman.return_value.run.assert_called_once_with(
+        ["version", "-f", "{{.Client.Version}}"]
+    )
+    assert "falling back to the Podman CLI" in caplog.text
+
+    # We start the service once per session, and stop it on shutdown.
+    assert mock_podman.return_value.start_service.call_count == 1
+    mock_podman.return_value.proc_service = MagicMock()
+    container_utils.close_podman_api()
+    mock_podman.return_value.stop_service.assert_called_once()
+    client.close.assert_called_once()
+
+
+def test_podman_api_unavailable(mocker: MockerFixture, caplog: Any) -> None:
+    mocker.patch("platform.system", return_value="Linux")
+    mock_podman = mocker.patch("dangerzone.container_utils.init_podman_command")
+    mock_podman.return_value.run.return_value = "dangerzone-container1"
+
+    # The REST API is disabled by default.
+    assert container_utils.get_podman_api() is None
+    assert container_utils.list_containers() == ["dangerzone-container1"]
+    mock_podman.return_value.start_service.assert_not_called()
+
+    # If the service can't start, we don't try again in this session.
+    settings.Settings().set("podman_api", True)
+    mock_podman.return_value.wait_for_service.side_effect = errors.ServiceTimeout(10)
+    assert container_utils.get_podman_api() is None
+    assert container_utils.get_podman_api() is None
+    assert mock_podman.return_value.start_service.call_count == 1
+    mock_podman.return_value.stop_service.assert_called_once()
+    assert "Could not start the Podman REST API service" in caplog.text
+    assert container_utils.list_containers() == ["dangerzone-container1"]
@@ -1,4 +1,5 @@
 import json
+import shutil
 import unittest
 from operator import attrgetter
 from pathlib import Path
@@ -315,3 +316,51 @@ def test_verify_signatures_empty_list() -> None:
 
 def test_verify_signatures_not_0() -> None:
     pass
+
+
+def test_load_and_verify_signatures_cached(mocker: Any, tmp_path: Path) -> None:
+    signatures_file = next(VALID_SIGNATURES_PATH.glob("**/*.json"))
+    image_digest = signatures_file.stem
+    verify = mocker.patch("dangerzone.updater.signatures.verify_signatures")
+
+    load_and_verify_signatures(
+        image_digest, TEST_PUBKEY_PATH, signatures_path=VALID_SIGNATURES_PATH
+    )
+    assert verify.call_count == 1
+
+    # The same signatures are verified only once per session.
+    load_and_verify_signatures(
+        image_digest, TEST_PUBKEY_PATH, signatures_path=VALID_SIGNATURES_PATH
+    )
+    assert verify.call_count == 1
+    mocker.patch("dangerzone.updater.signatures._verified_signatures", set())
+    load_and_verify_signatures(
+        image_digest, TEST_PUBKEY_PATH, signatures_path=VALID_SIGNATURES_PATH
+    )
+    assert verify.call_count == 2
+
+    # If the signatures change, they are verified again.
+    signatures_path = tmp_path / "signatures"
+    shutil.copytree(VALID_SIGNATURES_PATH, signatures_path)
+    copied_file = signatures_path / signatures_file.relative_to(VALID_SIGNATURES_PATH)
+    copied_file.write_text(json.dumps(json.loads(copied_file.read_text()), indent=2))
+    load_and_verify_signatures(
+        image_digest, TEST_PUBKEY_PATH, signatures_path=signatures_path
+    )
+    assert verify.call_count == 3
+
+    # Storing new signatures clears the cache.
+    mocker.patch("dangerzone.updater.signatures.SIGNATURES_PATH", tmp_path)
+    signatures = json.loads(signatures_file.read_text())
+    store_signatures(signatures, image_digest, TEST_PUBKEY_PATH, update_logindex=False)
+    load_and_verify_signatures(
+        image_digest, TEST_PUBKEY_PATH, signatures_path=VALID_SIGNATURES_PATH
+    )
+    assert verify.call_count == 4
+
+    # Verification failures are not cached.
+    verify.side_effect = errors.SignatureVerificationError("invalid")
+    with pytest.raises(errors.SignatureVerificationError):
+        load_and_verify_signatures(
+            image_digest, TEST_PUBKEY_PATH, signatures_path=signatures_path
+        )
@@ -33,3 +33,28 @@ def test_replace_control_chars(uncommon_text: str, sanitized_text: str) -> None:
         util.replace_control_chars("multi-line\ntext", keep_newlines=True)
         == "multi-line\ntext"
     )
+
+
+def test_get_tessdata_dir_tiers(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(util.sys, "dangerzone_dev", True, raising=False)
+    monkeypatch.setattr(util, "get_resource_path", lambda name: tmp_path / name)
+    (tmp_path / "tessdata").mkdir()
+
+    # The language data that we bundle are the ones of the fast tier.
+    assert util.get_tessdata_dir() == tmp_path / "tessdata"
+    assert util.get_tessdata_dir("fast") == tmp_path / "tessdata"
+    (tmp_path / "tessdata_fast").mkdir()
+    assert util.get_tessdata_dir("fast") == tmp_path / "tessdata_fast"
+
+    with pytest.raises(ValueError):
+        util.get_tessdata_dir("slow")
+
+
+def test_get_ocr_engine_mode() -> None:
+    assert util.get_ocr_engine_mode("default") == util.OCR_ENGINE_DEFAULT
+    assert util.get_ocr_engine_mode("fast") == util.OCR_ENGINE_LSTM_ONLY
+    assert util.get_ocr_engine_mode("best") == util.OCR_ENGINE_LSTM_ONLY
+    with pytest.raises(ValueError):
+        util.get_ocr_engine_mode("slow")